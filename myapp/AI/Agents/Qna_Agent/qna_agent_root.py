@@ -20,14 +20,10 @@ def tavily_search(query:str):
 key=os.getenv('GEMINI_API_KEY')
 llm = LLM(model= "gemini/gemini-2.0-flash", api_key=key)
 
-chat_memory = []
-
 @tool
-def qna_agent(user_input:str):
-    "Tool that wraps a Crew to answer user queries."
-    
+def qna_agent(user_input:str, context:str=""):
+    "Tool that wraps a Crew to answer user queries. Pass the relevant conversation so far as context, if any."
     
-    context = "\n".join([f"User: {q}\n  Assistant: {a}" for q, a in chat_memory[-5:]])   
     agent1 = Agent(llm=llm,
         tools=[tavily_search,], #type:ignore
         backstory="""You are a helpful assistant who can answer questions using 
@@ -55,7 +51,6 @@ def qna_agent(user_input:str):
                 )
     
     response=crew.kickoff()
-    chat_memory.append((user_input,response))
     return response
 
 
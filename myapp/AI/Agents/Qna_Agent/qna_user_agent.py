@@ -19,14 +19,12 @@ def tavily_search(query: str):
 key = os.getenv('GEMINI_API_KEY')
 llm = LLM(model="gemini/gemini-2.0-flash", api_key=key)
 
-# ✅ Conversation memory
-chat_memory = []
 
-
-def qna_agent(user_input: str):
-    """Tool that wraps a Crew to answer user queries."""
-
-    context = "\n".join([f"User: {q}\nAssistant: {a}" for q, a in chat_memory[-5:]])
+def qna_agent(user_input: str, context: str = ""):
+    """
+    Tool that wraps a Crew to answer user queries.
+    `context` is the conversation so far, assembled by the caller.
+    """
 
     agent1 = Agent(
         llm=llm,
@@ -61,5 +59,4 @@ def qna_agent(user_input: str):
     )
 
     response = crew.kickoff()
-    chat_memory.append((user_input, response))
     return response
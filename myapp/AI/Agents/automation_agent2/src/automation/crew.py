@@ -4,6 +4,7 @@ from crewai.project import CrewBase, agent, crew, task
 from pydantic import BaseModel, Field
 from typing import List, Dict
 from myapp.AI.Agents.automation_agent2.src.automation.tools.email import send_email_smtp  
+from myapp.AI.plan_cache import PlanCachingCrew
 import re
 import os
 
@@ -200,7 +201,8 @@ class AutomationAgent():
               self.write_email_body()
              ]
 
-        return  Crew(
+        return  PlanCachingCrew(
+            name="automation",
             agents=self.agents,           #type: ignore
             tasks=selected_tasks,
             process=Process.sequential,
@@ -1,5 +1,6 @@
 import warnings
 from myapp.AI.Agents.data_analysis.data_analysis.crew import AnalysisAgent
+from myapp.AI.Agents.data_analysis.data_analysis.tools.workspace import analysis_inputs
 
 warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
 
@@ -7,12 +8,9 @@ warnings.filterwarnings("ignore", category=SyntaxWarning, module="pysbd")
 def run_data_analysis(query:str ,file_path : str):
     """Run the data analysis crew. Data analysis tool gives insights and visualisation of the attached dataset """
         
-    inputs = {
-        "query": query,
-        "file_path": file_path,
-        # "timestamp": timestamp,
-    }
     try:
+        # Each dataset gets its own workspace, passed on to every tool through the inputs
+        inputs = analysis_inputs(query, file_path)
         response = AnalysisAgent().crew().kickoff(inputs=inputs)
         return response    
     except Exception as e:
@@ -1,13 +1,21 @@
 import re
 import pandas as pd
-import numpy as np
 from crewai.tools import tool
 from typing import Any, Dict
 import json
 import os
 from crewai import LLM
 from dotenv import load_dotenv
+from myapp.AI.Agents.data_analysis.data_analysis.tools.artifacts import (
+    ARTIFACT_MIN_ROWS,
+    ARTIFACT_PREVIEW_ROWS,
+    needs_artifact,
+    save_artifact,
+)
 from myapp.AI.Agents.data_analysis.data_analysis.tools.classifier import get_data_path_from_query
+from myapp.AI.Agents.data_analysis.data_analysis.tools.code_cache import run_with_code_cache
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_profile import dataset_profile
+from myapp.AI.Agents.data_analysis.data_analysis.tools.sandbox import preload_dataset, run_generated_code
 
 load_dotenv()
 
@@ -29,15 +37,15 @@ DANGEROUS_PATTERNS = [
 ]
 
 @tool("generate_and_execute_analysis")
-def generate_and_execute_analysis(user_query: str) -> Dict[str, Any]:
+def generate_and_execute_analysis(user_query: str, workspace: str) -> Dict[str, Any]:
     """
     Generate analysis code, execute it safely, and return results with code used.
-    Selects dataset path based on user query, uses preprocessed or raw data accordingly.
+    Selects dataset path in the given workspace based on user query, uses preprocessed or raw data accordingly.
     """
 
     try:
         # Dynamically resolve dataset path
-        data_path = get_data_path_from_query(user_query)
+        data_path = get_data_path_from_query(user_query, workspace)
 
         if not os.path.exists(data_path):
             return {
@@ -48,11 +56,11 @@ def generate_and_execute_analysis(user_query: str) -> Dict[str, Any]:
                 "result": ""
             }
 
-        # Load the data
-        df = pd.read_csv(data_path)
+        # Sandbox workers load the data while the code is being generated
+        preload_dataset(data_path)
 
         # Build enhanced schema context
-        schema = _build_enhanced_schema(df, data_path)
+        schema = _build_enhanced_schema(dataset_profile(data_path), data_path)
 
         # Validate LLM availability
         if llm is None:
@@ -64,19 +72,28 @@ def generate_and_execute_analysis(user_query: str) -> Dict[str, Any]:
                 "result": ""
             }
 
-        # Generate analysis code with enhanced prompt
-        code = _generate_analysis_code(user_query, schema)
-
-        # Execute the generated code safely
-        execution_result = _execute_code_safely(
-            code=code,
-            df=df,
-            data_source=data_path,
-            user_query=user_query
+        # Generate analysis code with enhanced prompt and execute it safely;
+        # code that already answered this query on the same schema is reused
+        execution_result = run_with_code_cache(
+            "analysis",
+            user_query,
+            schema,
+            data_path,
+            getattr(llm, "model", ""),
+            generate=lambda: {"code": _generate_analysis_code(user_query, schema, data_path)},
+            execute=lambda entry: _execute_code_safely(
+                code=entry["code"],
+                data_shape=schema["shape"],
+                data_source=data_path,
+                user_query=user_query
+            ),
         )
+        code = execution_result["code_used"]
 
-        # Generate summary from query, actual result data, and code
-        summary = generate_summary(user_query, execution_result.get("result", ""), code)
+        # Generate summary from query, the result preview, and code
+        summary = generate_summary(
+            user_query, execution_result.get("result", ""), code, artifact=execution_result.get("artifact")
+        )
         execution_result["summary"] = summary
 
         return execution_result
@@ -90,42 +107,38 @@ def generate_and_execute_analysis(user_query: str) -> Dict[str, Any]:
             "result": ""
         }
 
-def _build_enhanced_schema(df: pd.DataFrame, data_path: str) -> dict:
+def _build_enhanced_schema(profile: dict, data_path: str) -> dict:
     """Build comprehensive schema information for better code generation."""
     
-    # Basic schema
+    # Basic schema, from the profile stored with the dataset (no pass over the data)
     schema = {
-        "shape": list(df.shape),
-        "columns": list(df.columns),
-        "dtypes": df.dtypes.apply(str).to_dict(),
-        "sample_data": df.head(3).to_dict(),
+        "shape": profile["shape"],
+        "columns": profile["columns"],
+        "dtypes": profile["dtypes"],
+        "sample_data": profile["sample_data"],
         "is_decoded": "decoded" in data_path.lower()
     }
     
-    # Identify column types for better code generation
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
     datetime_cols = []
     
     # Detect potential datetime columns
-    for col in df.columns:
+    for col in profile["columns"]:
         if any(keyword in col.lower() for keyword in ['date', 'time', 'created', 'updated', 'timestamp']):
             datetime_cols.append(col)
     
     schema.update({
-        "numeric_columns": numeric_cols,
-        "categorical_columns": categorical_cols,
+        "numeric_columns": profile["numeric_columns"],
+        "categorical_columns": profile["categorical_columns"],
         "potential_datetime_columns": datetime_cols,
-        "null_counts": df.isnull().sum().to_dict(),
-        "unique_counts": {col: df[col].nunique() for col in df.columns if df[col].nunique() < 50}
+        "null_counts": profile["null_counts"],
+        "unique_counts": {col: count for col, count in profile["unique_counts"].items() if count < 50}
     })
     
     return schema
 
-def _generate_analysis_code(query: str, schema: dict) -> str:
+def _generate_analysis_code(query: str, schema: dict, dataset_path: str) -> str:
     """Generate pandas analysis code using CrewAI LLM with enhanced prompt."""
     
-    dataset_path = get_data_path_from_query(query)
     is_decoded = schema.get("is_decoded", False)
     prompt = f"""
         You are an expert Python data analyst with deep analytical thinking skills. 
@@ -220,12 +233,12 @@ def _generate_analysis_code(query: str, schema: dict) -> str:
 
 def _execute_code_safely(
     code: str,
-    df: pd.DataFrame,
+    data_shape: list,
     *,
     data_source: str = "",
     user_query: str = ""
 ) -> dict:
-    """Execute analysis code with safety restrictions."""
+    """Execute analysis code with safety restrictions, in a resource-limited sandbox worker."""
 
     # Security check
     if any(pattern in code.lower() for pattern in DANGEROUS_PATTERNS):
@@ -235,61 +248,35 @@ def _execute_code_safely(
             "query": user_query,
             "code_used": code,
             "result": "Unsafe code detected - execution blocked",
-            "data_shape": list(df.shape),
+            "data_shape": data_shape,
             "data_source": os.path.basename(data_source)
         }
 
     try:
-        safe_builtins = {
-            'print': print, 'len': len, 'range': range,
-            'min': min, 'max': max, 'sum': sum,
-            'sorted': sorted, 'abs': abs, 'round': round,
-            'str': str, 'int': int, 'float': float, 'list': list
-        }
-
-        context = {
-            'df': df.copy(),
-            'pd': pd,
-            'np': np,
-            **safe_builtins
-        }
-
-        # Execute code
-        if '\n' in code or '=' in code:
-            exec(code, context)
-            # Look for result variables in order of preference
-            for var_name in ['result', 'analysis_result', 'output', 'venue_stats', 'final_result']:
-                if var_name in context:
-                    result = context[var_name]
-                    break
-            else:
-                # If no explicit result variable, check if df was modified
-                if 'df' in context and not context['df'].equals(df):
-                    result = context['df']
-                else:
-                    # Look for any DataFrame/Series variables created
-                    for var_name, var_value in context.items():
-                        if var_name not in ['df', 'pd', 'np'] and not var_name.startswith('__'):
-                            if isinstance(var_value, (pd.DataFrame, pd.Series)) and len(var_value) > 0:
-                                result = var_value
-                                break
-                    else:
-                        result = "Code executed successfully - no output variable found"
-        else:
-            result = eval(code, context)
+        # Runs on the worker's copy of the dataset; the result comes back as a table
+        outcome = run_generated_code("analysis", code, data_source)
 
         # Format result
-        result_display = _format_analysis_result(result)
+        result_display = _format_analysis_result(outcome["result"])
 
-        return {
+        response = {
             "status": "success",
             "query": user_query,
             "code_used": code,
             "result": result_display,
-            "data_shape": list(df.shape),
+            "data_shape": outcome["data_shape"],
             "data_source": os.path.basename(data_source)
         }
 
+        # The display only has the first rows; the full table is kept as a paginated artifact
+        if needs_artifact(outcome["result"]):
+            try:
+                response["artifact"] = save_artifact(outcome["result"], user_query)
+            except Exception as e:
+                print(f"⚠️ Could not save the full result as an artifact: {e}")
+
+        return response
+
     except Exception as e:
         print(f"Code execution failed: {e}")
         return {
@@ -297,20 +284,20 @@ def _execute_code_safely(
             "query": user_query,
             "code_used": code,
             "result": f"Execution Error: {str(e)}",
-            "data_shape": list(df.shape),
+            "data_shape": data_shape,
             "data_source": os.path.basename(data_source)
         }
 
 def _format_analysis_result(result: Any) -> str:
     """Format analysis result for user display."""
     if isinstance(result, pd.DataFrame):
-        if len(result) > 20:
-            return f"DataFrame with {len(result)} rows, {len(result.columns)} columns:\n{result.head(10).to_string()}\n... (showing first 10 rows)"
+        if len(result) > ARTIFACT_MIN_ROWS:
+            return f"DataFrame with {len(result)} rows, {len(result.columns)} columns:\n{result.head(ARTIFACT_PREVIEW_ROWS).to_string()}\n... (showing first {ARTIFACT_PREVIEW_ROWS} rows)"
         else:
             return result.to_string()
     elif isinstance(result, pd.Series):
-        if len(result) > 20:
-            return f"Series with {len(result)} values:\n{result.head(10).to_string()}\n... (showing first 10 values)"
+        if len(result) > ARTIFACT_MIN_ROWS:
+            return f"Series with {len(result)} values:\n{result.head(ARTIFACT_PREVIEW_ROWS).to_string()}\n... (showing first {ARTIFACT_PREVIEW_ROWS} values)"
         else:
             return result.to_string()
     elif isinstance(result, (int, float)):
@@ -318,8 +305,8 @@ def _format_analysis_result(result: Any) -> str:
     else:
         return str(result)
 
-def generate_summary(query: str, result_data: str, code: str = "") -> str:
-    """Generate result summary."""
+def generate_summary(query: str, result_data: str, code: str = "", artifact: dict = None) -> str:
+    """Generate result summary from the result preview (the full table of a large result is in `artifact`)."""
     
     if llm is None:
         return f"Analysis completed for: {query}. LLM not available for summary generation."
@@ -338,6 +325,7 @@ User Query: {query}
 
 Analysis Results:
 {str(result_data)[:1500]}
+{f"(Preview only: the full result has {artifact['rows']} rows and is available to the user as a table.)" if artifact else ""}
 
 Provide a concise 2-4 sentence summary with key insights:
 """
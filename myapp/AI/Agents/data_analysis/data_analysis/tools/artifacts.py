@@ -0,0 +1,147 @@
+"""
+Result artifacts for large analysis outputs.
+
+`_format_analysis_result` only shows the first rows of a big DataFrame or
+Series, and the full table used to be thrown away. Results longer than
+ARTIFACT_MIN_ROWS are now saved as an Arrow IPC file (dataset_store's
+format, so dtypes survive) under ARTIFACT_ROOT/<artifact id>.arrow, with
+the index turned into ordinary columns. The tool response carries the id
+and size next to the usual text preview of the first ARTIFACT_PREVIEW_ROWS
+rows; only that preview reaches the summary prompt and the crew. Clients
+page through the full result with GET /api/analysis-artifacts/<id>/
+?page=&page_size=, which slices the memory-mapped file instead of loading it.
+
+An artifact belongs to the user whose request produced it: the views run
+the agents inside `artifacts_owned_by(user id)`, the owner is stored with
+the artifact, and anyone else gets "not found". Artifacts written without a
+known owner are never served. They expire ARTIFACT_TTL seconds after they
+were written and are deleted by `manage.py analysis_artifacts purge`.
+"""
+import contextvars
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_store import read_metadata, read_table, write_dataset
+
+ARTIFACT_ROOT = os.getenv("ARTIFACT_ROOT", os.path.join("data", "artifacts"))
+ARTIFACT_TTL = int(os.getenv("ARTIFACT_TTL", 7 * 24 * 3600))
+ARTIFACT_MIN_ROWS = int(os.getenv("ARTIFACT_MIN_ROWS", "20"))
+ARTIFACT_PREVIEW_ROWS = int(os.getenv("ARTIFACT_PREVIEW_ROWS", "10"))
+ARTIFACT_PAGE_SIZE = 100
+ARTIFACT_MAX_PAGE_SIZE = int(os.getenv("ARTIFACT_MAX_PAGE_SIZE", "1000"))
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Id of the user the running agents work for
+_owner = contextvars.ContextVar("artifact_owner", default=None)
+
+
+class ArtifactNotFound(Exception):
+    """No artifact with this id (malformed, expired or never written)."""
+
+
+@contextmanager
+def artifacts_owned_by(user_id):
+    """Artifacts saved inside this block belong to `user_id`."""
+    token = _owner.set(user_id)
+    try:
+        yield
+    finally:
+        _owner.reset(token)
+
+
+def artifact_path(artifact_id: str) -> str:
+    if not _ID_RE.match(artifact_id or ""):
+        raise ArtifactNotFound(artifact_id)
+    return os.path.join(ARTIFACT_ROOT, f"{artifact_id}.arrow")
+
+
+def needs_artifact(result) -> bool:
+    return isinstance(result, (pd.DataFrame, pd.Series)) and len(result) > ARTIFACT_MIN_ROWS
+
+
+def _as_table(result) -> pd.DataFrame:
+    """The result as a flat frame with string column labels; a meaningful index becomes columns."""
+    frame = result.to_frame() if isinstance(result, pd.Series) else result
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame = frame.set_axis([" ".join(str(level) for level in col if str(level)) for col in frame.columns], axis=1)
+    if any(name is not None for name in frame.index.names) or not pd.api.types.is_integer_dtype(frame.index):
+        frame = frame.reset_index()
+    elif not isinstance(frame.index, pd.RangeIndex):
+        # Row positions left over from filtering or sorting
+        frame = frame.reset_index(drop=True)
+    return frame.set_axis([str(col) for col in frame.columns], axis=1)
+
+
+def _records(frame: pd.DataFrame) -> list:
+    """Rows as lists of JSON values (ISO dates, null for NaN)."""
+    return json.loads(frame.to_json(orient="values", date_format="iso"))
+
+
+def save_artifact(result, query: str = "") -> dict:
+    """Write `result` to a new artifact and return its descriptor (id, rows, columns)."""
+    frame = _as_table(result)
+    artifact_id = uuid.uuid4().hex
+    os.makedirs(ARTIFACT_ROOT, exist_ok=True)
+    write_dataset(frame, artifact_path(artifact_id), metadata={
+        "query": query,
+        "owner": _owner.get(),
+        "kind": "series" if isinstance(result, pd.Series) else "dataframe",
+        "created_at": time.time(),
+    })
+    return {
+        "id": artifact_id,
+        "rows": len(frame),
+        "columns": list(frame.columns),
+    }
+
+
+def read_artifact_page(artifact_id: str, owner, page: int = 1, page_size: int = ARTIFACT_PAGE_SIZE) -> dict:
+    """One page of `owner`'s artifact; `page` counts from 1. Other users' and expired artifacts are not found."""
+    path = artifact_path(artifact_id)
+    try:
+        metadata = read_metadata(path)
+        created_at = metadata.get("created_at") or os.path.getmtime(path)
+        if owner is None or metadata.get("owner") != owner or created_at + ARTIFACT_TTL < time.time():
+            raise ArtifactNotFound(artifact_id)
+        table = read_table(path)
+    except FileNotFoundError:
+        raise ArtifactNotFound(artifact_id)
+
+    page_size = max(1, min(page_size, ARTIFACT_MAX_PAGE_SIZE))
+    total_pages = max(1, -(-table.num_rows // page_size))
+    page = max(1, page)
+    rows = table.slice((page - 1) * page_size, page_size).to_pandas()
+    return {
+        "artifact_id": artifact_id,
+        "query": metadata.get("query", ""),
+        "columns": table.column_names,
+        "dtypes": {col: str(dtype) for col, dtype in rows.dtypes.items()},
+        "total_rows": table.num_rows,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": total_pages,
+        "rows": _records(rows),
+    }
+
+
+def purge_artifacts(max_age: float = ARTIFACT_TTL) -> int:
+    """Remove artifacts older than `max_age` seconds (all of them for 0). Returns the number removed."""
+    if not os.path.isdir(ARTIFACT_ROOT):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(ARTIFACT_ROOT):
+        if entry.name.endswith(".arrow") and entry.stat().st_mtime <= cutoff:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
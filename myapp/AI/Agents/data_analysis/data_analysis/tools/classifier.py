@@ -1,7 +1,9 @@
+import functools
 import re
 import json
 from crewai import LLM
 from dotenv import load_dotenv
+from myapp.AI.Agents.data_analysis.data_analysis.tools.workspace import DECODED_DATA, RAW_DATA, workspace_file
 
 load_dotenv()
 
@@ -24,16 +26,38 @@ DANGEROUS_PATTERNS = [
 ]
 
 
-def get_data_path_from_query(user_query: str) -> str:
-    """
-    Given a user query, determine whether to use raw or preprocessed data.
-    Returns the appropriate dataset path: 'data/raw_data.csv' or 'data/decoded.csv'.
-    """
+# Explicit cases from the classification prompt, decided without an LLM call.
+# Raw wins: imputation in the decoded copy hides missing values and original text.
+RAW_RULES = re.compile(
+    r"\b(missing|null|nulls|nan|nans|na values|empty values"
+    r"|original (categor\w*|text|values?|data|labels?)|text data|data quality|quality issues?"
+    r"|data cleaning|clean(ing)? needs?|raw data|use raw)\b",
+    re.IGNORECASE,
+)
+DECODED_RULES = re.compile(
+    r"\b(statistic\w*|correlat\w*|regression|model(ing|ling)|predict\w*|forecast\w*"
+    r"|mean|average|median|std|standard deviation|variance|sum|total|aggregat\w*"
+    r"|decoded|preprocessed|cleaned data)\b",
+    re.IGNORECASE,
+)
 
-    if llm is None:
-        print("LLM not initialized, defaulting to decoded data.")
-        return 'data/decoded.csv'
-    
+CLASSIFICATION_CACHE_SIZE = 1024
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def classify_by_rules(user_query: str):
+    """'raw' or 'decoded' for the explicit keyword cases, None if the query needs the LLM."""
+    if RAW_RULES.search(user_query):
+        return "raw"
+    if DECODED_RULES.search(user_query):
+        return "decoded"
+    return None
+
+
+@functools.lru_cache(maxsize=CLASSIFICATION_CACHE_SIZE)
+def _classify_with_llm(normalized_query: str) -> str:
+    """One LLM call per distinct query; failures raise, so they are never memoized."""
     prompt = f"""
 Classify this data analysis query on two dimensions:
 
@@ -41,7 +65,7 @@ Classify this data analysis query on two dimensions:
    - "raw": Use original data for queries about missing values, original text data, data quality issues, original categories, data cleaning needs
    - "decoded": Use cleaned/decoded data for statistical analysis, modeling, correlations, aggregations, mathematical operations
 
-Query: "{user_query}"
+Query: "{normalized_query}"
 
 IMPORTANT: 
 - If query mentions "missing values", "null", "NaN", "original categories", "text data", "data quality" → use "raw"
@@ -53,22 +77,39 @@ Return ONLY this JSON format:
 {{"data_type": "raw|decoded"}}
 """
 
+    result = llm.call(prompt)
+    json_match = re.search(r'\{.*\}', result, re.DOTALL)
+    if not json_match:
+        raise ValueError("No JSON found in LLM response")
+    classification = json.loads(json_match.group())
+    return "raw" if classification.get("data_type") == "raw" else "decoded"
+
+
+def classify_query(user_query: str) -> str:
+    """'raw' or 'decoded': keyword rules first, then at most one (memoized) LLM call."""
+    data_type = classify_by_rules(user_query)
+    if data_type is not None:
+        return data_type
+
+    if llm is None:
+        print("LLM not initialized, defaulting to decoded data.")
+        return "decoded"
+
     try:
-        result = llm.call(prompt)
-        json_match = re.search(r'\{.*\}', result, re.DOTALL)
-        if json_match:
-            classification = json.loads(json_match.group())
-            data_type = classification.get("data_type", "decoded")
-        else:
-            print("No JSON found in LLM response. Defaulting to decoded.")
-            data_type = "decoded"
+        return _classify_with_llm(_SPACE_RE.sub(" ", user_query).strip())
     except Exception as e:
-        print(f"Error during LLM call: {e}. Defaulting to decoded.")
-        data_type = "decoded"
+        print(f"Error during LLM classification: {e}. Defaulting to decoded.")
+        return "decoded"
+
+
+def get_data_path_from_query(user_query: str, workspace: str) -> str:
+    """
+    Given a user query, determine whether to use raw or preprocessed data.
+    Returns the appropriate dataset path in the workspace: 'raw_data.arrow' or 'decoded.arrow'.
+    """
 
     # Map to file path
-    if data_type == "raw":
-        return "data/raw_data.csv"
+    if classify_query(user_query) == "raw":
+        return workspace_file(workspace, RAW_DATA)
     else:
-        return "data/decoded.csv"
-
+        return workspace_file(workspace, DECODED_DATA)
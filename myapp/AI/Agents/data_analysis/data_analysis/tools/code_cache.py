@@ -0,0 +1,173 @@
+"""
+Cache of generated analysis and visualization code.
+
+`generate_and_execute_analysis` and `generate_and_execute_visualization`
+ask the LLM for new code on every call, even when the same question was
+answered before on a dataset with the same columns. `run_with_code_cache`
+keys the code on (tool, normalized query, schema fingerprint, model). On a
+hit it executes the stored code straight away, without an LLM call.
+
+Only code that executed successfully is stored, and not code that mentions
+the dataset's workspace (it would read another upload's files) or has no
+statements at all. Entries are checked before use (well-formed, parses)
+and evicted if they fail the check or their execution fails; the query is
+then answered with freshly generated code.
+
+Entries live in a diskcache directory shared by all workers and expire
+after CODE_CACHE_TTL seconds; beyond CODE_CACHE_SIZE_MB the least recently
+used are dropped. They are tagged with the tool, so one tool's code can be
+dropped with `manage.py code_cache clear --kind visualization`.
+"""
+import ast
+import hashlib
+import json
+import os
+import re
+import time
+
+import diskcache
+
+CODE_CACHE_DIR = os.getenv("CODE_CACHE_DIR", os.path.join("data", "code_cache"))
+CODE_CACHE_TTL = int(os.getenv("CODE_CACHE_TTL", 30 * 24 * 3600))
+CODE_CACHE_SIZE_LIMIT = int(os.getenv("CODE_CACHE_SIZE_MB", "256")) * 1024 * 1024
+CODE_CACHE_ENABLED = os.getenv("CODE_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+
+_SPACE_RE = re.compile(r"\s+")
+
+_cache = None
+
+
+def get_code_cache() -> diskcache.Cache:
+    global _cache
+    if _cache is None:
+        _cache = diskcache.Cache(
+            CODE_CACHE_DIR,
+            tag_index=True,
+            size_limit=CODE_CACHE_SIZE_LIMIT,
+            eviction_policy="least-recently-used",
+        )
+    return _cache
+
+
+def normalize_query(query) -> str:
+    """Case, spacing and trailing punctuation don't change the code; numbers and names do, so they stay."""
+    text = _SPACE_RE.sub(" ", str(query or "").lower()).strip()
+    return text.rstrip("?!. ")
+
+
+def schema_fingerprint(schema: dict) -> str:
+    """Hash of the column names and dtypes the generated code was written against."""
+    payload = json.dumps([schema["columns"], [schema["dtypes"][col] for col in schema["columns"]]])
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def code_cache_key(kind: str, query, schema: dict, model: str = "") -> str:
+    payload = json.dumps([kind, normalize_query(query), schema_fingerprint(schema), model])
+    return "code:" + hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _mentions_dataset(code: str, data_path: str) -> bool:
+    workspace = os.path.dirname(os.path.abspath(data_path))
+    return os.path.basename(workspace) in code or os.path.basename(data_path) in code
+
+
+def _valid_entry(entry) -> bool:
+    if not isinstance(entry, dict) or not isinstance(entry.get("code"), str) or not entry["code"].strip():
+        return False
+    try:
+        # Comment-only code (e.g. "# Error generating code: ...") has no statements
+        return bool(ast.parse(entry["code"]).body)
+    except (SyntaxError, ValueError):
+        return False
+
+
+def _lookup(key: str):
+    try:
+        entry = get_code_cache().get(key)
+    except Exception as e:
+        print(f"⚠️ Code cache unavailable, generating code: {e}")
+        return None
+    if entry is not None and not _valid_entry(entry):
+        evict_code(key)
+        return None
+    return entry
+
+
+def _store(key: str, kind: str, entry: dict) -> None:
+    try:
+        get_code_cache().set(key, entry, expire=CODE_CACHE_TTL, tag=kind)
+    except Exception as e:
+        print(f"⚠️ Could not cache generated code: {e}")
+
+
+def evict_code(key: str) -> None:
+    try:
+        get_code_cache().delete(key)
+    except Exception:
+        pass
+
+
+def run_with_code_cache(kind: str, query, schema: dict, data_path: str, model: str, generate, execute) -> dict:
+    """
+    Execute cached code for this query and schema, or generate, execute and
+    cache new code. `generate()` returns an entry - a dict with at least
+    "code" - and `execute(entry)` the tool's result dict.
+    """
+    if not CODE_CACHE_ENABLED:
+        return execute(generate())
+
+    key = code_cache_key(kind, query, schema, model)
+    entry = _lookup(key)
+    if entry is not None:
+        result = execute(entry)
+        if result.get("status") == "success":
+            _record(kind, hit=True, saved_seconds=entry.get("generation_seconds", 0.0))
+            return result
+        # Code that no longer runs on this data is dropped and written afresh
+        print(f"🧩 Code cache [{kind}]: cached code failed, regenerating")
+        evict_code(key)
+
+    started = time.perf_counter()
+    entry = generate()
+    generation_seconds = time.perf_counter() - started
+    result = execute(entry)
+    if result.get("status") == "success" and _valid_entry(entry) and not _mentions_dataset(entry["code"], data_path):
+        _store(key, kind, {**entry, "generation_seconds": generation_seconds, "created_at": time.time()})
+    _record(kind, hit=False, saved_seconds=0.0)
+    return result
+
+
+def _record(kind: str, hit: bool, saved_seconds: float) -> None:
+    try:
+        cache = get_code_cache()
+        cache.incr("stats:hits" if hit else "stats:misses")
+        if saved_seconds:
+            cache.incr("stats:saved_ms", int(saved_seconds * 1000))
+    except Exception:
+        pass
+    outcome = f"hit, saved {saved_seconds:.2f}s of code generation" if hit else "miss"
+    print(f"🧩 Code cache [{kind}]: {outcome}")
+
+
+def clear_code_cache(kind=None) -> int:
+    """Drop cached code (all of it, or one tool's). Returns the number removed."""
+    cache = get_code_cache()
+    if kind:
+        return cache.evict(kind)
+    return cache.clear()
+
+
+def code_cache_stats() -> dict:
+    """Totals since the cache was last cleared, across all workers."""
+    cache = get_code_cache()
+    hits = cache.get("stats:hits", 0)
+    misses = cache.get("stats:misses", 0)
+    lookups = hits + misses
+    return {
+        "entries": sum(1 for key in cache.iterkeys() if str(key).startswith("code:")),
+        "bytes": cache.volume(),
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        "saved_seconds": round(cache.get("stats:saved_ms", 0) / 1000, 1),
+    }
@@ -1,47 +1,66 @@
-import numpy as np
 from crewai.tools import tool
 from typing import Dict, Any
 import pandas as pd
 import os
-from io import StringIO
 import json
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_profile import dataset_profile, save_profile
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_store import (
+    CHUNKED_THRESHOLD_BYTES,
+    csv_to_dataset,
+    dataset_shape,
+    read_metadata,
+    write_dataset,
+)
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dtype_optimizer import (
+    ChunkedDtypeOptimizer,
+    optimize_dtypes,
+    original_dtypes,
+    savings_summary,
+)
+from myapp.AI.Agents.data_analysis.data_analysis.tools.workspace import RAW_DATA, workspace_file
 
 class DataSchema:
-    def __init__(self, data_path: str = "data/raw_data.csv"):
+    def __init__(self, data_path: str):
         self.data_path = data_path
-        self.df = None
+        self.profile = None
 
     def load_data(self):
         if not os.path.exists(self.data_path):
             raise FileNotFoundError(f"{self.data_path} does not exist")
-        self.df = pd.read_csv(self.data_path)
+        self.profile = dataset_profile(self.data_path)
 
     def get_info(self) -> str:
-        if self.df is None:
+        """df.info()-style column listing, built from the stored profile."""
+        if self.profile is None:
             self.load_data()
-        buffer = StringIO()
-        self.df.info(buf=buffer)
-        return buffer.getvalue()
+        rows, columns = self.profile["shape"]
+        width = max([len("Column")] + [len(str(col)) for col in self.profile["columns"]])
+        lines = [
+            f"RangeIndex: {rows} entries, 0 to {max(rows - 1, 0)}",
+            f"Data columns (total {columns} columns):",
+            f" #   {'Column':<{width}}  Non-Null Count  Dtype",
+        ]
+        for i, col in enumerate(self.profile["columns"]):
+            non_null = rows - self.profile["null_counts"][col]
+            lines.append(f" {i:<3} {col:<{width}}  {f'{non_null} non-null':<14}  {self.profile['dtypes'][col]}")
+        return "\n".join(lines) + "\n"
 
     def get_column_types(self) -> Dict[str, list]:
-        if self.df is None:
+        if self.profile is None:
             self.load_data()
 
-        cat_cols = self.df.select_dtypes(include=['object', 'category']).columns.tolist()
-        num_cols = self.df.select_dtypes(include=['int64', 'float64']).columns.tolist()
-
         return {
-            "categorical_columns": cat_cols,
-            "numerical_columns": num_cols
+            "categorical_columns": self.profile["categorical_columns"],
+            "numerical_columns": self.profile["numeric_columns"]
         }
 
     def get_summary(self) -> str:
         """Return schema summary as a JSON string."""
-        if self.df is None:
+        if self.profile is None:
             self.load_data()
 
         result = {
-            "shape": self.df.shape,
+            "shape": tuple(self.profile["shape"]),
             "column_types": self.get_column_types(),
             "info": self.get_info()
         }
@@ -49,14 +68,14 @@ class DataSchema:
 
     def as_text(self) -> str:
         """Return schema summary as a readable plain text string."""
-        if self.df is None:
+        if self.profile is None:
             self.load_data()
 
         column_types = self.get_column_types()
         return (
             f"DATASET SUMMARY\n"
             f"===============\n"
-            f"Shape: {self.df.shape}\n\n"
+            f"Shape: {tuple(self.profile['shape'])}\n\n"
             f"Categorical Columns: {column_types['categorical_columns']}\n"
             f"Numerical Columns: {column_types['numerical_columns']}\n\n"
             f"Schema Info:\n{self.get_info()}"
@@ -64,22 +83,39 @@ class DataSchema:
 
 
 @tool("load_user_data")
-def load_user_data(dataset_path: str) -> str:
+def load_user_data(dataset_path: str, workspace: str) -> str:
     """
     Loads the dataset from a given path (CSV, JSON, or Excel),
-    and saves it as 'data/raw_data.csv' for downstream tasks.
+    and saves it as 'raw_data.arrow' in the given workspace for downstream tasks.
     Returns a string summary.
     """
 
-    os.makedirs("data", exist_ok=True)
-    raw_data_path = "data/raw_data.csv"
-
-    # Delete existing file if it exists
-    if os.path.exists(raw_data_path):
-        os.remove(raw_data_path)
-
     try:
-        if dataset_path.endswith(".csv"):
+        raw_data_path = workspace_file(workspace, RAW_DATA)
+
+        # The workspace is keyed by file contents, so an existing copy is this file
+        if os.path.exists(raw_data_path):
+            rows, columns = dataset_shape(raw_data_path)
+            report = read_metadata(raw_data_path).get("dtype_optimization")
+            return (
+                f"Data already loaded.\n"
+                f"Rows: {rows}, Columns: {columns}\n"
+                + (f"{savings_summary(report)}\n" if report else "")
+                + f"Saved to: {raw_data_path}"
+            )
+
+        if dataset_path.endswith(".csv") and os.path.getsize(dataset_path) > CHUNKED_THRESHOLD_BYTES:
+            # Too large to parse in one go: convert chunk by chunk, to the same dtypes
+            optimizer = ChunkedDtypeOptimizer()
+            rows, columns = csv_to_dataset(dataset_path, raw_data_path, optimizer=optimizer)
+            save_profile(raw_data_path)
+            return (
+                f"Data loaded successfully.\n"
+                f"Rows: {rows}, Columns: {columns}\n"
+                f"{savings_summary(optimizer.report)}\n"
+                f"Saved to: {raw_data_path}"
+            )
+        elif dataset_path.endswith(".csv"):
             df = pd.read_csv(dataset_path)
         elif dataset_path.endswith(".json"):
             df = pd.read_json(dataset_path)
@@ -88,10 +124,19 @@ def load_user_data(dataset_path: str) -> str:
         else:
             return "Unsupported file format. Please provide CSV, JSON, or Excel."
 
-        df.to_csv(raw_data_path, index=False)
+        # Compact dtypes once here; every later read gets them from raw_data.arrow
+        optimized, report = optimize_dtypes(df)
+        write_dataset(
+            optimized,
+            raw_data_path,
+            metadata={"original_dtypes": original_dtypes(df), "dtype_optimization": report},
+        )
+        # Profile once for the prompt builders (analysis, visualization, schema)
+        save_profile(raw_data_path)
         return (
             f"Data loaded successfully.\n"
             f"Rows: {df.shape[0]}, Columns: {df.shape[1]}\n"
+            f"{savings_summary(report)}\n"
             f"Saved to: {raw_data_path}"
         )
 
@@ -100,13 +145,13 @@ def load_user_data(dataset_path: str) -> str:
 
 
 @tool("generate_schema")
-def generate_schema(_: str = "") -> str:
+def generate_schema(workspace: str) -> str:
     """
-    Loads 'data/raw_data.csv' and returns a plain text schema summary
+    Loads 'raw_data.arrow' from the given workspace and returns a plain text schema summary
     (shape, column types, and df.info()).
     """
     try:
-        schema = DataSchema()
+        schema = DataSchema(workspace_file(workspace, RAW_DATA))
         return schema.as_text()
     except Exception as e:
         return f"Error generating schema: {str(e)}"
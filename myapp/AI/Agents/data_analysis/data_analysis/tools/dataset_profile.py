@@ -0,0 +1,125 @@
+"""
+Dataset profiles for the prompt builders.
+
+The analysis, visualization and schema prompts describe a dataset by its
+dtypes, a few sample rows, null and distinct counts, top values and numeric
+ranges. A profile holds all of these for one dataset file. It is computed
+once, with Arrow compute kernels over the memory-mapped file, right after
+the file is written (load_user_data, preprocess_and_save_data). It is stored
+next to the file as <variant>.profile.json in the workspace, which is keyed
+by the dataset digest. The profile records the size and mtime of the file
+it describes, and `dataset_profile` rebuilds a stale or missing one, so
+building a prompt never scans the data.
+"""
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_store import read_table
+from myapp.AI.Agents.data_analysis.data_analysis.tools.workspace import atomic_write
+
+SAMPLE_ROWS = 3
+# Text columns with at most this many distinct values get their most frequent values listed
+TOP_VALUES_MAX_UNIQUE = 20
+TOP_VALUES = 10
+
+
+def profile_path(path: str) -> str:
+    """raw_data.arrow -> raw_data.profile.json, in the same workspace."""
+    return os.path.splitext(path)[0] + ".profile.json"
+
+
+def _file_version(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _value_counts(column: pa.ChunkedArray) -> list:
+    """(value, count) pairs of the non-null values, most frequent first."""
+    counts = pc.value_counts(column)
+    values = counts.field("values")
+    if pa.types.is_dictionary(values.type):
+        values = values.dictionary_decode()
+    pairs = [(v, n) for v, n in zip(values.to_pylist(), counts.field("counts").to_pylist()) if v is not None]
+    return sorted(pairs, key=lambda pair: pair[1], reverse=True)
+
+
+def _distinct_count(column: pa.ChunkedArray) -> int:
+    if pa.types.is_dictionary(column.type) or pa.types.is_null(column.type):
+        return len(_value_counts(column))
+    return pc.count_distinct(column, mode="only_valid").as_py()
+
+
+def compute_profile(path: str) -> dict:
+    table = read_table(path)
+    # Converting no rows gives the dtypes pandas will use for the data, except
+    # that nulls turn integer columns into float64 and boolean ones into object,
+    # and generated code gets categorical columns as object (sandbox._as_loaded)
+    empty = table.slice(0, 0).to_pandas()
+    widened = {}
+    for col in table.column_names:
+        if pa.types.is_dictionary(table[col].type):
+            widened[col] = "object"
+        elif table[col].null_count and pa.types.is_integer(table[col].type):
+            widened[col] = "float64"
+        elif table[col].null_count and pa.types.is_boolean(table[col].type):
+            widened[col] = "object"
+    if widened:
+        empty = empty.astype(widened)
+    numeric_cols = empty.select_dtypes(include=[np.number]).columns.tolist()
+    categorical_cols = empty.select_dtypes(include=["object", "category"]).columns.tolist()
+
+    unique_counts, top_values, data_ranges = {}, {}, {}
+    for col in table.column_names:
+        column = table[col]
+        if col in categorical_cols:
+            counts = _value_counts(column)
+            unique_counts[col] = len(counts)
+            if len(counts) <= TOP_VALUES_MAX_UNIQUE:
+                top_values[col] = dict(counts[:TOP_VALUES])
+        else:
+            unique_counts[col] = _distinct_count(column)
+        if col in numeric_cols:
+            bounds = pc.min_max(column)
+            data_ranges[col] = [bounds["min"].as_py(), bounds["max"].as_py()]
+
+    return {
+        "version": _file_version(path),
+        "shape": [table.num_rows, table.num_columns],
+        "columns": table.column_names,
+        "dtypes": empty.dtypes.apply(str).to_dict(),
+        "sample_data": table.slice(0, SAMPLE_ROWS).to_pandas().to_dict(),
+        "numeric_columns": numeric_cols,
+        "categorical_columns": categorical_cols,
+        "null_counts": {col: table[col].null_count for col in table.column_names},
+        "unique_counts": unique_counts,
+        "top_values": top_values,
+        "data_ranges": data_ranges,
+    }
+
+
+def save_profile(path: str) -> dict:
+    """Profile the dataset at `path` and store the result next to it."""
+    profile = compute_profile(path)
+
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(profile, f, default=str)
+
+    atomic_write(profile_path(path), write)
+    return profile
+
+
+def dataset_profile(path: str) -> dict:
+    """The stored profile of `path`; recomputed if missing or older than the file."""
+    try:
+        with open(profile_path(path), encoding="utf-8") as f:
+            profile = json.load(f)
+        if profile.get("version") == _file_version(path):
+            return profile
+    except (OSError, ValueError):
+        pass
+    return save_profile(path)
@@ -0,0 +1,371 @@
+"""
+Typed columnar storage for workspace datasets.
+
+An upload is parsed once (CSV/JSON/Excel) and every copy the crew needs
+afterwards - raw, preprocessed, decoded - is kept as an uncompressed Arrow
+IPC file. Reads memory-map the file instead of parsing text, so dtypes
+survive the round trip and a multi-million-row dataset opens in a fraction
+of the time `pd.read_csv` needs. Mappings (categorical codes, datetime
+features) travel in the schema metadata of the file they describe.
+
+Loaded DataFrames are kept in a per-process LRU cache bounded by
+DATAFRAME_CACHE_MAX_MB, so the analysis and visualization tools - and
+follow-up questions about the same upload - share one copy in memory.
+
+Uploads larger than DATA_CHUNKED_THRESHOLD_MB are converted and preprocessed
+DATA_CHUNK_ROWS rows at a time (`csv_to_dataset`, `iter_chunks`,
+`DatasetWriter`), so memory use is bounded by the chunk size rather than the
+file size.
+
+Everything else is written as a single record batch: every column is then
+one contiguous buffer in the file, and `read_dataset` hands numeric columns
+without nulls to pandas as read-only views of the mapped file instead of
+copies (sandbox workers run generated code on them under copy-on-write).
+"""
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools.workspace import atomic_write
+
+logger = logging.getLogger(__name__)
+
+METADATA_KEY = b"mars.metadata"
+
+DATAFRAME_CACHE_MAX_BYTES = int(os.getenv("DATAFRAME_CACHE_MAX_MB", "1024")) * 1024 * 1024
+CHUNK_ROWS = int(os.getenv("DATA_CHUNK_ROWS", "250000"))
+CHUNKED_THRESHOLD_BYTES = int(os.getenv("DATA_CHUNKED_THRESHOLD_MB", "1024")) * 1024 * 1024
+
+
+def _to_table(df: pd.DataFrame, schema: pa.Schema = None) -> pa.Table:
+    try:
+        return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+
+    # Object columns mixing numbers and text can't be typed; store those as text
+    mixed = []
+    for col in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[col], from_pandas=True, type=schema.field(col).type if schema is not None else None)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            mixed.append(col)
+    return pa.Table.from_pandas(_stringify(df, mixed), schema=schema, preserve_index=False)
+
+
+def _stringify(df: pd.DataFrame, columns) -> pd.DataFrame:
+    if not columns:
+        return df
+    return df.assign(**{col: df[col].where(df[col].isna(), df[col].astype(str)) for col in columns})
+
+
+def _with_metadata(table: pa.Table, metadata: dict) -> pa.Table:
+    schema_metadata = dict(table.schema.metadata or {})
+    schema_metadata[METADATA_KEY] = json.dumps(metadata, default=_json_default).encode()
+    return table.replace_schema_metadata(schema_metadata)
+
+
+def write_dataset(df: pd.DataFrame, path: str, metadata: dict = None) -> None:
+    """Write `df` (and optional JSON-serialisable metadata) to an Arrow IPC file."""
+    table = _to_table(df)
+    if metadata is not None:
+        table = _with_metadata(table, metadata)
+
+    def write(tmp_path):
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                # One batch: contiguous columns that can be mapped without copying
+                writer.write_table(table)
+
+    atomic_write(path, write)
+
+
+class DatasetWriter:
+    """
+    Write a dataset chunk by chunk; the result holds the same data and
+    schema `write_dataset` produces for the concatenated chunks, in one record
+    batch per chunk (so its columns are copied, not mapped, when read into
+    pandas). The column types are taken from `schema` or the first chunk;
+    the file is moved into place by `close()`.
+
+        with DatasetWriter(path, metadata) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+    """
+
+    def __init__(self, path: str, metadata: dict = None, schema: pa.Schema = None):
+        self.path = path
+        self.metadata = metadata
+        self.schema = schema
+        self.rows = 0
+        directory = os.path.dirname(path) or "."
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.splitext(path)[1])
+        os.close(fd)
+        self._sink = None
+        self._writer = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        table = _to_table(df, self.schema)
+        if self._writer is None:
+            if self.metadata is not None:
+                table = _with_metadata(table, self.metadata)
+            self.schema = table.schema
+            self._sink = pa.OSFile(self._tmp_path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, self.schema)
+        else:
+            # The pandas metadata describes the first chunk; keep it for the whole file
+            table = table.replace_schema_metadata(self.schema.metadata)
+        self._writer.write_table(table, max_chunksize=CHUNK_ROWS)
+        self.rows += len(df)
+
+    def close(self) -> None:
+        if self._writer is None:
+            raise ValueError("No data written")
+        self._writer.close()
+        self._sink.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._sink.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def iter_chunks(path: str, chunk_rows: int = CHUNK_ROWS):
+    """Yield the rows of an Arrow IPC file as DataFrames of at most `chunk_rows` rows."""
+    reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        for offset in range(0, batch.num_rows, chunk_rows):
+            yield batch.slice(offset, chunk_rows).to_pandas()
+
+
+def _chunk_type(series: pd.Series):
+    """Arrow type of one CSV chunk's column; None if it is all missing, "mixed" if untypeable."""
+    if series.isna().all():
+        return None
+    try:
+        return pa.array(series, from_pandas=True).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return "mixed"
+
+
+def csv_to_dataset(csv_path: str, path: str, chunk_rows: int = CHUNK_ROWS, optimizer=None) -> tuple:
+    """
+    Convert a CSV file to an Arrow IPC dataset in two streaming passes and
+    return its shape. The first pass settles each column's type the way one
+    `pd.read_csv` of the whole file would (integers with gaps become floats,
+    columns mixing numbers and text become text); the second converts and
+    writes chunk by chunk.
+
+    With an `optimizer` (dtype_optimizer.ChunkedDtypeOptimizer) the first
+    pass also feeds it every chunk, the columns are written with the dtypes
+    it plans, and the whole-file dtypes and its report are stored as the
+    "original_dtypes" and "dtype_optimization" metadata, as load_user_data
+    stores them for files it loads at once.
+    """
+    dtypes, types = {}, {}
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        if optimizer is not None:
+            optimizer.observe(chunk)
+        for col in chunk.columns:
+            dtypes.setdefault(col, set()).add(str(chunk[col].dtype))
+            types.setdefault(col, set()).add(_chunk_type(chunk[col]))
+
+    targets, fields, as_text = {}, [], {}
+    for col, kinds in dtypes.items():
+        if kinds <= {"int64", "float64"}:
+            targets[col] = "int64" if kinds == {"int64"} else "float64"
+            fields.append((col, pa.int64() if kinds == {"int64"} else pa.float64()))
+        elif kinds == {"bool"}:
+            targets[col] = "bool"
+            fields.append((col, pa.bool_()))
+        else:
+            targets[col] = "object"
+            seen = types[col] - {None}
+            if len(seen) == 1 and "mixed" not in seen:
+                fields.append((col, seen.pop()))
+            elif not seen:
+                fields.append((col, pa.null()))
+            else:
+                fields.append((col, pa.string()))
+                # Chunks parsed as numbers/booleans are re-read as the text a whole-file read keeps
+                if kinds - {"object"}:
+                    as_text[col] = str
+
+    metadata = None
+    if optimizer is not None:
+        compact = optimizer.plan(targets)
+        metadata = {"original_dtypes": dict(targets), "dtype_optimization": optimizer.report}
+        if compact:
+            # Arrow types of the compacted columns, categories included
+            compact_schema = pa.Schema.from_pandas(
+                pd.DataFrame({col: pd.Series([], dtype=dtype) for col, dtype in compact.items()}),
+                preserve_index=False,
+            )
+            fields = [(col, compact_schema.field(col).type if col in compact else type_) for col, type_ in fields]
+            targets.update(compact)
+
+    with DatasetWriter(path, metadata=metadata, schema=pa.schema(fields)) as writer:
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_rows, dtype=as_text or None):
+            writer.write(chunk.astype(targets, copy=False))
+    return writer.rows, len(fields)
+
+
+def dataset_schema(path: str) -> pa.Schema:
+    return pa.ipc.open_file(pa.memory_map(path, "r")).schema
+
+
+def read_table(path: str) -> pa.Table:
+    """Memory-map an Arrow IPC file; column buffers point into the page cache."""
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def read_dataset(path: str) -> pd.DataFrame:
+    """
+    Load a dataset into pandas. With one block per column, numeric columns
+    without nulls stay zero-copy, read-only views of the memory map; text,
+    categorical and nullable columns are converted.
+    """
+    return read_table(path).to_pandas(split_blocks=True)
+
+
+def read_metadata(path: str) -> dict:
+    """Metadata stored by `write_dataset`, without reading any column data."""
+    schema = pa.ipc.open_file(pa.memory_map(path, "r")).schema
+    raw = (schema.metadata or {}).get(METADATA_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def dataset_shape(path: str) -> tuple:
+    reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+    rows = sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+    return rows, len(reader.schema.names)
+
+
+# ---- In-process DataFrame cache ----
+
+class DataFrameCache:
+    """
+    LRU of DataFrames keyed by (workspace digest, variant), bounded by their
+    total in-memory size. Entries remember the file's mtime, so a rewritten
+    file is reloaded. Cached frames are shared and may be backed by the
+    read-only file mapping: callers must not modify them in place (the code
+    sandbox runs on copy-on-write views, see sandbox.py).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (mtime_ns, nbytes, df)
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, mtime_ns):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != mtime_ns:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, mtime_ns, df: pd.DataFrame) -> None:
+        nbytes = estimate_nbytes(df)
+        with self._lock:
+            self._discard(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (mtime_ns, nbytes, df)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def _discard(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def estimate_nbytes(df: pd.DataFrame, sample_size: int = 10_000) -> int:
+    """
+    In-memory size of `df`. Object columns are measured on an evenly spaced
+    sample: memory_usage(deep=True) walks every Python object and takes
+    seconds on multi-million-row frames.
+    """
+    nbytes = int(df.memory_usage(index=True, deep=False).sum())
+    step = max(1, len(df) // sample_size)
+    for col in df.columns[df.dtypes == object]:
+        sample = df[col].iloc[::step]
+        per_row = (sample.memory_usage(index=False, deep=True) - sample.memory_usage(index=False)) / max(len(sample), 1)
+        nbytes += int(per_row * len(df))
+    return nbytes
+
+
+dataframe_cache = DataFrameCache(DATAFRAME_CACHE_MAX_BYTES)
+
+
+def _cache_key(path: str):
+    # <workspace digest>, <raw_data|preprocessed_data|decoded>
+    digest = os.path.basename(os.path.dirname(os.path.abspath(path)))
+    variant = os.path.splitext(os.path.basename(path))[0]
+    return digest, variant
+
+
+def load_dataset(path: str) -> pd.DataFrame:
+    """`read_dataset` through the process-wide DataFrame cache. Don't modify the result."""
+    key = _cache_key(path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    df = dataframe_cache.get(key, mtime_ns)
+    if df is None:
+        df = read_dataset(path)
+        dataframe_cache.put(key, mtime_ns, df)
+        logger.debug("DataFrame cache miss [%s/%s]", key[0][:8], key[1])
+    else:
+        logger.debug("DataFrame cache hit [%s/%s]", key[0][:8], key[1])
+    return df
+
+
+def _json_default(value):
+    # numpy scalars and timestamps end up in mappings (e.g. category values)
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
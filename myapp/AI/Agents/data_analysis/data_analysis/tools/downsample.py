@@ -0,0 +1,232 @@
+"""
+Pre-render downsampling for generated charts.
+
+Generated visualization code plots whatever it selected, so a line or
+scatter chart over the ball-by-ball rows of a big upload carries millions
+of points into the Plotly HTML/JSON and into a dpi=300 `savefig`.
+`downsample_figure` runs in the sandbox worker between the generated code
+and rendering, and bounds every Plotly scatter trace and Matplotlib/Seaborn
+line or scatter to a point budget:
+
+  * lines (time series) keep VIZ_MAX_LINE_POINTS points, chosen with
+    Largest-Triangle-Three-Buckets (VIZ_DOWNSAMPLE_METHOD=lttb, the default)
+    or the minimum and maximum of each bucket (minmax), so peaks survive;
+  * marker-only scatters are binned on a grid of about VIZ_MAX_SCATTER_POINTS
+    cells and keep one real point per occupied cell, which preserves the
+    extent, shape and outliers of the cloud (not its density);
+  * Plotly scatter traces still above VIZ_WEBGL_MIN_POINTS are drawn with
+    WebGL (scattergl).
+
+Per-point attributes (colors, sizes, hover text, customdata) are subsampled
+with the points. A budget of 0 turns that step off.
+"""
+import os
+import warnings
+
+import numpy as np
+
+VIZ_MAX_LINE_POINTS = int(os.getenv("VIZ_MAX_LINE_POINTS", "2000"))
+VIZ_MAX_SCATTER_POINTS = int(os.getenv("VIZ_MAX_SCATTER_POINTS", "10000"))
+VIZ_DOWNSAMPLE_METHOD = os.getenv("VIZ_DOWNSAMPLE_METHOD", "lttb").lower()
+VIZ_WEBGL_MIN_POINTS = int(os.getenv("VIZ_WEBGL_MIN_POINTS", "1000"))
+
+_PLOTLY_SCATTER_TYPES = ("scatter", "scattergl")
+# Trace properties that are lists but not one value per point
+_NOT_PER_POINT = {"colorscale"}
+
+
+# ---- Point selection ----
+
+def _numeric(values) -> np.ndarray:
+    """Values as float64 for the geometry; datetimes as nanoseconds, anything non-numeric by position."""
+    arr = np.asarray(values)
+    if arr.dtype.kind in "mM":
+        out = arr.astype("int64").astype(np.float64)
+        out[np.isnat(arr)] = np.nan
+        return out
+    try:
+        return arr.astype(np.float64)
+    except (TypeError, ValueError):
+        return np.arange(len(arr), dtype=np.float64)
+
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """Indices of the `n_out` points Largest-Triangle-Three-Buckets keeps (first and last included)."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x, y = _numeric(x), _numeric(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN buckets
+        for i in range(n_out - 2):
+            start, end = edges[i], edges[i + 1]
+            next_end = edges[i + 2] if i + 2 < len(edges) else n
+            avg_x = np.nanmean(x[end:next_end])
+            avg_y = np.nanmean(y[end:next_end])
+            # Twice the area of the triangle (previous pick, candidate, next bucket's average)
+            area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+            a = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+            selected[i + 1] = a
+    return selected
+
+
+def minmax_indices(y, n_out: int) -> np.ndarray:
+    """Indices of the first and last point and the minimum and maximum of equal buckets, in order."""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    y = _numeric(y)
+    low = np.where(np.isnan(y), np.inf, y)
+    high = np.where(np.isnan(y), -np.inf, y)
+    edges = np.linspace(0, n, (n_out - 2) // 2 + 1).astype(np.int64)
+    picks = [0, n - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            picks.append(start + int(np.argmin(low[start:end])))
+            picks.append(start + int(np.argmax(high[start:end])))
+    return np.unique(picks)
+
+
+def bin_indices(x, y, n_out: int) -> np.ndarray:
+    """The first point of every occupied cell of a grid with at most `n_out` cells, in order."""
+    n = len(y)
+    if n_out >= n or n_out < 1:
+        return np.arange(n)
+    x, y = _numeric(x), _numeric(y)
+    valid = np.flatnonzero(~np.isnan(x) & ~np.isnan(y))
+    if not len(valid):
+        return valid
+    bins = max(1, int(np.sqrt(n_out)))
+
+    def cells(values):
+        low, high = values.min(), values.max()
+        scaled = (values - low) / ((high - low) or 1.0) * bins
+        return np.clip(scaled.astype(np.int64), 0, bins - 1)
+
+    cell = cells(x[valid]) * bins + cells(y[valid])
+    _, first = np.unique(cell, return_index=True)
+    return np.sort(valid[first])
+
+
+def line_indices(x, y, n_out: int) -> np.ndarray:
+    if VIZ_DOWNSAMPLE_METHOD == "minmax":
+        return minmax_indices(y, n_out)
+    return lttb_indices(x, y, n_out)
+
+
+# ---- Plotly ----
+
+def _take(value, idx: np.ndarray, n: int):
+    """Subsample every per-point array (length `n`) in a trace's properties."""
+    if isinstance(value, dict):
+        return {key: item if key in _NOT_PER_POINT else _take(item, idx, n) for key, item in value.items()}
+    if isinstance(value, np.ndarray) and value.ndim and len(value) == n:
+        return value[idx]
+    if isinstance(value, (list, tuple)) and len(value) == n:
+        return [value[i] for i in idx]
+    return value
+
+
+def _downsample_plotly_trace(trace, stats: dict):
+    props = trace.to_plotly_json()
+    if props.get("type") not in _PLOTLY_SCATTER_TYPES or props.get("y") is None:
+        return trace
+    n = len(props["y"])
+    if props.get("x") is None:
+        props["x"] = props.get("x0", 0) + props.get("dx", 1) * np.arange(n)
+
+    # Plotly's default mode for scatter traces of 20 points or more is "lines"
+    if "lines" in (props.get("mode") or ("lines+markers" if n < 20 else "lines")):
+        budget = VIZ_MAX_LINE_POINTS
+        select = line_indices
+    else:
+        budget = VIZ_MAX_SCATTER_POINTS
+        select = bin_indices
+
+    changed = False
+    if 0 < budget < n:
+        props = _take(props, select(props["x"], props["y"], budget), n)
+        stats["traces"] += 1
+        stats["before"] += n
+        stats["after"] += len(props["y"])
+        changed = True
+    if 0 < VIZ_WEBGL_MIN_POINTS < len(props["y"]) and props["type"] == "scatter":
+        props["type"] = "scattergl"
+        changed = True
+    if not changed:
+        return trace
+
+    import plotly.graph_objects as go
+
+    trace_class = go.Scattergl if props.pop("type") == "scattergl" else go.Scatter
+    # Properties WebGL traces don't have (e.g. cliponaxis) are dropped
+    return trace_class(props, skip_invalid=True)
+
+
+def _downsample_plotly(fig, stats: dict):
+    traces = [_downsample_plotly_trace(trace, stats) for trace in fig.data]
+    if all(new is old for new, old in zip(traces, fig.data)):
+        return fig
+
+    import plotly.graph_objects as go
+
+    return go.Figure(data=traces, layout=fig.layout, frames=fig.frames)
+
+
+# ---- Matplotlib / Seaborn ----
+
+def _downsample_matplotlib(fig, stats: dict):
+    from matplotlib.collections import PathCollection
+
+    for ax in fig.axes:
+        for line in ax.get_lines():
+            xy = line.get_xydata()
+            n = len(xy)
+            if 0 < VIZ_MAX_LINE_POINTS < n:
+                idx = line_indices(xy[:, 0], xy[:, 1], VIZ_MAX_LINE_POINTS)
+                line.set_data(np.asarray(line.get_xdata())[idx], np.asarray(line.get_ydata())[idx])
+                stats["traces"] += 1
+                stats["before"] += n
+                stats["after"] += len(idx)
+
+        for collection in ax.collections:
+            if not isinstance(collection, PathCollection):
+                continue
+            offsets = np.asarray(collection.get_offsets())
+            n = len(offsets)
+            if not 0 < VIZ_MAX_SCATTER_POINTS < n:
+                continue
+            idx = bin_indices(offsets[:, 0], offsets[:, 1], VIZ_MAX_SCATTER_POINTS)
+            collection.set_offsets(offsets[idx])
+            values = collection.get_array()
+            if values is not None and len(values) == n:
+                collection.set_array(values[idx])
+            elif len(collection.get_facecolors()) == n:
+                # Colors set per point rather than mapped from values
+                collection.set_facecolors(collection.get_facecolors()[idx])
+            if len(collection.get_sizes()) == n:
+                collection.set_sizes(collection.get_sizes()[idx])
+            stats["traces"] += 1
+            stats["before"] += n
+            stats["after"] += len(idx)
+    return fig
+
+
+def downsample_figure(fig):
+    """Bound the points of a Plotly or Matplotlib figure to the VIZ_* budgets (Plotly figures may be replaced)."""
+    stats = {"traces": 0, "before": 0, "after": 0}
+    if hasattr(fig, "to_plotly_json") and hasattr(fig, "data"):
+        fig = _downsample_plotly(fig, stats)
+    elif hasattr(fig, "savefig") and hasattr(fig, "axes"):
+        fig = _downsample_matplotlib(fig, stats)
+    if stats["traces"]:
+        print(
+            f"📉 Chart downsampled: {stats['traces']} traces, "
+            f"{stats['before']:,} -> {stats['after']:,} points"
+        )
+    return fig
@@ -0,0 +1,172 @@
+"""
+Compact dtypes for uploaded datasets.
+
+`optimize_dtypes` runs in load_user_data before raw_data.arrow is written:
+
+  * integer columns become int32 when their values fit (never narrower, so
+    arithmetic in generated analysis code doesn't overflow);
+  * float64 columns without nulls become float32 when every value survives
+    the round trip; columns with nulls stay float64, since preprocessing
+    fills them with their mean;
+  * string columns whose distinct values are at most CATEGORY_MAX_UNIQUE_RATIO
+    of the rows, and at most CATEGORY_MAX_UNIQUE, become categoricals (team,
+    venue and city names in the IPL data).
+    They are a storage and cache format only: generated code gets them back
+    as object columns (sandbox._as_loaded), and profiles describe them so.
+
+The dtypes pd.read_csv produced are stored with the dataset, so reports can
+name them.
+
+CSV uploads too large to load at once (dataset_store.csv_to_dataset) get
+the same dtypes from `ChunkedDtypeOptimizer`, which decides from statistics
+collected over every chunk and gives a compacted column the same categories
+in every chunk.
+"""
+import numpy as np
+import pandas as pd
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_store import estimate_nbytes
+
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+# Distinct values the chunked path keeps per column while deciding
+CATEGORY_MAX_UNIQUE = 65536
+
+_INT32 = np.iinfo(np.int32)
+
+
+def _optimized_column(series: pd.Series) -> pd.Series:
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return series
+
+    if pd.api.types.is_integer_dtype(dtype):
+        if dtype.itemsize > 4 and (series.empty or (series.min() >= _INT32.min and series.max() <= _INT32.max)):
+            return series.astype(np.int32)
+        return series
+
+    if dtype == np.float64:
+        if series.hasnans:
+            return series
+        values = series.to_numpy()
+        narrowed = values.astype(np.float32)
+        if np.array_equal(narrowed.astype(np.float64), values):
+            return pd.Series(narrowed, index=series.index, name=series.name)
+        return series
+
+    if dtype == object and len(series):
+        if series.nunique(dropna=True) <= min(CATEGORY_MAX_UNIQUE_RATIO * len(series), CATEGORY_MAX_UNIQUE):
+            if pd.api.types.infer_dtype(series, skipna=True) == "string":
+                return series.astype("category")
+    return series
+
+
+def original_dtypes(df: pd.DataFrame) -> dict:
+    return {col: str(dtype) for col, dtype in df.dtypes.items()}
+
+
+def optimize_dtypes(df: pd.DataFrame):
+    """Return a compacted copy of `df` and a report of what changed and the memory saved."""
+    before = estimate_nbytes(df)
+    if df.columns.has_duplicates:
+        return df, {"bytes_before": before, "bytes_after": before, "columns": {}}
+
+    optimized = pd.DataFrame({col: _optimized_column(df[col]) for col in df.columns}, index=df.index)
+    changed = {
+        col: {"from": str(df[col].dtype), "to": str(optimized[col].dtype)}
+        for col in df.columns
+        if optimized[col].dtype != df[col].dtype
+    }
+    return optimized, {
+        "bytes_before": before,
+        "bytes_after": estimate_nbytes(optimized),
+        "columns": changed,
+    }
+
+
+class ChunkedDtypeOptimizer:
+    """
+    `optimize_dtypes` for a dataset read in chunks. `observe` every chunk as
+    parsed, then `plan` with the dtypes a whole-file read gives; the result
+    maps each column that changes to its compact dtype, and `report` is
+    what `optimize_dtypes` would report.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.report = None
+        self._bytes = 0
+        self._columns = {}
+
+    def observe(self, chunk: pd.DataFrame) -> None:
+        self.rows += len(chunk)
+        self._bytes += estimate_nbytes(chunk)
+        for col in chunk.columns:
+            series = chunk[col]
+            stats = self._columns.setdefault(col, {
+                "nulls": False, "min": None, "max": None, "float32": True,
+                "strings": False, "other": False, "values": set(), "bytes": 0,
+            })
+            if series.isna().all():
+                # All-missing chunks parse as float64 whatever the column holds
+                stats["nulls"] |= len(series) > 0
+                continue
+            stats["nulls"] |= bool(series.hasnans)
+            dtype = series.dtype
+            if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+                low, high = series.min(), series.max()
+                stats["min"] = low if stats["min"] is None else min(stats["min"], low)
+                stats["max"] = high if stats["max"] is None else max(stats["max"], high)
+                values = series.to_numpy(dtype=np.float64)
+                stats["float32"] &= bool(np.array_equal(values.astype(np.float32).astype(np.float64), values))
+                stats["other"] = True
+            elif dtype == object and pd.api.types.infer_dtype(series, skipna=True) == "string":
+                stats["strings"] = True
+                stats["bytes"] += estimate_nbytes(series.to_frame()) - series.index.memory_usage()
+                if stats["values"] is not None:
+                    stats["values"].update(series.dropna().unique())
+                    if len(stats["values"]) > CATEGORY_MAX_UNIQUE:
+                        stats["values"] = None
+            else:
+                stats["other"] = True
+
+    def _compact_dtype(self, col, dtype: str):
+        stats = self._columns[col]
+        if dtype == "int64":
+            if stats["min"] is None or (stats["min"] >= _INT32.min and stats["max"] <= _INT32.max):
+                return np.dtype(np.int32)
+        elif dtype == "float64":
+            if not stats["nulls"] and stats["float32"]:
+                return np.dtype(np.float32)
+        elif dtype == "object" and stats["strings"] and not stats["other"] and stats["values"] is not None:
+            if len(stats["values"]) <= CATEGORY_MAX_UNIQUE_RATIO * self.rows:
+                return pd.Categorical(pd.Series(list(stats["values"]), dtype=object)).dtype
+        return None
+
+    def plan(self, dtypes: dict) -> dict:
+        """Compact dtype of every column that changes, given the whole-file dtypes."""
+        planned, changed = {}, {}
+        after = self._bytes
+        if len(set(dtypes)) == len(dtypes):
+            for col, dtype in dtypes.items():
+                compact = self._compact_dtype(col, dtype)
+                if compact is None:
+                    continue
+                planned[col] = compact
+                changed[col] = {"from": dtype, "to": str(compact)}
+                if isinstance(compact, pd.CategoricalDtype):
+                    codes = pd.Categorical([], dtype=compact).codes
+                    after -= self._columns[col]["bytes"]
+                    after += codes.itemsize * self.rows + 8 * len(compact.categories)
+                else:
+                    after -= 4 * self.rows
+        self.report = {"bytes_before": self._bytes, "bytes_after": after, "columns": changed}
+        return planned
+
+
+def savings_summary(report: dict) -> str:
+    before, after = report["bytes_before"], report["bytes_after"]
+    saved = 100 * (before - after) / before if before else 0.0
+    return (
+        f"Memory: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB after dtype optimization "
+        f"({saved:.0f}% smaller, {len(report['columns'])} columns compacted)"
+    )
@@ -5,236 +5,510 @@ import numpy as np
 from crewai.tools import tool
 from typing import Dict, Any
 import warnings
+import pyarrow as pa
+from pandas.tseries.api import guess_datetime_format
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_profile import save_profile
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_store import (
+    CHUNKED_THRESHOLD_BYTES,
+    DatasetWriter,
+    dataset_schema,
+    dataset_shape,
+    iter_chunks,
+    load_dataset,
+    read_metadata,
+    write_dataset,
+)
+from myapp.AI.Agents.data_analysis.data_analysis.tools.workspace import (
+    DECODED_DATA,
+    PREPROCESSED_DATA,
+    RAW_DATA,
+    resolve_workspace,
+)
+
+# Rows tested for a datetime format before a whole column is parsed
+DATETIME_SAMPLE_SIZE = 1000
+# Sample values a candidate format is guessed from
+DATETIME_GUESS_VALUES = 20
+
+
+def _fill_codes_with_mode(codes: np.ndarray, categories: pd.Index):
+    """Replace missing codes (-1) with the code of the most frequent category."""
+    if len(categories) == 0:
+        # All values missing
+        return np.zeros(len(codes), dtype=np.int8), pd.Index(["Unknown"])
+    counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+    # argmax picks the first of tied categories, like Series.mode().iloc[0]
+    return np.where(codes < 0, counts.argmax(), codes).astype(codes.dtype), categories
+
+
+def _is_text(series: pd.Series) -> bool:
+    # Strings are object columns, or categoricals when load_user_data compacted them
+    return series.dtype == object or isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def _decode(codes: np.ndarray, categories: pd.Index, as_category: bool = False):
+    """Original values for category codes; kept categorical when the raw column was."""
+    values = pd.Categorical.from_codes(codes, categories)
+    return values if as_category else np.asarray(values, dtype=object)
+
+
+def _datetime_sample_rows(n_rows: int, sample_size: int = DATETIME_SAMPLE_SIZE) -> np.ndarray:
+    """Row positions tested for a datetime format; seeded, so both preprocessing paths pick the same rows."""
+    return np.random.default_rng(0).choice(n_rows, size=min(sample_size, n_rows), replace=False)
+
+
+def _infer_datetime_format(series: pd.Series, sample_size: int = DATETIME_SAMPLE_SIZE):
+    """
+    Explicit strftime format that parses more than half of a random sample of
+    `series`, or None. Candidates are guessed from a few sample values
+    (month-first and day-first) and the one parsing most of the sample wins.
+    """
+    if series.empty:
+        return None
+    return _format_from_sample(series.iloc[_datetime_sample_rows(len(series), sample_size)])
+
+
+def _format_from_sample(sample: pd.Series):
+    sample = sample.dropna().astype(str)
+    if sample.empty:
+        return None
+
+    best_format, best_rate = None, 0.0
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        candidates = []
+        for value in sample.iloc[:DATETIME_GUESS_VALUES]:
+            for dayfirst in (False, True):
+                fmt = guess_datetime_format(value, dayfirst=dayfirst)
+                if fmt and fmt not in candidates:
+                    candidates.append(fmt)
+        for fmt in candidates:
+            rate = pd.to_datetime(sample, format=fmt, errors="coerce").notna().mean()
+            if rate > best_rate:
+                best_format, best_rate = fmt, rate
+    return best_format if best_rate > 0.5 else None
+
+
+def _preprocessing_result(
+    original_shape,
+    processed_shape,
+    datetime_converted_columns,
+    datetime_features_created,
+    files_created,
+    decoding_status,
+    decoding_message,
+    decoded_columns,
+) -> Dict[str, Any]:
+    return {
+        "status": "success",
+        "message": "Preprocessing completed and decoded data saved to decoded.arrow",
+        "original_shape": list(original_shape),
+        "processed_shape": list(processed_shape),
+        "datetime_converted_columns": datetime_converted_columns,
+        "datetime_features_created": datetime_features_created,
+        # "categorical_mappings": categorical_mappings,
+        "total_columns": processed_shape[1],
+        "files_created": files_created,
+        # NEW: Decoding information
+        "decoding_status": decoding_status,
+        "decoding_message": decoding_message,
+        "decoded_columns": decoded_columns,
+        "total_decoded_columns": len(decoded_columns)
+    }
+
+
+# ---- Out-of-core preprocessing ----
+
+def _whole_column_dtype(field: pa.Field, nulls: int):
+    """
+    pandas dtype of the column when the whole file is loaded at once (a chunk
+    without nulls may convert differently), or None if the chunked path
+    doesn't handle the type.
+    """
+    if pa.types.is_int64(field.type) or pa.types.is_int32(field.type):
+        return "float64" if nulls else str(field.type)
+    if pa.types.is_float64(field.type) or pa.types.is_float32(field.type):
+        return "float64" if pa.types.is_float64(field.type) else "float32"
+    if pa.types.is_dictionary(field.type) and pa.types.is_string(field.type.value_type):
+        # Text columns load_user_data compacted
+        return "category"
+    if pa.types.is_boolean(field.type):
+        return "object" if nulls else "bool"
+    if pa.types.is_string(field.type) or pa.types.is_large_string(field.type) or pa.types.is_null(field.type):
+        return "object"
+    return None
+
+
+def _chunked_supported(schema: pa.Schema) -> bool:
+    # Types are checked as if the column had nulls, the case that changes its dtype
+    return all(_whole_column_dtype(field, 1) is not None for field in schema)
+
+
+def _preprocess_chunked(raw_path: str, processed_path: str, decoded_path: str) -> Dict[str, Any]:
+    """
+    preprocess_and_save_data for raw files too large to load at once; writes
+    the same files, mappings and report. Pass 1 streams the file to collect
+    null counts, sums for the means, value counts for the modes and
+    category dictionaries, and the datetime-detection sample (the same rows
+    the in-memory path samples). Pass 2 streams it again to impute, encode
+    and write both outputs a chunk at a time.
+    """
+    schema = dataset_schema(raw_path)
+    n_rows, n_columns = dataset_shape(raw_path)
+    names = schema.names
+    sample_rows = _datetime_sample_rows(n_rows) if n_rows else np.array([], dtype=np.int64)
+
+    # ---- Pass 1: statistics ----
+    nulls = dict.fromkeys(names, 0)
+    sums = {}
+    value_counts = {}
+    samples = {}
+    first_values = {}
+    offset = 0
+    for chunk in iter_chunks(raw_path):
+        in_chunk = (sample_rows >= offset) & (sample_rows < offset + len(chunk))
+        for col in names:
+            series = chunk[col]
+            nulls[col] += int(series.isna().sum())
+            if col not in first_values and len(series):
+                first_values[col] = series.iloc[0]
+            if pa.types.is_integer(schema.field(col).type) or pa.types.is_floating(schema.field(col).type):
+                sums[col] = sums.get(col, 0) + series.sum()
+            else:
+                counts = series.value_counts(dropna=True)
+                value_counts[col] = counts if col not in value_counts else value_counts[col].add(counts, fill_value=0)
+                sample = samples.setdefault(col, np.full(len(sample_rows), None, dtype=object))
+                if in_chunk.any():
+                    sample[in_chunk] = series.iloc[sample_rows[in_chunk] - offset].to_numpy(dtype=object)
+        offset += len(chunk)
+
+    dtypes = {col: _whole_column_dtype(schema.field(col), nulls[col]) for col in names}
+    means = {col: sums[col] / (n_rows - nulls[col]) for col in sums if nulls[col] and n_rows > nulls[col]}
+
+    # Object columns: sorted categories (as pd.Categorical sorts them), per-category counts, mode code
+    encoded = {}
+    for col in names:
+        if dtypes[col] not in ("object", "category"):
+            continue
+        counts = value_counts.get(col, pd.Series(dtype="int64"))
+        categories = pd.Categorical(pd.Series(counts.index, dtype=object)).categories
+        category_counts = counts.reindex(categories).to_numpy(dtype=np.int64)
+        mode_code = None
+        if nulls[col]:
+            if len(categories) == 0:
+                categories, category_counts = pd.Index(["Unknown"]), np.zeros(1, dtype=np.int64)
+            mode_code = int(category_counts.argmax())
+            category_counts[mode_code] += nulls[col]
+        encoded[col] = (categories, category_counts, mode_code)
+
+    # Datetime detection on the sample, success rate from the category counts
+    datetime_converted_columns = {}
+    datetime_features_created = {}
+    parsed_categories = {}
+    for col, (categories, category_counts, mode_code) in encoded.items():
+        try:
+            sample = pd.Series(samples.get(col, []), dtype=object)
+            if mode_code is not None:
+                sample = sample.where(sample.notna(), categories[mode_code])
+            fmt = _format_from_sample(sample)
+            if fmt is None:
+                continue
+            parsed = pd.to_datetime(categories, format=fmt, errors="coerce")
+            success_rate = category_counts[parsed.notna()].sum() / n_rows
+            if success_rate <= 0.5:
+                continue
+        except Exception as conv_error:
+            print(f"Could not convert {col} to datetime: {conv_error}")
+            continue
+
+        new_cols = []
+        if (parsed.hour[parsed.notna()] > 0).any():
+            new_cols.append(f"{col}_hour")
+        new_cols.extend([f"{col}_year", f"{col}_month", f"{col}_day", f"{col}_weekday"])
+        # NaT anywhere turns the features into floats, as it does for the whole column
+        feature_dtype = "float64" if parsed.isna().any() else "int32"
+        parsed_categories[col] = (parsed, feature_dtype, f"{col}_hour" in new_cols)
+        datetime_converted_columns[col] = {
+            "original_dtype": "object",
+            "format": fmt,
+            "new_columns_created": new_cols,
+            "success_rate": success_rate,
+            "sample_original": str(first_values[col]) if n_rows > 0 else "N/A"
+        }
+        datetime_features_created[col] = new_cols
+
+    categorical_mappings = {
+        col: {"categories": categories.tolist(), "original_dtype": "object"}
+        for col, (categories, _, _) in encoded.items()
+    }
+
+    # ---- Pass 2: impute, encode, write ----
+    processed_writer = DatasetWriter(
+        processed_path,
+        metadata={
+            "categorical_mappings": categorical_mappings,
+            "datetime_mappings": datetime_converted_columns,
+        },
+    )
+    decoded_writer = DatasetWriter(decoded_path)
+    try:
+        for chunk in iter_chunks(raw_path):
+            processed, decoded, features = {}, {}, {}
+            for col in names:
+                series = chunk[col].astype(dtypes[col], copy=False)
+                if col in encoded:
+                    categories, _, mode_code = encoded[col]
+                    codes = pd.Categorical(series, categories=categories).codes
+                    if mode_code is not None:
+                        codes = np.where(codes < 0, mode_code, codes).astype(codes.dtype)
+                    processed[col] = codes
+                    decoded[col] = _decode(codes, categories, as_category=dtypes[col] == "category")
+                    if col in parsed_categories:
+                        parsed, feature_dtype, with_hour = parsed_categories[col]
+                        converted = parsed.take(codes)
+                        features[f"{col}_year"] = converted.year.to_numpy().astype(feature_dtype)
+                        features[f"{col}_month"] = converted.month.to_numpy().astype(feature_dtype)
+                        features[f"{col}_day"] = converted.day.to_numpy().astype(feature_dtype)
+                        features[f"{col}_weekday"] = converted.weekday.to_numpy().astype(feature_dtype)
+                        if with_hour:
+                            features[f"{col}_hour"] = converted.hour.to_numpy().astype(feature_dtype)
+                elif col in means:
+                    processed[col] = series.fillna(means[col])
+                else:
+                    processed[col] = series
+
+            processed_chunk = pd.DataFrame({**processed, **features})
+            decoded_chunk = pd.DataFrame(
+                {col: decoded.get(col, processed_chunk[col]) for col in processed_chunk.columns}
+            )
+            processed_writer.write(processed_chunk)
+            decoded_writer.write(decoded_chunk)
+        processed_writer.close()
+        decoded_writer.close()
+    except BaseException:
+        processed_writer.abort()
+        decoded_writer.abort()
+        raise
+    save_profile(processed_path)
+    save_profile(decoded_path)
+
+    processed_shape = (n_rows, n_columns + sum(len(cols) for cols in datetime_features_created.values()))
+    decoded_columns = [col for col in names if col in encoded]
+    return _preprocessing_result(
+        original_shape=(n_rows, n_columns),
+        processed_shape=processed_shape,
+        datetime_converted_columns=datetime_converted_columns,
+        datetime_features_created=datetime_features_created,
+        files_created=[processed_path, decoded_path],
+        decoding_status="success",
+        decoding_message=f"Successfully decoded {len(decoded_columns)} categorical columns",
+        decoded_columns=decoded_columns,
+    )
+
 
 @tool("preprocess_and_save_data")
-def preprocess_and_save_data() -> Dict[str, Any]:
+def preprocess_and_save_data(workspace: str) -> Dict[str, Any]:
     """
-    Cleans and prepares the raw dataset for analysis:
+    Cleans and prepares the raw dataset of the given workspace for analysis:
     - Fills missing values (mean for numerics, mode for categoricals)
     - Converts datetime-like columns to numeric timestamps
     - Encodes categorical columns using .cat.codes
-    - Saves cleaned numeric data to 'data/preprocessed_data.csv'
-    - Decodes categorical columns back to original values and saves to 'data/decoded.csv'
+    - Saves cleaned numeric data to 'preprocessed_data.arrow' in the workspace,
+      with the datetime and category mappings in its metadata
+    - Decodes categorical columns back to original values and saves to 'decoded.arrow'
     - Returns mappings for datetime columns and category encodings
     """
 
     try:
-        # Load raw data
-        df = pd.read_csv("data/raw_data.csv")
-        processed_df = df.copy()
+        workspace = resolve_workspace(workspace)
+        processed_path = os.path.join(workspace, PREPROCESSED_DATA)
+        decoded_path = os.path.join(workspace, DECODED_DATA)
+        raw_path = os.path.join(workspace, RAW_DATA)
+
+        # Files too large to hold in memory are processed a chunk at a time
+        if os.path.getsize(raw_path) > CHUNKED_THRESHOLD_BYTES and _chunked_supported(dataset_schema(raw_path)):
+            return json.dumps(_preprocess_chunked(raw_path, processed_path, decoded_path), indent=2)
+
+        # Load raw data (shared with the DataFrame cache: never modified in place)
+        df = load_dataset(raw_path)
+        # dtypes as parsed, before load_user_data compacted them
+        dtypes_on_load = read_metadata(raw_path).get("original_dtypes", {})
+        # Working columns; replaced one by one instead of copying the whole frame
+        columns = {col: df[col] for col in df.columns}
+        # Object columns as (codes, sorted categories), built once and reused by every step
+        encoded = {}
 
         # Store mappings
         datetime_converted_columns = {}
         categorical_mappings = {}
 
-        # 1. Handle missing values
+        # 1. Handle missing values (object columns: one factorize pass gives nulls, mode and codes)
         try:
-            for col in processed_df.columns:
-                if processed_df[col].dtype in ["int64", "float64"]:
-                    if processed_df[col].isnull().any():
-                        # FIXED: Use direct assignment instead of chained inplace operation
-                        processed_df[col] = processed_df[col].fillna(processed_df[col].mean())
-                else:
-                    if processed_df[col].isnull().any():
-                        mode_val = processed_df[col].mode().iloc[0] if not processed_df[col].mode().empty else "Unknown"
-                        # FIXED: Use direct assignment instead of chained inplace operation
-                        processed_df[col] = processed_df[col].fillna(mode_val)
+            for col in df.columns:
+                series = columns[col]
+                if _is_text(series):
+                    try:
+                        categorical = pd.Categorical(series)
+                    except Exception as e:
+                        print(f"Error encoding column {col}: {e}")
+                        continue
+                    codes = categorical.codes
+                    categories = categorical.categories
+                    if (codes < 0).any():
+                        codes, categories = _fill_codes_with_mode(codes, categories)
+                        columns[col] = pd.Series(categories.take(codes), index=series.index, name=col)
+                    encoded[col] = (codes, categories)
+                elif series.isna().any():
+                    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                        columns[col] = series.fillna(series.mean())
+                    else:
+                        modes = series.mode()
+                        columns[col] = series.fillna(modes.iloc[0] if not modes.empty else "Unknown")
         except Exception as e:
             print(f"Error filling missing values: {e}")
 
         # 2. Convert likely datetime columns and create datetime features
+        datetime_features_created = {}
+        new_feature_columns = {}
         try:
-            datetime_features_created = {}
-            
-            for col in processed_df.columns:
-                # Skip if already numeric
-                if processed_df[col].dtype in ["int64", "float64"]:
-                    continue
-                    
+            for col in df.columns:
+                series = columns[col]
+
                 try:
-                    # FIXED: Suppress the specific datetime format warning
-                    with warnings.catch_warnings():
-                        warnings.filterwarnings("ignore", message="Could not infer format.*")
-                        # Try to convert to datetime with more flexible approach
-                        converted = pd.to_datetime(processed_df[col], errors="coerce")
-                    
+                    if pd.api.types.is_datetime64_any_dtype(series):
+                        fmt = None
+                        converted = series
+                    elif _is_text(series):
+                        # Test a sample first; columns without a consistent format are skipped
+                        fmt = _infer_datetime_format(series)
+                        if fmt is None:
+                            continue
+                        if col in encoded:
+                            # Parse each distinct value once and broadcast by category code
+                            codes, categories = encoded[col]
+                            parsed = pd.to_datetime(categories, format=fmt, errors="coerce")
+                            converted = pd.Series(parsed.take(codes), index=series.index)
+                        else:
+                            converted = pd.to_datetime(series, format=fmt, errors="coerce")
+                    else:
+                        continue
+
                     # Check if conversion was meaningful (more than 50% successful)
                     success_rate = converted.notna().sum() / len(converted)
-                    
+
                     if success_rate > 0.5:  # If more than 50% converted successfully
-                        # Create new datetime feature columns
-                        new_cols = []
-                        
                         # Add year, month, day for trend analysis
-                        processed_df[f"{col}_year"] = converted.dt.year
-                        processed_df[f"{col}_month"] = converted.dt.month
-                        processed_df[f"{col}_day"] = converted.dt.day
-                        processed_df[f"{col}_weekday"] = converted.dt.weekday
-                        
+                        features = {
+                            f"{col}_year": converted.dt.year,
+                            f"{col}_month": converted.dt.month,
+                            f"{col}_day": converted.dt.day,
+                            f"{col}_weekday": converted.dt.weekday,
+                        }
+                        new_cols = []
+
                         # Add time components if time info exists
-                        if converted.dt.hour.notna().any() and converted.dt.hour.sum() > 0:
-                            processed_df[f"{col}_hour"] = converted.dt.hour
+                        hours = converted.dt.hour
+                        if hours.notna().any() and hours.sum() > 0:
+                            features[f"{col}_hour"] = hours
                             new_cols.append(f"{col}_hour")
-                        
+
                         new_cols.extend([f"{col}_year", f"{col}_month", f"{col}_day", f"{col}_weekday"])
-                        
+                        new_feature_columns.update(features)
+
                         # Store info about what was created
                         datetime_converted_columns[col] = {
-                            "original_dtype": str(df[col].dtype),
+                            "original_dtype": dtypes_on_load.get(col, str(df[col].dtype)),
+                            "format": fmt,
                             "new_columns_created": new_cols,
                             "success_rate": success_rate,
                             "sample_original": str(df[col].iloc[0]) if len(df) > 0 else "N/A"
                         }
-                        
+
                         datetime_features_created[col] = new_cols
-                                                
+
                 except Exception as conv_error:
                     print(f"Could not convert {col} to datetime: {conv_error}")
                     continue
-                    
+
         except Exception as e:
             print(f"Error converting datetime columns: {e}")
 
-        # 3. Encode categorical columns
+        # 3. Encode categorical columns (codes computed in step 1)
         try:
-            # Get remaining object columns
-            cat_cols = processed_df.select_dtypes(include="object").columns.tolist()
-            
-            for col in cat_cols:
-                try:
-                    # Store original categories before encoding
-                    processed_df[col] = processed_df[col].astype("category")
-                    categorical_mappings[col] = {
-                        "categories": processed_df[col].cat.categories.tolist(),
-                        "original_dtype": "object"
-                    }
-                    
-                    # Encode to numeric codes
-                    processed_df[col] = processed_df[col].cat.codes
-                                        
-                except Exception as e:
-                    print(f"Error encoding column {col}: {e}")
-                    continue
-                    
+            for col, (codes, categories) in encoded.items():
+                categorical_mappings[col] = {
+                    "categories": categories.tolist(),
+                    "original_dtype": "object"
+                }
+                columns[col] = pd.Series(codes, index=df.index, name=col)
         except Exception as e:
             print(f"Error encoding categorical columns: {e}")
 
+        processed_df = pd.DataFrame({**columns, **new_feature_columns})
+
         # 4. Final data validation
         try:
             # Ensure all columns are numeric
             for col in processed_df.columns:
                 if not pd.api.types.is_numeric_dtype(processed_df[col]):
-                    # print(f"Warning: {col} is not numeric, attempting conversion")
                     processed_df[col] = pd.to_numeric(processed_df[col], errors='coerce').fillna(0)
-                    
+
         except Exception as e:
             print(f"Error in final validation: {e}")
 
-        # 5. Remove previous preprocessed file if exists
-        processed_path = "data/preprocessed_data.csv"
-        if os.path.exists(processed_path):
-            os.remove(processed_path)
+        # 5-7. Save processed data with its mappings (replaces any previous file atomically)
+        write_dataset(
+            processed_df,
+            processed_path,
+            metadata={
+                "categorical_mappings": categorical_mappings,
+                "datetime_mappings": datetime_converted_columns,
+            },
+        )
+        save_profile(processed_path)
 
-        # 6. Save processed data
-        processed_df.to_csv(processed_path, index=False)
-        
-        # 7. Save mappings to JSON files in data folder
-        try:
-            # Create data directory if it doesn't exist
-            os.makedirs("data", exist_ok=True)
-            
-            # Define all file paths
-            categorical_mappings_path = "data/categorical_mappings.json"
-            datetime_mappings_path = "data/datetime_mappings.json"
-            
-            # Remove existing JSON files if they exist
-            for json_path in [categorical_mappings_path, datetime_mappings_path]:
-
-                if os.path.exists(json_path):
-                    os.remove(json_path)
-                    # print(f"Removed existing file: {json_path}")
-            
-            # Save categorical mappings
-            with open(categorical_mappings_path, 'w') as f:
-                json.dump(categorical_mappings, f, indent=2)
-
-            
-            # Save datetime mappings
-            with open(datetime_mappings_path, 'w') as f:
-                json.dump(datetime_converted_columns, f, indent=2)
-            
-            
-        except Exception as e:
-            print(f"Error saving mappings to JSON files: {e}")
-
-        # 8. NEW: Decode categorical columns back and save as decoded.csv
+        # 8. NEW: Decode categorical columns back and save as decoded.arrow
         decoded_columns = []
         decoding_status = "success"
         decoding_message = ""
-        
+
         try:
-            decoded_df = processed_df.copy()
-            
-            # Decode each categorical column back to original values
-            for col, mapping_info in categorical_mappings.items():
-                try:
-                    categories = mapping_info['categories']
-                    
-                    # Convert encoded values back to original categories
-                    decoded_values = []
-                    for code in decoded_df[col]:
-                        if pd.isna(code) or code == -1:
-                            decoded_values.append(pd.NA)
-                        elif 0 <= code < len(categories):
-                            decoded_values.append(categories[int(code)])
-                        else:
-                            decoded_values.append(f"Unknown_Code_{code}")
-                    
-                    decoded_df[col] = decoded_values
+            decoded = {}
+            for col in processed_df.columns:
+                if col in encoded:
+                    codes, categories = encoded[col]
+                    # Vectorised lookup of every code in the category index
+                    decoded[col] = _decode(codes, categories, as_category=isinstance(df[col].dtype, pd.CategoricalDtype))
                     decoded_columns.append(col)
-                    
-                except Exception as e:
-                    print(f"Error decoding column {col}: {e}")
-                    continue
-            
-            # Remove existing decoded file if it exists
-            decoded_path = "data/decoded.csv"
-            if os.path.exists(decoded_path):
-                os.remove(decoded_path)
-            
+                else:
+                    decoded[col] = processed_df[col]
+            decoded_df = pd.DataFrame(decoded, index=processed_df.index)
+
             # Save decoded data
-            decoded_df.to_csv(decoded_path, index=False)
+            write_dataset(decoded_df, decoded_path)
+            save_profile(decoded_path)
             decoding_message = f"Successfully decoded {len(decoded_columns)} categorical columns"
-            
+
         except Exception as e:
             decoding_status = "error"
             decoding_message = f"Error during decoding: {str(e)}"
             decoded_path = None
 
-        result: Dict[str, Any] = {
-            "status": "success",
-            "message": "Preprocessing completed and decoded data saved to decoded.csv",
-            "original_shape": list(df.shape),
-            "processed_shape": list(processed_df.shape),
-            "datetime_converted_columns": datetime_converted_columns,
-            "datetime_features_created": datetime_features_created,
-            # "categorical_mappings": categorical_mappings,
-            "total_columns": len(processed_df.columns),
-            "files_created": [
-                "data/preprocessed_data.csv",
-                "data/categorical_mappings.json", 
-                "data/datetime_mappings.json"
-            ],
-            # NEW: Decoding information
-            "decoding_status": decoding_status,
-            "decoding_message": decoding_message,
-            "decoded_columns": decoded_columns,
-            "total_decoded_columns": len(decoded_columns)
-        }
-        
+        files_created = [processed_path]
         # Add decoded file to files_created if successful
         if decoding_status == "success" and decoded_path:
-            result["files_created"].append("data/decoded.csv")
+            files_created.append(decoded_path)
+
+        result = _preprocessing_result(
+            original_shape=df.shape,
+            processed_shape=processed_df.shape,
+            datetime_converted_columns=datetime_converted_columns,
+            datetime_features_created=datetime_features_created,
+            files_created=files_created,
+            decoding_status=decoding_status,
+            decoding_message=decoding_message,
+            decoded_columns=decoded_columns,
+        )
 
         return json.dumps(result, indent=2)
     
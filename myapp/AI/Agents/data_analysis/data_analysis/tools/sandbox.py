@@ -0,0 +1,401 @@
+"""
+Process-pool sandbox for generated analysis and visualization code.
+
+LLM-generated pandas code used to be exec'd inside the web worker, where
+one runaway groupby or apply could take the whole process down. It now
+runs in a pool of SANDBOX_WORKERS pre-started processes (forkserver, with
+this module and pandas preloaded). Every web worker starts its own pool, so
+a deployment can use up to web workers x SANDBOX_WORKERS x SANDBOX_MEMORY_MB
+of memory; the default of 2 keeps that bounded, raise it on dedicated hosts.
+
+  * each worker's heap is capped at SANDBOX_MEMORY_MB (RLIMIT_DATA, so the
+    memory-mapped dataset files don't count; RLIMIT_AS where that's missing)
+    and each execution at SANDBOX_CPU_SECONDS of CPU time (RLIMIT_CPU);
+  * an execution that doesn't answer within SANDBOX_TIMEOUT seconds is
+    killed, and a worker that dies is replaced (also when it died while
+    idle, e.g. preloading a dataset);
+  * a request that finds no idle worker within SANDBOX_QUEUE_TIMEOUT
+    seconds fails with a "sandbox busy" error instead of waiting forever;
+  * workers map the datasets' Arrow files read-only through their own
+    DataFrame cache (numeric columns are not even copied, see
+    dataset_store.read_dataset) and run each execution on a copy-on-write
+    view, so its start-up cost doesn't grow with the dataset;
+    `preload_dataset` lets idle workers load one while its code is being
+    generated;
+  * figures are downsampled to the chart point budgets before they are
+    pickled (see downsample.py);
+  * results come back as Arrow IPC tables (pickle for anything else).
+
+SANDBOX_WORKERS=0 runs the code in-process, without limits, e.g. for local
+development on platforms without fork.
+"""
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, only the timeout applies
+    resource = None
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_store import load_dataset
+from myapp.AI.Agents.data_analysis.data_analysis.tools.downsample import downsample_figure
+
+# Per web worker (see above)
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", "2"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "4096"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "60"))
+SANDBOX_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "120"))
+SANDBOX_QUEUE_TIMEOUT = float(os.getenv("SANDBOX_QUEUE_TIMEOUT", "30"))
+
+SAFE_BUILTINS = {
+    'print': print, 'len': len, 'range': range,
+    'min': min, 'max': max, 'sum': sum,
+    'sorted': sorted, 'abs': abs, 'round': round,
+    'str': str, 'int': int, 'float': float, 'list': list
+}
+
+# Variables the analysis code may leave its answer in, in order of preference
+RESULT_VARIABLES = ['result', 'analysis_result', 'output', 'venue_stats', 'final_result']
+
+
+class SandboxError(Exception):
+    """Generated code failed, timed out or was stopped by a resource limit."""
+
+
+# ---- Execution (inside a worker) ----
+
+def _as_loaded(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` with its categorical columns as the object columns pd.read_csv gave.
+    Categoricals only save memory in storage and in the DataFrame cache;
+    generated code uses them like text (fillna with a new label, string
+    concatenation), which categoricals reject. The conversion takes each
+    row's pointer to a shared category string, it doesn't copy the text.
+    """
+    categorical = [col for col, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    if not categorical or df.columns.has_duplicates:
+        return df
+    return df.astype({col: object for col in categorical})
+
+
+def _private_view(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The frame generated code gets. Workers run with copy-on-write, so a
+    shallow copy costs nothing whatever the dataset size: columns stay shared
+    with the cached (possibly memory-mapped) frame until the code writes to
+    them, and only those are copied.
+    """
+    if pd.options.mode.copy_on_write:
+        return _as_loaded(df).copy(deep=False)
+    return _as_loaded(df.copy())
+
+
+def _run_analysis(code: str, df: pd.DataFrame):
+    context = {
+        'df': _private_view(df),
+        'pd': pd,
+        'np': np,
+        **SAFE_BUILTINS
+    }
+
+    if '\n' not in code and '=' not in code:
+        return eval(code, context)
+
+    exec(code, context)
+    for var_name in RESULT_VARIABLES:
+        if var_name in context:
+            return context[var_name]
+    # If no explicit result variable, check if df was modified
+    if not context['df'].equals(_as_loaded(df)):
+        return context['df']
+    # Look for any DataFrame/Series variables created
+    for var_name, var_value in context.items():
+        if var_name not in ['df', 'pd', 'np'] and not var_name.startswith('__'):
+            if isinstance(var_value, (pd.DataFrame, pd.Series)) and len(var_value) > 0:
+                return var_value
+    return "Code executed successfully - no output variable found"
+
+
+def _run_visualization(code: str, df: pd.DataFrame):
+    import matplotlib.pyplot as plt
+    import plotly.express as px
+    import plotly.graph_objects as go
+    import seaborn as sns
+
+    context = {
+        'df': _private_view(df),
+        'pd': pd,
+        'np': np,
+        'px': px,
+        'go': go,
+        'plt': plt,
+        'sns': sns
+    }
+    try:
+        exec(code, context)
+        fig = context.get('fig')
+        # seaborn hands back Axes; ship the figure they are drawn on
+        if fig is not None and not hasattr(fig, 'savefig') and hasattr(fig, 'get_figure'):
+            fig = fig.get_figure()
+        # Bound the points before the figure is shipped and rendered
+        if fig is not None:
+            fig = downsample_figure(fig)
+        # Only the table the code plotted travels back; never the whole dataset
+        filtered_data = context.get('filtered_data')
+        if not isinstance(filtered_data, (pd.DataFrame, pd.Series)):
+            filtered_data = None
+        return pickle.dumps(fig), filtered_data
+    finally:
+        plt.close('all')
+
+
+def _pack(value):
+    """Serialize a result: Arrow IPC for tables, pickle for the rest."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        # Arrow gives the frame back unchanged only with plain string column labels
+        if frame.columns.dtype == object and all(isinstance(label, str) for label in frame.columns):
+            try:
+                table = pa.Table.from_pandas(frame)
+                sink = pa.BufferOutputStream()
+                with pa.ipc.new_stream(sink, table.schema) as writer:
+                    writer.write_table(table)
+                return ("arrow", isinstance(value, pd.Series), sink.getvalue().to_pybytes())
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                pass
+    try:
+        return ("pickle", pickle.dumps(value))
+    except Exception:
+        return ("pickle", pickle.dumps(str(value)))
+
+
+def _unpack(packed):
+    if packed[0] == "arrow":
+        _, is_series, data = packed
+        frame = pa.ipc.open_stream(data).read_all().to_pandas()
+        return frame.iloc[:, 0] if is_series else frame
+    return pickle.loads(packed[1])
+
+
+def execute_code(kind: str, code: str, data_path: str) -> dict:
+    """Run `code` on the dataset at `data_path`; the outcome is packed for the trip back."""
+    df = load_dataset(data_path)
+    if kind == "analysis":
+        outcome = {"result": _pack(_run_analysis(code, df))}
+    elif kind == "visualization":
+        fig, filtered_data = _run_visualization(code, df)
+        outcome = {"fig": fig, "filtered_data": _pack(filtered_data)}
+    else:
+        raise ValueError(f"Unknown code kind: {kind}")
+    outcome["data_shape"] = list(df.shape)
+    return outcome
+
+
+def _unpack_outcome(outcome: dict) -> dict:
+    unpacked = {"data_shape": outcome["data_shape"]}
+    if "result" in outcome:
+        unpacked["result"] = _unpack(outcome["result"])
+    if "fig" in outcome:
+        unpacked["fig"] = pickle.loads(outcome["fig"])
+        unpacked["filtered_data"] = _unpack(outcome["filtered_data"])
+    return unpacked
+
+
+def _limit_memory(memory_bytes: int) -> None:
+    if resource is None:
+        return
+    limit = getattr(resource, "RLIMIT_DATA", None) or resource.RLIMIT_AS
+    # The hard limit too, so generated code can't raise it
+    resource.setrlimit(limit, (memory_bytes, memory_bytes))
+
+
+def _limit_cpu(cpu_seconds: int) -> None:
+    """Allow `cpu_seconds` more CPU time; past it the kernel stops the worker (SIGXCPU)."""
+    if resource is None:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = usage.ru_utime + usage.ru_stime
+    resource.setrlimit(resource.RLIMIT_CPU, (int(used) + cpu_seconds, resource.RLIM_INFINITY))
+
+
+def _worker_main(conn, memory_bytes: int, cpu_seconds: int) -> None:
+    _limit_memory(memory_bytes)
+    # Generated code then works on views of the cached datasets (see _private_view)
+    pd.set_option("mode.copy_on_write", True)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message[0] == "preload":
+            # A fresh CPU allowance, not whatever the last execution left over
+            _limit_cpu(cpu_seconds)
+            try:
+                load_dataset(message[1])
+            except Exception as e:
+                print(f"⚠️ Sandbox could not preload {message[1]}: {e}")
+            continue
+
+        _, kind, code, data_path = message
+        _limit_cpu(cpu_seconds)
+        try:
+            reply = ("ok", execute_code(kind, code, data_path))
+        except MemoryError:
+            reply = ("error", f"Execution stopped: memory limit of {memory_bytes // (1024 * 1024)} MB exceeded")
+        except Exception as e:
+            reply = ("error", str(e))
+        conn.send(reply)
+
+
+# ---- Pool (in the web worker) ----
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+
+    def stop(self) -> None:
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+
+
+class SandboxPool:
+    """
+    Fixed-size pool of sandbox processes. `run` checks out an idle worker
+    (waiting at most `queue_timeout` seconds for one), waits at most
+    `timeout` seconds for its answer and replaces it if it was killed or
+    had to be stopped.
+    """
+
+    def __init__(self, size: int, memory_bytes: int, cpu_seconds: int, timeout: float, queue_timeout: float):
+        self.size = size
+        self.memory_bytes = memory_bytes
+        self.cpu_seconds = cpu_seconds
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._ctx = multiprocessing.get_context(method)
+        if method == "forkserver":
+            # Workers fork from a server that already imported pandas and this module
+            self._ctx.set_forkserver_preload([__name__])
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.memory_bytes, self.cpu_seconds),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def _checkout(self) -> _Worker:
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            raise SandboxError(
+                f"Sandbox busy: all {self.size} workers stayed in use for {self.queue_timeout:.0f}s, try again shortly"
+            )
+        if not worker.process.is_alive():
+            # Died while idle (e.g. stopped by a limit while preloading)
+            worker.stop()
+            worker = self._spawn()
+        return worker
+
+    def run(self, kind: str, code: str, data_path: str) -> dict:
+        worker = self._checkout()
+        healthy = False
+        try:
+            worker.conn.send(("run", kind, code, data_path))
+            if not worker.conn.poll(self.timeout):
+                raise SandboxError(f"Execution timed out after {self.timeout:.0f}s")
+            status, payload = worker.conn.recv()
+            healthy = True
+        except (EOFError, OSError):
+            raise SandboxError(
+                f"Execution stopped: the code exceeded the sandbox limits "
+                f"({self.cpu_seconds}s CPU, {self.memory_bytes // (1024 * 1024)} MB)"
+            )
+        finally:
+            if not healthy:
+                worker.stop()
+                worker = self._spawn()
+            self._idle.put(worker)
+
+        if status != "ok":
+            raise SandboxError(payload)
+        return _unpack_outcome(payload)
+
+    def preload(self, data_path: str) -> None:
+        """Have the idle workers load `data_path` into their DataFrame cache."""
+        workers = []
+        while True:
+            try:
+                workers.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for worker in workers:
+            try:
+                worker.conn.send(("preload", data_path))
+            except OSError:
+                worker.stop()
+                worker = self._spawn()
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                return
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sandbox_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(
+                SANDBOX_WORKERS,
+                SANDBOX_MEMORY_MB * 1024 * 1024,
+                SANDBOX_CPU_SECONDS,
+                SANDBOX_TIMEOUT,
+                SANDBOX_QUEUE_TIMEOUT,
+            )
+        return _pool
+
+
+def preload_dataset(data_path: str) -> None:
+    if SANDBOX_WORKERS > 0:
+        get_sandbox_pool().preload(data_path)
+
+
+def run_generated_code(kind: str, code: str, data_path: str) -> dict:
+    """
+    Execute analysis or visualization code on a dataset and return
+    {"data_shape", "result"} or {"data_shape", "fig", "filtered_data"}
+    (filtered_data is None when the code didn't set a DataFrame or Series).
+    Raises SandboxError if the code fails, times out or hits a limit.
+    """
+    if SANDBOX_WORKERS <= 0:
+        try:
+            return _unpack_outcome(execute_code(kind, code, data_path))
+        except Exception as e:
+            raise SandboxError(str(e)) from e
+    return get_sandbox_pool().run(kind, code, data_path)
@@ -8,12 +8,15 @@ import seaborn as sns
 import base64
 import io
 from crewai.tools import tool
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, Optional, Tuple
 import json
 import os
 from crewai import LLM
 from dotenv import load_dotenv
 from myapp.AI.Agents.data_analysis.data_analysis.tools.classifier import get_data_path_from_query
+from myapp.AI.Agents.data_analysis.data_analysis.tools.code_cache import run_with_code_cache
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_profile import dataset_profile
+from myapp.AI.Agents.data_analysis.data_analysis.tools.sandbox import preload_dataset, run_generated_code
 from datetime import datetime
 import warnings
 
@@ -44,16 +47,16 @@ OUTPUT_FOLDER = "output"
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 @tool("generate_and_execute_visualization")
-def generate_and_execute_visualization(user_query: str) -> Dict[str, Any]:
+def generate_and_execute_visualization(user_query: str, workspace: str) -> Dict[str, Any]:
     """
     Generate visualization code using Plotly, Matplotlib, or Seaborn based on query requirements.
-    Uses intelligent dataset selection and provides insights from visualized data.
+    Uses intelligent dataset selection within the given workspace and provides insights from visualized data.
     Saves visualizations to output folder with datetime stamps.
     """
     
     try:
         # Get appropriate data path using your existing logic
-        data_path = get_data_path_from_query(user_query)
+        data_path = get_data_path_from_query(user_query, workspace)
         
         if not os.path.exists(data_path):
             return {
@@ -67,11 +70,11 @@ def generate_and_execute_visualization(user_query: str) -> Dict[str, Any]:
                 "insights": ""
             }
 
-        # Load the data
-        df = pd.read_csv(data_path)
+        # Sandbox workers load the data while the code is being generated
+        preload_dataset(data_path)
         
         # Build schema for visualization
-        schema = _build_viz_schema(df, data_path)
+        schema = _build_viz_schema(dataset_profile(data_path), data_path)
         
         # Validate LLM availability
         if llm is None:
@@ -86,20 +89,31 @@ def generate_and_execute_visualization(user_query: str) -> Dict[str, Any]:
                 "insights": ""
             }
 
-        # Generate visualization code
-        viz_code, viz_library = _generate_visualization_code(user_query, schema)
-        
-        # Execute the visualization code
-        execution_result = _execute_viz_code_safely(
-            code=viz_code,
-            df=df,
-            viz_library=viz_library,
-            user_query=user_query,
-            data_source=data_path
+        # Generate visualization code and execute it; code that already
+        # answered this query on the same schema is reused
+        def generate():
+            viz_code, viz_library = _generate_visualization_code(user_query, schema)
+            return {"code": viz_code, "viz_library": viz_library}
+
+        execution_result = run_with_code_cache(
+            "visualization",
+            user_query,
+            schema,
+            data_path,
+            getattr(llm, "model", ""),
+            generate=generate,
+            execute=lambda entry: _execute_viz_code_safely(
+                code=entry["code"],
+                data_shape=schema["shape"],
+                viz_library=entry.get("viz_library", "plotly"),
+                user_query=user_query,
+                data_source=data_path
+            ),
         )
+        viz_library = execution_result["library_used"]
         
         # Generate insights from the visualization data
-        if execution_result["status"] == "success" and execution_result.get("filtered_data") is not None:
+        if execution_result["status"] == "success":
             insights = _generate_viz_insights(
                 user_query, 
                 execution_result["filtered_data"], 
@@ -121,43 +135,41 @@ def generate_and_execute_visualization(user_query: str) -> Dict[str, Any]:
             "insights": ""
         }
 
-def _build_viz_schema(df: pd.DataFrame, data_path: str) -> dict:
+def _build_viz_schema(profile: dict, data_path: str) -> dict:
     """Build schema information optimized for visualization generation."""
     
+    # From the profile stored with the dataset (no pass over the data)
     schema = {
-        "shape": list(df.shape),
-        "columns": list(df.columns),
-        "dtypes": df.dtypes.apply(str).to_dict(),
-        "sample_data": df.head(3).to_dict(),
+        "shape": profile["shape"],
+        "columns": profile["columns"],
+        "dtypes": profile["dtypes"],
+        "sample_data": profile["sample_data"],
         "is_decoded": "decoded" in data_path.lower()
     }
     
-    # Identify column types for better viz generation
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
     datetime_cols = []
     
     # Detect potential datetime columns
-    for col in df.columns:
+    for col in profile["columns"]:
         if any(keyword in col.lower() for keyword in ['date', 'time', 'created', 'updated', 'timestamp']):
             datetime_cols.append(col)
     
-    # Get unique value counts for categorical columns (for better chart selection)
-    categorical_info = {}
-    for col in categorical_cols:
-        unique_count = df[col].nunique()
-        if unique_count <= 20:  # Only for manageable categories
-            categorical_info[col] = {
-                "unique_count": unique_count,
-                "top_values": df[col].value_counts().head(10).to_dict()
-            }
+    # Get unique value counts for categorical columns (for better chart selection);
+    # the profile lists top values only for manageable categories (<= 20)
+    categorical_info = {
+        col: {
+            "unique_count": profile["unique_counts"][col],
+            "top_values": top_values
+        }
+        for col, top_values in profile["top_values"].items()
+    }
     
     schema.update({
-        "numeric_columns": numeric_cols,
-        "categorical_columns": categorical_cols,
+        "numeric_columns": profile["numeric_columns"],
+        "categorical_columns": profile["categorical_columns"],
         "potential_datetime_columns": datetime_cols,
         "categorical_info": categorical_info,
-        "data_ranges": {col: [df[col].min(), df[col].max()] for col in numeric_cols}
+        "data_ranges": profile["data_ranges"]
     })
     
     return schema
@@ -256,12 +268,12 @@ def _generate_visualization_code(query: str, schema: dict) -> Tuple[str, str]:
 
 def _execute_viz_code_safely(
     code: str,
-    df: pd.DataFrame,
+    data_shape: list,
     viz_library: str,
     user_query: str,
     data_source: str
 ) -> dict:
-    """Execute visualization code safely and return results."""
+    """Execute visualization code safely, in a resource-limited sandbox worker, and return results."""
     
     # Security check
     if any(pattern in code.lower() for pattern in DANGEROUS_PATTERNS):
@@ -278,23 +290,14 @@ def _execute_viz_code_safely(
         }
 
     try:
-        # Prepare execution context
-        context = {
-            'df': df.copy(),
-            'pd': pd,
-            'np': np,
-            'px': px,
-            'go': go,
-            'plt': plt,
-            'sns': sns
-        }
-        
-        # Execute the code
-        exec(code, context)
+        # Execute the code on the worker's copy of the dataset
+        outcome = run_generated_code("visualization", code, data_source)
         
         # Extract results
-        fig = context.get('fig')
-        filtered_data = context.get('filtered_data', df)
+        fig = outcome["fig"]
+        filtered_data = outcome["filtered_data"]
+        if isinstance(filtered_data, pd.Series):
+            filtered_data = filtered_data.to_frame()
         
         if fig is None:
             return {
@@ -320,12 +323,12 @@ def _execute_viz_code_safely(
             "visualization_path": viz_path,
             "data_used": f"{os.path.basename(data_source)} ({'decoded/preprocessed' if 'decoded' in data_source else 'raw'})",
             "library_used": viz_library,
-            "data_shape": list(df.shape),
+            "data_shape": outcome["data_shape"],
             "filtered_data_info": {
                 "shape": list(filtered_data.shape),
                 "columns": list(filtered_data.columns),
                 "sample": filtered_data.head(3).to_dict() if not filtered_data.empty else {}
-            },
+            } if filtered_data is not None else None,
             "filtered_data": filtered_data,  # Keep original for internal use
             "data_note": "To use raw data instead, specify 'use raw data' in your query"
         }
@@ -420,11 +423,13 @@ def _save_and_convert_visualization(fig, viz_library: str, user_query: str) -> t
     
     return {"type": "unknown", "data": str(fig)}, None
 
-def _generate_viz_insights(user_query: str, filtered_data: pd.DataFrame, viz_library: str) -> str:
+def _generate_viz_insights(user_query: str, filtered_data: Optional[pd.DataFrame], viz_library: str) -> str:
     """Generate insights from the visualized data."""
     
     if llm is None:
         return f"Visualization created for: {user_query}. LLM not available for insights generation."
+    if filtered_data is None:
+        return f"Visualization created for: {user_query}. The chart code kept no 'filtered_data', so there is no data summary to draw insights from."
     
     # Prepare data summary for insights
     data_summary = {
@@ -432,7 +437,7 @@ def _generate_viz_insights(user_query: str, filtered_data: pd.DataFrame, viz_lib
         "columns": list(filtered_data.columns),
         "numeric_summary": filtered_data.describe().to_dict() if len(filtered_data.select_dtypes(include=[np.number]).columns) > 0 else {},
         "categorical_counts": {col: filtered_data[col].value_counts().head(5).to_dict() 
-                             for col in filtered_data.select_dtypes(include=['object']).columns[:3]}
+                             for col in filtered_data.select_dtypes(include=['object', 'category']).columns[:3]}
     }
     
     prompt = f"""
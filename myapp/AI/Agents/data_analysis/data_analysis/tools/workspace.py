@@ -0,0 +1,108 @@
+"""
+Per-dataset workspaces for the data analysis crew.
+
+Every uploaded dataset gets its own directory, data/workspaces/<digest>/,
+named after a hash of the file's contents. The tools read and write the
+raw, preprocessed and decoded copies there (Arrow IPC files, see
+dataset_store.py) instead of shared files under data/, so concurrent
+analyses never touch each other's files and any worker can serve any
+request. Files are written to a temporary name and renamed, so readers
+never see a half-written dataset.
+
+A workspace is touched whenever an upload maps to it, and removed once it
+has not been used for DATA_WORKSPACE_TTL seconds
+(`manage.py data_workspaces purge`).
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+
+WORKSPACE_ROOT = os.getenv("DATA_WORKSPACE_ROOT", os.path.join("data", "workspaces"))
+WORKSPACE_TTL = int(os.getenv("DATA_WORKSPACE_TTL", 7 * 24 * 3600))
+
+RAW_DATA = "raw_data.arrow"
+PREPROCESSED_DATA = "preprocessed_data.arrow"  # categorical/datetime mappings live in its schema metadata
+DECODED_DATA = "decoded.arrow"
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{16,64}$")
+
+
+def dataset_digest(path: str) -> str:
+    """Content hash of the uploaded file; identical uploads share a workspace."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    # The extension is part of the key: the same bytes parse differently as CSV or JSON
+    digest.update(os.path.splitext(path)[1].lower().encode())
+    return digest.hexdigest()[:24]
+
+
+def prepare_workspace(dataset_path: str) -> str:
+    """Create (or reuse) the workspace for `dataset_path` and return its path."""
+    workspace = os.path.join(WORKSPACE_ROOT, dataset_digest(dataset_path))
+    os.makedirs(workspace, exist_ok=True)
+    # A reused workspace counts as fresh for purge_workspaces
+    os.utime(workspace)
+    return workspace
+
+
+def resolve_workspace(workspace: str) -> str:
+    """
+    Map the workspace an agent passed to a tool back to a directory under
+    WORKSPACE_ROOT. Accepts the full path or just the digest; anything else
+    raises ValueError, so a tool can never be pointed outside the root.
+    """
+    digest = os.path.basename(os.path.normpath((workspace or "").strip().strip("'\"")))
+    if not _DIGEST_RE.match(digest):
+        raise ValueError(f"Invalid workspace: {workspace!r}")
+    path = os.path.join(WORKSPACE_ROOT, digest)
+    if not os.path.isdir(path):
+        raise ValueError(f"Workspace {digest} does not exist; load the dataset first")
+    return path
+
+
+def workspace_file(workspace: str, name: str) -> str:
+    return os.path.join(resolve_workspace(workspace), name)
+
+
+def purge_workspaces(max_age: float = WORKSPACE_TTL) -> int:
+    """Remove workspaces unused for `max_age` seconds (all of them for 0). Returns the number removed."""
+    if not os.path.isdir(WORKSPACE_ROOT):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(WORKSPACE_ROOT):
+        if entry.is_dir() and _DIGEST_RE.match(entry.name) and entry.stat().st_mtime <= cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def analysis_inputs(query: str, file_path: str) -> dict:
+    """Crew inputs for one analysis run; `workspace` is passed on to every tool."""
+    return {
+        "query": query,
+        "file_path": file_path,
+        "workspace": prepare_workspace(file_path),
+    }
+
+
+# ---- Atomic writes ----
+
+def atomic_write(path: str, write):
+    """Call `write(tmp_path)` and move the result to `path` in one step."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.splitext(path)[1])
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
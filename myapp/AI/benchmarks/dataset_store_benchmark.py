@@ -0,0 +1,138 @@
+"""
+Dataset storage benchmark for the data analysis crew.
+
+Tiles the bundled IPL_2008-2024.csv to `--rows` rows (10M by default) and
+times the I/O one analysis run does on its dataset, in both formats the
+workspace has used:
+
+  * csv:   the upload is parsed, written back as raw_data.csv, and parsed
+           again by generate_schema, preprocess_and_save_data and the
+           analysis tool;
+  * arrow: the upload is parsed once, written as raw_data.arrow
+           (tools/dataset_store.py), and memory-mapped by the three readers.
+
+Each operation is timed `--repeat` times and the best run is reported, like
+timeit. Only storage is measured: no LLM, preprocessing or generated code
+runs. 10M rows need roughly 10 GB of RAM; use `--rows` to scale down.
+
+    python -m myapp.AI.benchmarks.dataset_store_benchmark
+    python -m myapp.AI.benchmarks.dataset_store_benchmark --rows 1000000 --json store.json
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_store import read_dataset, read_table, write_dataset
+
+IPL_CSV = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "Agents", "data_analysis", "data_analysis", "IPL_2008-2024.csv",
+)
+
+# Dataset reads after the upload in one run: schema, preprocessing, analysis
+READS_PER_RUN = 3
+
+
+def scale_dataset(source: str, rows: int) -> pd.DataFrame:
+    """Repeat the rows of `source` until there are `rows` of them; ids stay unique."""
+    base = pd.read_csv(source)
+    df = base.iloc[np.arange(rows) % len(base)].reset_index(drop=True)
+    if "id" in df.columns:
+        df["id"] = np.arange(1, rows + 1)
+    return df
+
+
+def _best_of(repeat: int, fn):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(rows: int, repeat: int, workdir: str) -> dict:
+    df = scale_dataset(IPL_CSV, rows)
+    upload = os.path.join(workdir, "upload.csv")
+    df.to_csv(upload, index=False)
+
+    csv_path = os.path.join(workdir, "raw_data.csv")
+    arrow_path = os.path.join(workdir, "raw_data.arrow")
+
+    timings = {}
+    timings["parse_upload"], parsed = _best_of(repeat, lambda: pd.read_csv(upload))
+    timings["csv_write"], _ = _best_of(repeat, lambda: parsed.to_csv(csv_path, index=False))
+    timings["csv_read"], from_csv = _best_of(repeat, lambda: pd.read_csv(csv_path))
+    timings["arrow_write"], _ = _best_of(repeat, lambda: write_dataset(parsed, arrow_path))
+    timings["arrow_read"], from_arrow = _best_of(repeat, lambda: read_dataset(arrow_path))
+    # Mapping alone, before conversion to pandas: what a reader pays for the file itself
+    timings["arrow_map"], _ = _best_of(repeat, lambda: read_table(arrow_path))
+
+    csv_run = timings["parse_upload"] + timings["csv_write"] + READS_PER_RUN * timings["csv_read"]
+    arrow_run = timings["parse_upload"] + timings["arrow_write"] + READS_PER_RUN * timings["arrow_read"]
+
+    return {
+        "rows": rows,
+        "columns": df.shape[1],
+        "repeat": repeat,
+        "sizes_mb": {
+            "csv": os.path.getsize(csv_path) / 1e6,
+            "arrow": os.path.getsize(arrow_path) / 1e6,
+        },
+        "timings_s": timings,
+        "per_run_s": {"csv": csv_run, "arrow": arrow_run},
+        "speedup": csv_run / arrow_run if arrow_run else None,
+        # CSV loses dtypes the parser can't infer; Arrow keeps whatever was written
+        "dtypes_preserved": {
+            "csv": from_csv.dtypes.equals(parsed.dtypes),
+            "arrow": from_arrow.dtypes.equals(parsed.dtypes),
+        },
+    }
+
+
+def _print_report(report: dict) -> None:
+    t = report["timings_s"]
+    print(f"\n=== dataset store: {report['rows']:,} rows x {report['columns']} columns (best of {report['repeat']}) ===")
+    print(f"file size        csv {report['sizes_mb']['csv']:9.1f} MB   arrow {report['sizes_mb']['arrow']:9.1f} MB")
+    print(f"write            csv {t['csv_write']:9.3f} s    arrow {t['arrow_write']:9.3f} s")
+    print(f"read             csv {t['csv_read']:9.3f} s    arrow {t['arrow_read']:9.3f} s (map only {t['arrow_map']:.3f} s)")
+    print(f"upload parse         {t['parse_upload']:9.3f} s")
+    print(
+        f"per analysis run csv {report['per_run_s']['csv']:9.3f} s    arrow {report['per_run_s']['arrow']:9.3f} s"
+        f"   ({report['speedup']:.1f}x, {READS_PER_RUN} reads after upload)"
+    )
+    print(f"dtypes preserved csv {report['dtypes_preserved']['csv']!s:>9}      arrow {report['dtypes_preserved']['arrow']!s:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workdir", help="Directory for the scaled files (default: a temporary directory)")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="dataset-store-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        report = run(args.rows, args.repeat, workdir)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    _print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Preprocessing benchmark for the data analysis crew.
+
+Tiles the bundled IPL_2008-2024.csv to each of `--rows` sizes, stores it as
+a workspace's raw_data.arrow and times `preprocess_and_save_data` on it -
+missing values, datetime features, categorical encoding, decoding and both
+output files. Workspaces are created under a temporary workspace root.
+
+    python -m myapp.AI.benchmarks.preprocess_benchmark
+    python -m myapp.AI.benchmarks.preprocess_benchmark --rows 1000000 5000000 --json preprocess.json
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools import workspace as workspaces
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_store import dataframe_cache, write_dataset
+from myapp.AI.Agents.data_analysis.data_analysis.tools.preprocess_tool import preprocess_and_save_data
+from myapp.AI.Agents.data_analysis.data_analysis.tools.workspace import RAW_DATA
+from myapp.AI.benchmarks.dataset_store_benchmark import IPL_CSV, scale_dataset
+
+
+def run(rows: int, root: str) -> dict:
+    workspace = os.path.join(root, f"{rows:024x}")
+    os.makedirs(workspace, exist_ok=True)
+    df = scale_dataset(IPL_CSV, rows)
+    write_dataset(df, os.path.join(workspace, RAW_DATA))
+    missing = int(df.isna().sum().sum())
+    del df
+    # Start cold, like the first preprocessing of an upload: reading raw_data.arrow is included
+    dataframe_cache.clear()
+
+    start = time.perf_counter()
+    result = preprocess_and_save_data.func(workspace)
+    elapsed = time.perf_counter() - start
+
+    if isinstance(result, str):
+        result = json.loads(result)
+    if result.get("status") != "success":
+        raise RuntimeError(result.get("message"))
+    return {
+        "rows": rows,
+        "missing_values": missing,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed,
+        "decoded_columns": result["total_decoded_columns"],
+        "datetime_columns": list(result["datetime_converted_columns"]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 3_000_000])
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    root = tempfile.mkdtemp(prefix="preprocess-bench-")
+    workspaces.WORKSPACE_ROOT = root
+    try:
+        results = [run(rows, root) for rows in args.rows]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print("\n=== preprocess_and_save_data ===")
+    print(f"{'rows':>12} {'missing':>10} {'seconds':>9} {'rows/s':>12}  datetime columns")
+    for r in results:
+        print(
+            f"{r['rows']:>12,} {r['missing_values']:>10,} {r['seconds']:>9.2f} "
+            f"{r['rows_per_second']:>12,.0f}  {', '.join(r['datetime_columns']) or '-'}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
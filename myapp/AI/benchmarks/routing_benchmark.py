@@ -0,0 +1,385 @@
+"""
+Routing benchmark for the root orchestrator.
+
+Runs the labelled queries in routing_cases.json through
+
+  * the manager path: `manager_agent_function` with its Aurelius crew and
+    planning step, exactly as RootAgentAPIView calls it;
+  * the fast path: the semantic routing cache (myapp/services/routing_cache.py),
+    seeded with the `history` routes, falling back to the manager on a miss;
+
+and reports routing accuracy, LLM calls per query and end-to-end latency.
+
+The specialists are replaced by stub tools with the same names and
+signatures, so only routing is measured. By default the LLMs are replaced
+by `StandInRouterLLM`, a deterministic keyword router that speaks the ReAct
+format crewai expects and sleeps a fixed time per call; results are then
+reproducible and the numbers compare prompt/flow changes (LLM calls,
+latency), not model quality. Use `--llm gemini` to measure real routing
+accuracy with the configured Gemini models. The plan cache is disabled so
+every manager run pays for planning, as a cold run would.
+
+    python -m myapp.AI.benchmarks.routing_benchmark
+    python -m myapp.AI.benchmarks.routing_benchmark --llm gemini --json routing.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+from contextlib import contextmanager
+
+from crewai.llms.base_llm import BaseLLM
+from crewai.tools import tool
+
+CASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_cases.json")
+
+
+# ---- Stub specialists: same tool names and arguments as myapp/AI/main.py ----
+
+def _stub_reply(agent_name: str, query) -> str:
+    return f"[{agent_name}] stub answer for: {query}"
+
+
+@tool
+def qna_agent(user_input: str, context: str = ""):
+    "Tool that wraps a Crew to answer user queries. Pass the relevant conversation so far as context, if any."
+    return _stub_reply("qna", user_input)
+
+
+@tool
+def automation_run(query: str, attachment_file_path: str = "", csv_file: str = ""):
+    """
+    Run the Automation agent crew. Sends email to provided mails. The mails of the reciepients are given in query or in the csv_file """
+    return _stub_reply("auto", query)
+
+
+@tool
+def run_data_analysis(query: str, file_path: str = ""):
+    """Runs the data analysis crew on the uploaded dataset (csv/xlsx) to answer the query."""
+    return _stub_reply("data", query)
+
+
+@tool
+def run_stock(query: str):
+    """Runs the stock decision support crew for questions about stocks and investments."""
+    return _stub_reply("stock", query)
+
+
+@tool
+def run_talent_sourcing(query: str):
+    """Runs the talent sourcing crew to find candidates in the database."""
+    return _stub_reply("talent", query)
+
+
+@tool
+def run_rag_root(query: str, file_path: str = ""):
+    """Runs the RAG research crew for deep research and questions about uploaded documents."""
+    return _stub_reply("rag", query)
+
+
+@tool
+def run_sentiment(file_path: str = "", csv_file: str = ""):
+    """Runs the sentiment analysis crew on the uploaded text or csv file."""
+    return _stub_reply("sentiment", file_path)
+
+
+STUB_TOOLS = {
+    "qna_agent": qna_agent,
+    "automation_run": automation_run,
+    "run_data_analysis": run_data_analysis,
+    "run_stock": run_stock,
+    "run_talent_sourcing": run_talent_sourcing,
+    "run_rag_root": run_rag_root,
+    "run_sentiment": run_sentiment,
+}
+
+
+# ---- Deterministic LLM stand-in ----
+
+# agent -> patterns over the lower-cased query; checked in this order
+ROUTING_RULES = [
+    ("stock", r"\bstocks?\b|\bshares?\b|\binvest|\bticker|\bnvidia\b"),
+    ("talent", r"\bcandidates?\b|\bdevelopers?\b|\bhiring\b|\brecruit|\bshortlist\b"),
+    ("sentiment", r"\bsentiment\b|\bfeeling\b|\bhappy\b|\bangry\b|\breviews?\b|\btone\b"),
+    ("rag", r"\bresearch\b|\bpaper\b|\bcontract\b|\breport\b"),
+    ("data", r"\bdataset\b|\baverage\b|\bchart\b|\bplot\b|\bcorrelation\b|\bcalculate\b|\btop scoring\b"),
+    ("auto", r"\bsend\b|\bemail\b|\bmail\b|[\w.+-]+@[\w-]+\.\w+"),
+    ("qna", r"\bexplain\b|\bwhat is\b|\bwho\b|\bcapital of\b"),
+]
+
+TOOL_FOR_AGENT = {
+    "qna": "qna_agent",
+    "auto": "automation_run",
+    "data": "run_data_analysis",
+    "stock": "run_stock",
+    "talent": "run_talent_sourcing",
+    "rag": "run_rag_root",
+    "sentiment": "run_sentiment",
+}
+
+
+def keyword_route(query: str, attachment: str = "") -> list:
+    """The stand-in's routing decision: every rule that matches, in query order."""
+    text = (query or "").lower()
+    hits = []
+    for agent_name, pattern in ROUTING_RULES:
+        match = re.search(pattern, text)
+        if match:
+            hits.append((match.start(), agent_name))
+    route = [agent_name for _, agent_name in sorted(hits)]
+
+    # "what is" only means QnA when nothing more specific matched before it
+    if "qna" in route and len(route) > 1 and route[0] != "qna":
+        route.remove("qna")
+    if not route:
+        if attachment == "pdf":
+            route = ["rag"]
+        elif attachment in ("csv", "xlsx", "xls"):
+            route = ["data"]
+        else:
+            route = ["qna"]
+    return route
+
+
+def _message_text(message) -> str:
+    return message if isinstance(message, str) else str(message.get("content") or "")
+
+
+class StandInRouterLLM(BaseLLM):
+    """
+    Offline replacement for the Gemini models. Answers the crew planner with a
+    fixed plan and drives the manager through one tool call per routed agent,
+    then a final answer. `latency` seconds are slept per call.
+    """
+
+    def __init__(self, latency: float = 0.25):
+        super().__init__(model="stand-in/keyword-router", temperature=0)
+        self.latency = latency
+        self.calls = 0
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        prompt = "\n".join(_message_text(m) for m in messages)
+
+        if "Task Execution Planner" in prompt:
+            plan = {"list_of_plans_per_task": [{
+                "task": "Route the user request",
+                "plan": "\n1. Read the query. 2. Call the matching specialist tools. 3. Merge their answers.",
+            }]}
+            return "Thought: I now can give a great answer\nFinal Answer: " + json.dumps(plan)
+
+        query = re.search(r"User Query:\s*(.*)", prompt)
+        query = query.group(1).strip() if query else ""
+        attachment = re.search(r"Attachment Metadata:\s*(\S+)", prompt)
+        attachment = attachment.group(1) if attachment and attachment.group(1) != "None" else ""
+        route = keyword_route(query, os.path.splitext(attachment)[1].lstrip(".").lower())
+
+        # One tool call per step; crewai appends each observation to an assistant message
+        step = sum(
+            1 for m in messages
+            if not isinstance(m, str) and m.get("role") == "assistant" and "Observation:" in _message_text(m)
+        )
+        if step < len(route):
+            tool_name = TOOL_FOR_AGENT[route[step]]
+            return (
+                f"Thought: This part of the request belongs to the {route[step]} crew.\n"
+                f"Action: {tool_name}\n"
+                f"Action Input: {json.dumps(_tool_arguments(tool_name, query, attachment))}"
+            )
+        return f"Thought: I now know the final answer\nFinal Answer: Routed to {', '.join(route)}."
+
+
+def _tool_arguments(tool_name: str, query: str, file_path: str) -> dict:
+    if tool_name == "qna_agent":
+        return {"user_input": query}
+    if tool_name == "run_sentiment":
+        return {"file_path": file_path}
+    if tool_name in ("run_data_analysis", "run_rag_root"):
+        return {"query": query, "file_path": file_path}
+    return {"query": query}
+
+
+class _CallCounter:
+    """Counts calls on real LLM objects (--llm gemini)."""
+
+    def __init__(self, *llms):
+        self.calls = 0
+        for llm in llms:
+            original = llm.call
+
+            def counted(*args, _original=original, **kwargs):
+                self.calls += 1
+                return _original(*args, **kwargs)
+
+            llm.call = counted
+
+
+@contextmanager
+def patched_root(llm_mode: str, llm_latency: float):
+    """Swap the specialists (and, by default, the LLMs) of myapp.AI.main for the benchmark."""
+    from myapp.AI import main, plan_cache
+
+    saved = {name: getattr(main, name) for name in [*STUB_TOOLS, "rootllm", "planningllm"]}
+    saved_plan_cache = plan_cache.PLAN_CACHE_ENABLED
+    try:
+        for name, stub in STUB_TOOLS.items():
+            setattr(main, name, stub)
+        if llm_mode == "stand-in":
+            counter = StandInRouterLLM(latency=llm_latency)
+            main.rootllm = main.planningllm = counter
+        else:
+            counter = _CallCounter(main.rootllm, main.planningllm)
+        plan_cache.PLAN_CACHE_ENABLED = False
+        yield main, counter
+    finally:
+        for name, value in saved.items():
+            setattr(main, name, value)
+        plan_cache.PLAN_CACHE_ENABLED = saved_plan_cache
+
+
+# ---- Runner ----
+
+def _attachment_path(case) -> str:
+    return f"benchmark-upload.{case['attachment']}" if case.get("attachment") else None
+
+
+def is_correct(case, route) -> bool:
+    accepted = [case["expected"], *case.get("acceptable", [])]
+    return any(set(route) == set(option) for option in accepted)
+
+
+def _run_manager(main, counter, case):
+    routed = []
+    calls_before = counter.calls
+    started = time.perf_counter()
+    main.manager_agent_function(case["query"], _attachment_path(case), routed_agents=routed)
+    return routed, counter.calls - calls_before, time.perf_counter() - started
+
+
+def run_manager_path(main, counter, cases):
+    results = []
+    for case in cases:
+        route, calls, seconds = _run_manager(main, counter, case)
+        results.append({"id": case["id"], "category": case["category"], "route": route,
+                        "correct": is_correct(case, route), "llm_calls": calls, "seconds": seconds, "cache_hit": False})
+    return results
+
+
+def run_fast_path(main, counter, cases, history, threshold):
+    from myapp.services.routing_cache import RoutingIndex, routing_text
+
+    index = RoutingIndex().fit(
+        [routing_text(item["query"], item["attachment"]) for item in history],
+        [item["agents"] for item in history],
+    )
+    results = []
+    for case in cases:
+        text = routing_text(case["query"], case["attachment"])
+        calls_before = counter.calls
+        started = time.perf_counter()
+        match = index.nearest(text)
+        if match is not None and match.similarity >= threshold:
+            route = list(match.agents)
+            main.dispatch_direct(route, case["query"], _attachment_path(case))
+            calls, seconds, hit = counter.calls - calls_before, time.perf_counter() - started, True
+        else:
+            # Same as production: fall back to the manager and remember its route
+            route, calls, _ = _run_manager(main, counter, case)
+            seconds, hit = time.perf_counter() - started, False
+            if route:
+                index.add(text, route)
+        results.append({"id": case["id"], "category": case["category"], "route": route,
+                        "correct": is_correct(case, route), "llm_calls": calls, "seconds": seconds, "cache_hit": hit})
+    return results
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def summarize(results, cache=False) -> dict:
+    seconds = [r["seconds"] for r in results]
+    summary = {
+        "cases": len(results),
+        "accuracy": round(sum(r["correct"] for r in results) / len(results), 3),
+        "llm_calls_per_query": round(statistics.mean(r["llm_calls"] for r in results), 2),
+        "latency_p50_s": round(_percentile(seconds, 0.5), 3),
+        "latency_p95_s": round(_percentile(seconds, 0.95), 3),
+        "by_category": {},
+    }
+    for category in sorted({r["category"] for r in results}):
+        subset = [r for r in results if r["category"] == category]
+        summary["by_category"][category] = round(sum(r["correct"] for r in subset) / len(subset), 3)
+    if cache:
+        hits = [r for r in results if r["cache_hit"]]
+        summary["cache_hit_rate"] = round(len(hits) / len(results), 3)
+        summary["cache_hit_accuracy"] = round(sum(r["correct"] for r in hits) / len(hits), 3) if hits else None
+    return summary
+
+
+def _print_report(name, summary, results):
+    print(f"\n== {name} ==")
+    print(f"  accuracy            {summary['accuracy']:.1%}  "
+          + "  ".join(f"{k}={v:.0%}" for k, v in summary["by_category"].items()))
+    print(f"  LLM calls / query   {summary['llm_calls_per_query']}")
+    print(f"  latency p50 / p95   {summary['latency_p50_s']}s / {summary['latency_p95_s']}s")
+    if "cache_hit_rate" in summary:
+        hit_accuracy = summary["cache_hit_accuracy"]
+        print(f"  cache hit rate      {summary['cache_hit_rate']:.1%}"
+              + (f" (accuracy on hits {hit_accuracy:.1%})" if hit_accuracy is not None else ""))
+    for r in results:
+        if not r["correct"]:
+            print(f"  ✗ {r['id']}: routed to {r['route'] or '-'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cases", default=CASES_PATH)
+    parser.add_argument("--llm", choices=["stand-in", "gemini"], default="stand-in")
+    parser.add_argument("--llm-latency-ms", type=float, default=250, help="Simulated latency per stand-in LLM call")
+    parser.add_argument("--path", choices=["manager", "fast", "both"], default="both")
+    parser.add_argument("--threshold", type=float, help="Routing cache similarity threshold (default: settings)")
+    parser.add_argument("--json", help="Also write per-case results and summaries to this file")
+    args = parser.parse_args(argv)
+
+    # The fast path uses the Django-side routing cache
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myproject.settings")
+    import django
+
+    django.setup()
+    from myapp.services.routing_cache import SIMILARITY_THRESHOLD
+
+    with open(args.cases, encoding="utf-8") as f:
+        data = json.load(f)
+    threshold = args.threshold if args.threshold is not None else SIMILARITY_THRESHOLD
+
+    report = {"llm": args.llm, "threshold": threshold}
+    with patched_root(args.llm, args.llm_latency_ms / 1000) as (root, counter):
+        if args.path in ("manager", "both"):
+            results = run_manager_path(root, counter, data["cases"])
+            report["manager"] = {"summary": summarize(results), "results": results}
+            _print_report("manager path", report["manager"]["summary"], results)
+        if args.path in ("fast", "both"):
+            results = run_fast_path(root, counter, data["cases"], data["history"], threshold)
+            report["fast"] = {"summary": summarize(results, cache=True), "results": results}
+            _print_report(f"fast path (routing cache, threshold {threshold})", report["fast"]["summary"], results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from crewai import LLM, Task, Crew, Agent
 from crewai.tools import tool
+from myapp.AI.plan_cache import PlanCachingCrew
 from myapp.AI.Agents.Qna_Agent.qna_agent_root import qna_agent
 from myapp.AI.Agents.automation_agent2.src.automation.run_auto_tool import automation_run
 from myapp.AI.Agents.data_analysis.data_analysis.data_analysis_main import run_data_analysis
@@ -19,7 +20,60 @@ rootllm = LLM(model= "gemini/gemini-2.0-flash", api_key=rootkey)
 planningllm = LLM(model= "gemini/gemini-2.0-flash", api_key=rootkey)
 
 
-def manager_agent_function(query:str, attachment=None,file=None, csv_file=None):
+# Tool name as reported by crewai -> agent name used by the API (see myapp/services/agent_registry.py)
+TOOL_AGENTS = {
+    "qna_agent": "qna",
+    "automation_run": "auto",
+    "run_data_analysis": "data",
+    "run_stock": "stock",
+    "run_talent_sourcing": "talent",
+    "run_rag_root": "rag",
+    "run_sentiment": "sentiment",
+}
+ROOT_AGENTS = list(TOOL_AGENTS.values())
+
+
+def _call_specialist(agent_name: str, query: str, file_path=None, csv_file=None, context=""):
+    """Run one specialist exactly like the manager would through its tool."""
+    if agent_name == "qna":
+        return qna_agent.func(query, context)
+    if agent_name == "auto":
+        return automation_run.func(query, file_path, csv_file)
+    if agent_name == "data":
+        return run_data_analysis.func(query, file_path)
+    if agent_name == "stock":
+        return run_stock.func(query)
+    if agent_name == "talent":
+        return run_talent_sourcing.func(query)
+    if agent_name == "rag":
+        return run_rag_root.func(query, file_path)
+    if agent_name == "sentiment":
+        return run_sentiment.func(file_path=file_path, csv_file=csv_file)
+    raise ValueError(f"Unknown agent: {agent_name}")
+
+
+def dispatch_direct(agents, query: str, file_path=None, csv_file=None, context="") -> str:
+    """Skip the manager crew and call the given specialists in order."""
+    replies = []
+    for agent_name in agents:
+        result = _call_specialist(agent_name, query, file_path, csv_file, context)
+        text = getattr(result, "raw", None) or str(result)
+        replies.append(text if len(agents) == 1 else f"### {agent_name}\n{text}")
+    return "\n\n".join(replies)
+
+
+def manager_agent_function(query:str, attachment=None,file=None, csv_file=None, routed_agents=None, context=""):
+    """
+    Run the Aurelius manager crew. If `routed_agents` is a list, the names of
+    the specialists the manager called are appended to it. `context` is the
+    conversation so far (summary plus recent turns), built by the caller.
+    """
+    def track_routing(step):
+        tool_name = (getattr(step, "tool", None) or "").strip().lower()
+        agent_name = TOOL_AGENTS.get(tool_name)
+        if routed_agents is not None and agent_name and agent_name not in routed_agents:
+            routed_agents.append(agent_name)
+
     manager_agent = Agent(llm=rootllm,
                         backstory="""You are Aurelius, the Supreme Coordinator — the unifying mind behind an elite circle of eight master agents, each a virtuoso in their own field:
                                 - The Information Retrieval Sage who distills oceans of knowledge into droplets of truth.
@@ -48,6 +102,8 @@ Your power is not in doing their work, but in orchestrating their talents like a
                                     Attached File: {file}
                                     Attachment Metadata: {attachment}
                                     CSV_File: {csv_file}
+                                    Conversation so far (use it to resolve follow-up questions; pass the relevant part to the QnA crew as context):
+                                    {{context}}
                                     Your mission:
                                     1. **Understand & Decompose** – Carefully read the query. If it contains multiple requests, break it into logically distinct parts — BUT only if the user hasn’t specified a single agent or crew to use.
                                     2. **Crew Selection & Routing** –
@@ -73,14 +129,17 @@ Your power is not in doing their work, but in orchestrating their talents like a
                                     - Clearly labels answers when multiple parts are present.
                                     - Is free of redundancy or contradictions.
                                     - Reflects strict obedience to user routing instructions.""",)
-    crew = Crew(agents=[manager_agent,],
+    crew = PlanCachingCrew(name="root_manager",
+                agents=[manager_agent,],
                 tasks=[managertask],
                 manager_agent=manager_agent,
                 manager_llm=rootllm, 
                 planning=True,
                 planning_llm=planningllm,             
+                step_callback=track_routing,
                 )
-    response = crew.kickoff({"query":query, "attachment":attachment, "file":file, "csv_file":csv_file})
+    response = crew.kickoff({"query":query, "attachment":attachment, "file":file, "csv_file":csv_file,
+                             "context":context or "(none)"})
     return response
     
 # while True:
@@ -0,0 +1,242 @@
+"""
+Plan cache for crews that run with planning=True.
+
+With planning enabled, crewai asks the planning LLM for a step-by-step plan
+on every kickoff, even when the crew, its task list and the shape of the
+request are the same as in hundreds of earlier runs. `PlanCachingCrew` keys
+the plan on (crew name, task list, planning model, normalized query
+template, input shape) and injects a stored plan instead of planning again.
+The input shape is the kind of every attached file (its extension, or none)
+and whether the run has conversation context, so the same question about a
+CSV and a PDF, or asked mid-conversation, is planned separately.
+
+Queries that differ only in their literals share a plan, so the literals
+must not travel with it: before a plan is stored, every literal of the
+query it was made for (and every other input value) is replaced with a
+positional marker such as [[literal_0]], and a plan served from the cache
+is filled in from the current run's query and inputs.
+
+Plans are kept in a diskcache directory shared by all workers, expire after
+PLAN_CACHE_TTL seconds and are tagged with the crew name, so one crew's
+plans can be dropped with `manage.py plan_cache clear --crew <name>`.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+
+import diskcache
+from crewai import Crew
+from crewai.utilities.planning_handler import CrewPlanner
+from dotenv import load_dotenv
+from pydantic import PrivateAttr
+
+load_dotenv()
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PLAN_CACHE_DIR = os.getenv("PLAN_CACHE_DIR", os.path.join(_BASE_DIR, "data", "plan_cache"))
+PLAN_CACHE_TTL = int(os.getenv("PLAN_CACHE_TTL", 7 * 24 * 3600))
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Literals a query template abstracts over; earlier kinds win where they overlap
+_LITERAL_RE = re.compile(
+    r"(?P<url>https?://\S+|www\.\S+)"
+    r"|(?P<email>[\w.+-]+@[\w-]+\.[\w.-]+)"
+    r"|(?P<text>'[^']*'|\"[^\"]*\")"
+    r"|(?P<num>\d+(?:[.,:/-]\d+)*)"
+)
+_SPACE_RE = re.compile(r"\s+")
+
+# Crew inputs holding file paths (root manager and automation crews)
+_FILE_INPUTS = ("file", "attachment", "csv_file", "attach_file_path", "file_path")
+_NO_CONTEXT = ("", "(none)")
+
+_cache = None
+
+
+def get_plan_cache() -> diskcache.Cache:
+    global _cache
+    if _cache is None:
+        _cache = diskcache.Cache(PLAN_CACHE_DIR, tag_index=True)
+    return _cache
+
+
+def query_template(query) -> str:
+    """Reduce a query to its shape: literals such as URLs, emails, quoted text and numbers become placeholders."""
+    text = _LITERAL_RE.sub(lambda match: f" <{match.lastgroup}> ", str(query or "").lower())
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def query_literals(query) -> list:
+    """The literals `query_template` masks, in order, as written in the query (quoted text without its quotes)."""
+    return [
+        match.group()[1:-1] if match.lastgroup == "text" else match.group()
+        for match in _LITERAL_RE.finditer(str(query or ""))
+    ]
+
+
+def _task_label(task) -> str:
+    # Tasks built by @CrewBase carry their method name; ad-hoc tasks fall back to the agent's role.
+    if task.name:
+        return task.name
+    return task.agent.role if task.agent else "task"
+
+
+def input_shape(inputs) -> dict:
+    """The inputs besides the query that change the plan: attachment kinds and whether there is context."""
+    inputs = inputs or {}
+    shape = {}
+    for name in _FILE_INPUTS:
+        if name in inputs:
+            value = str(inputs[name] or "").strip()
+            shape[name] = (os.path.splitext(value)[1].lower() or "file") if value else "none"
+    if "context" in inputs:
+        shape["context"] = str(inputs["context"] or "").strip() not in _NO_CONTEXT
+    return shape
+
+
+def plan_cache_key(crew_name, task_labels, planning_model, template, shape=None) -> str:
+    payload = json.dumps([crew_name, list(task_labels), planning_model, template, shape or {}], sort_keys=True)
+    return "plan:" + hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _literal_inputs(inputs):
+    # Longest first, so a value that contains another one is replaced whole.
+    literals = [(name, value) for name, value in (inputs or {}).items()
+                if isinstance(value, str) and len(value.strip()) >= 3]
+    return sorted(literals, key=lambda item: len(item[1]), reverse=True)
+
+
+def _literal_markers(query):
+    # Longest first, for the same reason; each distinct literal gets the marker of its first position
+    markers = {}
+    for position, literal in enumerate(query_literals(query)):
+        if literal.strip():
+            markers.setdefault(literal.lower(), f"[[literal_{position}]]")
+    return sorted(markers.items(), key=lambda item: len(item[0]), reverse=True)
+
+
+def _templatize_plan(plan: str, inputs) -> str:
+    """Swap this run's input values and query literals for markers so the plan can serve other runs."""
+    for name, value in _literal_inputs(inputs):
+        plan = plan.replace(value, f"[[{name}]]")
+    for literal, marker in _literal_markers((inputs or {}).get("query", "")):
+        # Whole literals only, so "5" doesn't match inside "2025"; a coincidental match is refilled too
+        pattern = r"(?<![\w.@/-])" + re.escape(literal) + r"(?![\w@/-]|\.\w)"
+        plan = re.sub(pattern, lambda _: marker, plan, flags=re.IGNORECASE)
+    return plan
+
+
+def _fill_plan(plan: str, inputs) -> str:
+    inputs = inputs or {}
+    for position, literal in enumerate(query_literals(inputs.get("query", ""))):
+        plan = plan.replace(f"[[literal_{position}]]", literal)
+    for name, value in inputs.items():
+        plan = plan.replace(f"[[{name}]]", "" if value is None else str(value))
+    return plan
+
+
+def clear_plan_cache(crew_name=None) -> int:
+    """Drop cached plans (all of them, or one crew's). Returns the number removed."""
+    cache = get_plan_cache()
+    if crew_name:
+        return cache.evict(crew_name)
+    return cache.clear()
+
+
+def plan_cache_stats() -> dict:
+    """Totals since the cache was last cleared, across all workers."""
+    cache = get_plan_cache()
+    hits = cache.get("stats:hits", 0)
+    misses = cache.get("stats:misses", 0)
+    lookups = hits + misses
+    return {
+        "plans": sum(1 for key in cache.iterkeys() if str(key).startswith("plan:")),
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        "saved_seconds": round(cache.get("stats:saved_ms", 0) / 1000, 1),
+    }
+
+
+class PlanCachingCrew(Crew):
+    """
+    Crew that reuses plans from earlier runs with the same task list, query
+    template and input shape. After kickoff, `plan_cache_metrics` says whether the plan came
+    from the cache and how much planning time that saved.
+    """
+
+    _plan_cache_metrics: dict = PrivateAttr(default_factory=dict)
+
+    @property
+    def plan_cache_metrics(self) -> dict:
+        return dict(self._plan_cache_metrics)
+
+    def _handle_crew_planning(self):
+        if not PLAN_CACHE_ENABLED:
+            return super()._handle_crew_planning()
+
+        inputs = self._inputs or {}
+        planning_model = getattr(self.planning_llm, "model", self.planning_llm)
+        key = plan_cache_key(
+            self.name,
+            [_task_label(task) for task in self.tasks],
+            str(planning_model or ""),
+            query_template(inputs.get("query", "")),
+            input_shape(inputs),
+        )
+
+        started = time.perf_counter()
+        try:
+            entry = get_plan_cache().get(key)
+        except Exception as e:
+            print(f"⚠️ Plan cache unavailable, planning from scratch: {e}")
+            entry = None
+
+        if entry is not None and len(entry["plans"]) == len(self.tasks):
+            for task, plan in zip(self.tasks, entry["plans"]):
+                task.description += _fill_plan(plan, inputs)
+            lookup_seconds = time.perf_counter() - started
+            saved_seconds = max(entry["planning_seconds"] - lookup_seconds, 0.0)
+            self._record_planning(key, hit=True, planning_seconds=lookup_seconds, saved_seconds=saved_seconds)
+            return
+
+        self._logger.log("info", "Planning the crew execution")
+        result = CrewPlanner(tasks=self.tasks, planning_agent_llm=self.planning_llm)._handle_crew_planning()
+        plans = [step_plan.plan for step_plan in result.list_of_plans_per_task]
+        for task, plan in zip(self.tasks, plans):
+            task.description += plan
+        planning_seconds = time.perf_counter() - started
+
+        # A plan that doesn't cover every task is used once but never cached.
+        if len(plans) == len(self.tasks):
+            entry = {
+                "plans": [_templatize_plan(plan, inputs) for plan in plans],
+                "planning_seconds": planning_seconds,
+                "created_at": time.time(),
+            }
+            try:
+                get_plan_cache().set(key, entry, expire=PLAN_CACHE_TTL, tag=self.name)
+            except Exception as e:
+                print(f"⚠️ Could not cache crew plan: {e}")
+        self._record_planning(key, hit=False, planning_seconds=planning_seconds, saved_seconds=0.0)
+
+    def _record_planning(self, key, hit, planning_seconds, saved_seconds):
+        self._plan_cache_metrics = {
+            "crew": self.name,
+            "plan_key": key[5:17],
+            "plan_cache_hit": hit,
+            "planning_seconds": round(planning_seconds, 3),
+            "saved_seconds": round(saved_seconds, 3),
+        }
+        try:
+            cache = get_plan_cache()
+            cache.incr("stats:hits" if hit else "stats:misses")
+            if saved_seconds:
+                cache.incr("stats:saved_ms", int(saved_seconds * 1000))
+        except Exception:
+            pass
+        outcome = f"hit, saved {saved_seconds:.2f}s" if hit else f"miss, planned in {planning_seconds:.2f}s"
+        print(f"🗺️ Plan cache [{self.name}]: {outcome}")
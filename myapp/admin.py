@@ -11,3 +11,4 @@ admin.site.register(Subscription)
 admin.site.register(RootAgentMemory)
 admin.site.register(APIKey)
 admin.site.register(AgentFeedback)
+admin.site.register(APIKeyUsage)
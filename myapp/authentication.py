@@ -1,6 +1,41 @@
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from .models import APIKey
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .services.agent_registry import capability_bit
+from .services.api_key_helpers import api_key_allows_agent, get_api_key_obj_by_key, looks_like_api_key
+from .utils.ttl_cache import TTLCache
+
+TOKEN_VERSION_CLAIM = "ver"
+# jti of the refresh token a token belongs to; logout blacklists it
+SESSION_CLAIM = "sid"
+JWT_USER_CACHE_TTL = getattr(settings, "JWT_USER_CACHE_TTL", 30)
+
+# str(user id) -> User, shared by all requests handled by this worker (JWT and API key)
+_jwt_user_cache = TTLCache(ttl=JWT_USER_CACHE_TTL)
+# session id -> whether its refresh token is blacklisted, per worker
+_revoked_session_cache = TTLCache(ttl=JWT_USER_CACHE_TTL)
+
+
+def invalidate_cached_user(user_id) -> None:
+    _jwt_user_cache.delete(str(user_id))
+
+
+def session_revoked(session_id: str) -> bool:
+    revoked = _revoked_session_cache.get(session_id)
+    if revoked is None:
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+        revoked = BlacklistedToken.objects.filter(token__jti=session_id).exists()
+        _revoked_session_cache.set(session_id, revoked)
+    return revoked
+
+
+def mark_session_revoked(session_id: str) -> None:
+    """Reject the session's tokens in this worker at once; other workers notice within JWT_USER_CACHE_TTL."""
+    _revoked_session_cache.set(session_id, True)
 
 class APIKeyAuthentication(BaseAuthentication):
     def authenticate(self, request):
@@ -9,14 +44,26 @@ class APIKeyAuthentication(BaseAuthentication):
             return None
 
         key = auth_header.split("Bearer ")[1].strip()
-        try:
-            api_key = APIKey.objects.get(key=key, is_active=True)
-        except APIKey.DoesNotExist:
+        # Not an API key (e.g. a JWT) -> let the next authentication class handle it
+        if not looks_like_api_key(key):
+            return None
+
+        api_key = get_api_key_obj_by_key(key)
+        if api_key is None:
             raise AuthenticationFailed("Invalid or inactive API Key.")
 
         # Attach api_key object to request so views can check per-agent permissions
-        request.api_key = api_key  
-        return (api_key.user, None)
+        request.api_key = api_key
+        user = _jwt_user_cache.get(str(api_key.user_id))
+        if user is None:
+            try:
+                user = api_key.user
+            except ObjectDoesNotExist:
+                raise AuthenticationFailed("Invalid or inactive API Key.")
+            _jwt_user_cache.set(str(user.pk), user)
+        else:
+            api_key.user = user
+        return (user, None)
 
     @staticmethod
     def check_agent_permission(request, agent_name: str):
@@ -27,21 +74,43 @@ class APIKeyAuthentication(BaseAuthentication):
         if not api_key:
             raise AuthenticationFailed("API Key missing in request.")
 
-        agent_map = {
-            "qna": api_key.allow_qna,
-            "data": api_key.allow_data,
-            "talent": api_key.allow_talent,
-            "stock": api_key.allow_stock,
-            "resume": api_key.allow_resume,
-            "sentiment": api_key.allow_sentiment,
-            "auto": api_key.allow_auto,
-            "rag": api_key.allow_rag,
-        }
-
-        if agent_name not in agent_map:
+        if capability_bit(agent_name) is None:
             raise AuthenticationFailed(f"Unknown agent: {agent_name}")
 
-        if not agent_map[agent_name]:
+        if not api_key_allows_agent(api_key, agent_name):
             raise AuthenticationFailed(f"API Key not allowed to use {agent_name} agent.")
 
         return True
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the user from a short-lived in-process
+    cache instead of querying the User table on every request.
+
+    A cached user is only used while its token_version matches the token's
+    "ver" claim; otherwise the user is reloaded, and tokens older than the
+    current version are rejected. Tokens whose "sid" (the jti of the refresh
+    token they were minted from) was blacklisted at logout are rejected too.
+    Both checks are cached per worker, so a logout takes up to
+    JWT_USER_CACHE_TTL seconds to reach the other workers.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(jwt_settings.USER_ID_CLAIM)
+        token_version = validated_token.get(TOKEN_VERSION_CLAIM, 0)
+
+        # simplejwt may store the id claim as a string; normalise the cache key
+        user = _jwt_user_cache.get(str(user_id)) if user_id is not None else None
+        if user is None or user.token_version != token_version:
+            # Full lookup, including simplejwt's is_active / revocation checks
+            user = super().get_user(validated_token)
+            _jwt_user_cache.set(str(user.pk), user)
+
+        if user.token_version != token_version:
+            raise AuthenticationFailed("Token has been revoked.", code="token_revoked")
+
+        session_id = validated_token.get(SESSION_CLAIM)
+        if session_id and session_revoked(str(session_id)):
+            raise AuthenticationFailed("Token has been revoked.", code="token_revoked")
+        return user
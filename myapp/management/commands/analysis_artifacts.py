@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools.artifacts import ARTIFACT_ROOT, ARTIFACT_TTL, purge_artifacts
+
+
+class Command(BaseCommand):
+    help = "Remove expired (or all) saved analysis result artifacts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["purge", "clear"])
+
+    def handle(self, *args, **options):
+        max_age = ARTIFACT_TTL if options["action"] == "purge" else 0
+        removed = purge_artifacts(max_age)
+        scope = f"older than {ARTIFACT_TTL}s" if max_age else "all"
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} artifacts ({scope}) from {ARTIFACT_ROOT}."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools.code_cache import (
+    CODE_CACHE_DIR,
+    CODE_CACHE_TTL,
+    clear_code_cache,
+    code_cache_stats,
+)
+
+
+class Command(BaseCommand):
+    help = "Clear cached analysis/visualization code or report how much code generation the cache saved."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["clear", "stats"])
+        parser.add_argument("--kind", choices=["analysis", "visualization"], help="Only clear code of this tool")
+
+    def handle(self, *args, **options):
+        if options["action"] == "clear":
+            removed = clear_code_cache(options["kind"])
+            scope = f"{options['kind']} code" if options["kind"] else "all code"
+            self.stdout.write(self.style.SUCCESS(f"Removed {removed} cached entries ({scope})."))
+            return
+
+        stats = code_cache_stats()
+        self.stdout.write(f"Code cache in {CODE_CACHE_DIR} (TTL {CODE_CACHE_TTL}s):")
+        self.stdout.write(f"  cached programs  {stats['entries']} ({stats['bytes'] / 1e6:.1f} MB)")
+        self.stdout.write(f"  hits / misses    {stats['hits']} / {stats['misses']} ({stats['hit_rate']:.1%})")
+        self.stdout.write(f"  code generation time saved  {stats['saved_seconds']}s")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools.workspace import WORKSPACE_ROOT, WORKSPACE_TTL, purge_workspaces
+
+
+class Command(BaseCommand):
+    help = "Remove data analysis workspaces that were not used within DATA_WORKSPACE_TTL (or all of them)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["purge", "clear"])
+
+    def handle(self, *args, **options):
+        max_age = WORKSPACE_TTL if options["action"] == "purge" else 0
+        removed = purge_workspaces(max_age)
+        scope = f"unused for {WORKSPACE_TTL}s" if max_age else "all"
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} workspaces ({scope}) from {WORKSPACE_ROOT}."))
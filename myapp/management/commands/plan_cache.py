@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from myapp.AI.plan_cache import PLAN_CACHE_DIR, PLAN_CACHE_TTL, clear_plan_cache, plan_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Clear cached crew plans or report how much planning time the cache saved."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["clear", "stats"])
+        parser.add_argument("--crew", help="Only clear plans of this crew (e.g. root_manager, automation)")
+
+    def handle(self, *args, **options):
+        if options["action"] == "clear":
+            removed = clear_plan_cache(options["crew"])
+            scope = f"crew '{options['crew']}'" if options["crew"] else "all crews"
+            self.stdout.write(self.style.SUCCESS(f"Removed {removed} cached entries for {scope}."))
+            return
+
+        stats = plan_cache_stats()
+        self.stdout.write(f"Plan cache in {PLAN_CACHE_DIR} (TTL {PLAN_CACHE_TTL}s):")
+        self.stdout.write(f"  cached plans   {stats['plans']}")
+        self.stdout.write(f"  hits / misses  {stats['hits']} / {stats['misses']} ({stats['hit_rate']:.1%})")
+        self.stdout.write(f"  planning time saved  {stats['saved_seconds']}s")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from myapp.models import Conversation
+from myapp.services.conversation_purge import PURGE_CHUNK_SIZE, purge_conversation
+
+
+class Command(BaseCommand):
+    help = "Purge conversations that were marked as deleted but not yet removed (e.g. after a worker restart)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=PURGE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        conversation_ids = list(
+            Conversation.objects.filter(is_deleted=True).values_list("id", flat=True)
+        )
+        for conversation_id in conversation_ids:
+            report = purge_conversation(conversation_id, chunk_size=options["chunk_size"])
+            self.stdout.write(
+                f"Conversation {conversation_id}: {report.get('messages', 0)} messages, "
+                f"{report.get('token_logs', 0)} token logs, {report.get('memories', 0)} memories, "
+                f"{report.get('files', 0)} files removed"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Purged {len(conversation_ids)} conversation(s)."))
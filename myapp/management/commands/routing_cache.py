@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from myapp.models import RootAgentMemory
+from myapp.services.routing_cache import INDEX_PATH, SIMILARITY_THRESHOLD, build_index_from_memory, save_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the root agent's semantic routing index or report its hit rate."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["rebuild", "stats"])
+        parser.add_argument("--days", type=int, default=7, help="Window for `stats` (default: 7 days)")
+
+    def handle(self, *args, **options):
+        if options["action"] == "rebuild":
+            index = build_index_from_memory()
+            save_index(index)
+            self.stdout.write(self.style.SUCCESS(
+                f"Indexed {len(index)} routed queries into {INDEX_PATH}; workers reload it within a minute."
+            ))
+            return
+
+        since = timezone.now() - timedelta(days=options["days"])
+        counts = dict(
+            RootAgentMemory.objects.filter(created_at__gte=since)
+            .values_list("route_source")
+            .annotate(n=Count("id"))
+        )
+        routed = counts.get("cache", 0) + counts.get("manager", 0)
+        hit_rate = counts.get("cache", 0) / routed if routed else 0.0
+        self.stdout.write(f"Last {options['days']} day(s), similarity threshold {SIMILARITY_THRESHOLD}:")
+        for source in ("manager", "cache", "direct"):
+            self.stdout.write(f"  {source:<8} {counts.get(source, 0)}")
+        self.stdout.write(f"  cache hit rate (cache / (cache + manager)): {hit_rate:.1%}")
@@ -0,0 +1,41 @@
+import time
+from .services.agent_registry import url_agent_name
+from .services.usage_metering import record
+
+
+class UsageMeteringMixin:
+    """
+    Meters API-key traffic: latency, bytes in/out and tokens per agent.
+    Views may set `request.tokens_used` to report token spend.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        request.metering_started = time.perf_counter()
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        api_key = getattr(request, "api_key", None)
+        started = getattr(request, "metering_started", None)
+        if api_key is None or started is None:
+            return response
+
+        agent_name = kwargs.get("agent_name")
+        agent = url_agent_name(agent_name) if agent_name is not None else getattr(self, "rate_limit_agent", "unknown")
+        latency_ms = (time.perf_counter() - started) * 1000
+        bytes_in = int(request.META.get("CONTENT_LENGTH") or 0)
+        tokens_used = getattr(request, "tokens_used", 0)
+
+        def _record(rendered):
+            # Runs once the body is rendered, so its size is known
+            record(
+                api_key.id, agent,
+                latency_ms=latency_ms,
+                bytes_in=bytes_in,
+                bytes_out=len(rendered.content),
+                tokens_used=tokens_used,
+                is_error=rendered.status_code >= 400,
+            )
+
+        response.add_post_render_callback(_record)
+        return response
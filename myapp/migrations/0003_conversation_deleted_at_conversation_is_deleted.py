@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_apikey_is_active'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='is_deleted',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:20
+
+import hashlib
+
+from django.db import migrations, models
+
+
+KEY_PREFIX_LENGTH = 12
+
+
+def hash_existing_keys(apps, schema_editor):
+    APIKey = apps.get_model('myapp', 'APIKey')
+    for api_key in APIKey.objects.all().iterator():
+        api_key.prefix = api_key.key[:KEY_PREFIX_LENGTH]
+        api_key.key_hash = hashlib.sha256(api_key.key.encode()).hexdigest()
+        api_key.save(update_fields=['prefix', 'key_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_conversation_deleted_at_conversation_is_deleted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apikey',
+            name='prefix',
+            field=models.CharField(max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='apikey',
+            name='key_hash',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(hash_existing_keys, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='apikey',
+            name='key',
+        ),
+        migrations.AlterField(
+            model_name='apikey',
+            name='prefix',
+            field=models.CharField(max_length=16, unique=True),
+        ),
+    ]
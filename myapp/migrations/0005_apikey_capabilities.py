@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:45
+
+from django.db import migrations, models
+
+
+# Bits as defined in myapp/services/agent_registry.py at the time of this migration
+LEGACY_FLAG_BITS = {
+    'allow_qna': 1 << 0,
+    'allow_data': 1 << 1,
+    'allow_talent': 1 << 2,
+    'allow_stock': 1 << 3,
+    'allow_resume': 1 << 4,
+    'allow_sentiment': 1 << 5,
+    'allow_auto': 1 << 6,
+    'allow_rag': 1 << 7,
+}
+
+
+def flags_to_mask(apps, schema_editor):
+    APIKey = apps.get_model('myapp', 'APIKey')
+    for api_key in APIKey.objects.all().iterator():
+        api_key.capabilities = sum(
+            bit for flag, bit in LEGACY_FLAG_BITS.items() if getattr(api_key, flag)
+        )
+        api_key.save(update_fields=['capabilities'])
+
+
+def mask_to_flags(apps, schema_editor):
+    APIKey = apps.get_model('myapp', 'APIKey')
+    for api_key in APIKey.objects.all().iterator():
+        for flag, bit in LEGACY_FLAG_BITS.items():
+            setattr(api_key, flag, bool(api_key.capabilities & bit))
+        api_key.save(update_fields=list(LEGACY_FLAG_BITS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_apikey_prefix_key_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apikey',
+            name='capabilities',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(flags_to_mask, mask_to_flags),
+        migrations.RemoveField(model_name='apikey', name='allow_qna'),
+        migrations.RemoveField(model_name='apikey', name='allow_data'),
+        migrations.RemoveField(model_name='apikey', name='allow_talent'),
+        migrations.RemoveField(model_name='apikey', name='allow_stock'),
+        migrations.RemoveField(model_name='apikey', name='allow_resume'),
+        migrations.RemoveField(model_name='apikey', name='allow_sentiment'),
+        migrations.RemoveField(model_name='apikey', name='allow_auto'),
+        migrations.RemoveField(model_name='apikey', name='allow_rag'),
+        migrations.AddIndex(
+            model_name='apikey',
+            index=models.Index(fields=['user', 'is_active', 'capabilities'], name='apikey_user_active_caps_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_user_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIKeyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent', models.CharField(max_length=50)),
+                ('period_start', models.DateTimeField()),
+                ('request_count', models.BigIntegerField(default=0)),
+                ('error_count', models.BigIntegerField(default=0)),
+                ('total_latency_ms', models.FloatField(default=0)),
+                ('latency_histogram', models.JSONField(default=dict)),
+                ('bytes_in', models.BigIntegerField(default=0)),
+                ('bytes_out', models.BigIntegerField(default=0)),
+                ('tokens_used', models.BigIntegerField(default=0)),
+                ('api_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='myapp.apikey')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('api_key', 'agent', 'period_start'), name='unique_apikey_usage_period')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_apikeyusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rootagentmemory',
+            name='attachment_type',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='rootagentmemory',
+            name='route_source',
+            field=models.CharField(choices=[('manager', 'Manager'), ('cache', 'Routing cache'), ('direct', 'Direct')], db_index=True, default='manager', max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_rootagentmemory_route_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary_until_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -10,6 +10,8 @@ class User(AbstractUser):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Carried in JWTs as the "ver" claim; bumping it revokes every token issued before
+    token_version = models.PositiveIntegerField(default=0)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']  # keep username for compatibility
@@ -53,6 +55,14 @@ class Conversation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_root_agent = models.BooleanField(default=False)
 
+    # Soft-delete marker; rows are purged in the background (services/conversation_purge.py)
+    is_deleted = models.BooleanField(default=False, db_index=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    # Rolling summary of older turns, see services/conversation_context.py
+    summary = models.TextField(blank=True, default="")
+    summary_until_message_id = models.BigIntegerField(null=True, blank=True)  # last ChatMessage folded into it
+
     def save(self, *args, **kwargs):
         if not self.title:
             self.title = "New Chat"
@@ -109,6 +119,14 @@ class RootAgentMemory(models.Model):
     user_input = models.TextField()
     routed_response = models.TextField()
     used_agents = models.JSONField()  # ✅ Easier querying
+    # How the route was chosen: by the manager crew, reused from a similar past query, or given by the client
+    route_source = models.CharField(
+        max_length=20,
+        choices=(("manager", "Manager"), ("cache", "Routing cache"), ("direct", "Direct")),
+        default="manager",
+        db_index=True,
+    )
+    attachment_type = models.CharField(max_length=20, blank=True, default="")  # e.g. "csv", "pdf"
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -117,25 +135,57 @@ class RootAgentMemory(models.Model):
 
 class APIKey(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_keys')
-    key = models.CharField(max_length=255, unique=True)
+    # Only a short public prefix and a SHA-256 digest of the key are stored;
+    # the full key is shown once, when it is created.
+    prefix = models.CharField(max_length=16, unique=True)
+    key_hash = models.CharField(max_length=64)
     created_at = models.DateTimeField(auto_now_add=True)
     label = models.CharField(max_length=100, blank=True, default="")
     
-    # Per-agent permissions
-    allow_qna = models.BooleanField(default=False)
-    allow_data = models.BooleanField(default=False)
-    allow_talent = models.BooleanField(default=False)
-    allow_stock = models.BooleanField(default=False)
-    allow_resume = models.BooleanField(default=False)
-    allow_sentiment = models.BooleanField(default=False)
-    allow_auto = models.BooleanField(default=False)
-    allow_rag = models.BooleanField(default=False)
+    # Per-agent permissions: one bit per agent, see services/agent_registry.py
+    capabilities = models.BigIntegerField(default=0)
     
     # ✅ Add this field
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "is_active", "capabilities"], name="apikey_user_active_caps_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} - {self.prefix}…"
+
+# Hourly usage aggregate per API key and agent, written by services/usage_metering.py
+class APIKeyUsage(models.Model):
+    api_key = models.ForeignKey(APIKey, on_delete=models.CASCADE, related_name='usage')
+    agent = models.CharField(max_length=50)
+    period_start = models.DateTimeField()
+    request_count = models.BigIntegerField(default=0)
+    error_count = models.BigIntegerField(default=0)
+    total_latency_ms = models.FloatField(default=0)
+    latency_histogram = models.JSONField(default=dict)  # {"<upper bound ms>" or "+Inf": count}
+    bytes_in = models.BigIntegerField(default=0)
+    bytes_out = models.BigIntegerField(default=0)
+    tokens_used = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["api_key", "agent", "period_start"], name="unique_apikey_usage_period"),
+        ]
+
+    def __str__(self):
+        return f"{self.api_key} - {self.agent} @ {self.period_start:%Y-%m-%d %H:00}"
+
+
+# Token bucket shared by all workers, see services/rate_limit.py
+class RateLimitBucket(models.Model):
+    key = models.CharField(max_length=200, unique=True)  # e.g. "key:12:stock" or "user:7:stock"
+    tokens = models.FloatField()
+    updated_at = models.FloatField()  # unix timestamp of the last refill
+
     def __str__(self):
-        return f"{self.user.email} - {self.key[:6]}…"
+        return f"{self.key}: {self.tokens:.2f}"
 
 # Label: [ My API Key ]
 # [✔] QnA  
@@ -2,7 +2,10 @@ from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
 from .models import *
-import secrets
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .authentication import SESSION_CLAIM, TOKEN_VERSION_CLAIM
+from .services.agent_registry import AGENT_CAPABILITIES, AGENT_NAMES, agents_in_mask, capability_mask
+from .services.api_key_helpers import generate_api_key
 
 User = get_user_model()
 
@@ -29,6 +32,14 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        # Copied into every access token minted from this refresh token
+        token[TOKEN_VERSION_CLAIM] = user.token_version
+        token[SESSION_CLAIM] = token[jwt_settings.JTI_CLAIM]
+        return token
+
     def validate(self, attrs):
         data = super().validate(attrs)
         data.update({
@@ -66,6 +77,7 @@ class ConversationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Conversation
         fields = '__all__'
+        read_only_fields = ['summary', 'summary_until_message_id']
 
         
 class ChatMessageSerializer(serializers.ModelSerializer):
@@ -108,15 +120,56 @@ class RootAgentMemorySerializer(serializers.ModelSerializer):
 
 
 class APIKeySerializer(serializers.ModelSerializer):
+    # Full key is only returned in the create response; afterwards only the prefix is known
+    key = serializers.SerializerMethodField()
+    # Agents this key may call, e.g. ["qna", "stock"]; stored as the `capabilities` bitmask
+    agents = serializers.ListField(
+        child=serializers.ChoiceField(choices=AGENT_NAMES), required=False, write_only=True
+    )
+
     class Meta:
         model = APIKey
-        fields = "__all__"
-        read_only_fields = ["id", "key", "user", "created_at"]
+        exclude = ["key_hash"]
+        read_only_fields = ["id", "prefix", "user", "created_at", "capabilities"]
+
+    def get_key(self, obj):
+        return getattr(obj, "raw_key", None)
+
+    def validate(self, attrs):
+        agents = attrs.pop("agents", None)
+        # Older clients still send one `allow_<agent>` boolean per agent
+        legacy_flags = {
+            name: serializers.BooleanField().to_internal_value(self.initial_data[f"allow_{name}"])
+            for name in AGENT_NAMES
+            if f"allow_{name}" in self.initial_data
+        }
+        if agents is None and not legacy_flags:
+            return attrs
+
+        if agents is not None:
+            mask = capability_mask(agents)
+        else:
+            mask = self.instance.capabilities if self.instance else 0
+        for name, allowed in legacy_flags.items():
+            bit = AGENT_CAPABILITIES[name]
+            mask = mask | bit if allowed else mask & ~bit
+
+        attrs["capabilities"] = mask
+        return attrs
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["agents"] = agents_in_mask(instance.capabilities)
+        for name in AGENT_NAMES:
+            data[f"allow_{name}"] = name in data["agents"]
+        return data
 
     def create(self, validated_data):
         # Generate a random secure API key
-        validated_data["key"] = "sk_" + secrets.token_hex(16)
-        return super().create(validated_data)
+        raw_key, validated_data["prefix"], validated_data["key_hash"] = generate_api_key()
+        instance = super().create(validated_data)
+        instance.raw_key = raw_key
+        return instance
 
 
 
@@ -0,0 +1,61 @@
+# myapp/services/agent_registry.py
+"""
+Central registry of agents that can be granted to an API key.
+
+Each agent owns one bit of `APIKey.capabilities`. Adding an agent only needs a
+new entry here (with an unused bit) - no schema change. Never reuse or
+renumber a bit, existing keys would silently gain or lose access.
+"""
+from typing import Iterable, List, Optional
+
+AGENT_CAPABILITIES = {
+    "qna": 1 << 0,
+    "data": 1 << 1,
+    "talent": 1 << 2,
+    "stock": 1 << 3,
+    "resume": 1 << 4,
+    "sentiment": 1 << 5,
+    "auto": 1 << 6,
+    "rag": 1 << 7,
+    # add more if needed
+}
+
+AGENT_NAMES = list(AGENT_CAPABILITIES)
+
+# Specialists the root agent can hand a request to (resume only has its own endpoint)
+ROOT_AGENT_NAMES = ["qna", "data", "talent", "stock", "sentiment", "auto", "rag"]
+
+
+def capability_bit(agent_name: str) -> Optional[int]:
+    """Bit for `agent_name`, or None for unknown agents."""
+    if not agent_name:
+        return None
+    return AGENT_CAPABILITIES.get(agent_name.lower())
+
+
+def url_agent_name(agent_name: str) -> str:
+    """
+    An agent name taken from the URL, for rate-limit buckets and usage rows:
+    registered names lowercased, anything else "default", so made-up names
+    can't each get a fresh quota or a row of their own.
+    """
+    return agent_name.lower() if capability_bit(agent_name) is not None else "default"
+
+
+def capability_mask(agent_names: Iterable[str]) -> int:
+    mask = 0
+    for name in agent_names:
+        bit = capability_bit(name)
+        if bit is None:
+            raise ValueError(f"Unknown agent: {name}")
+        mask |= bit
+    return mask
+
+
+def agents_in_mask(mask: int) -> List[str]:
+    return [name for name, bit in AGENT_CAPABILITIES.items() if mask & bit]
+
+
+def mask_allows(mask: int, agent_name: str) -> bool:
+    bit = capability_bit(agent_name)
+    return bit is not None and bool(mask & bit)
@@ -15,7 +15,7 @@
 # )
 # import os
 
-# def call_ai_agent(agent_type, query, file_path=None, csv_file=None):
+# def call_ai_agent(agent_type, query, file_path=None, csv_file=None, routed_agents=None):
 #     if agent_type == "qna":   #✅
 #         return qna_agent(query)
 
@@ -67,11 +67,11 @@
 from datetime import datetime
 import os
 
-def call_ai_agent(agent_type, query, file_path=None, csv_file=None):
+def call_ai_agent(agent_type, query, file_path=None, csv_file=None, routed_agents=None, context=""):
     # QnA Agent
     if agent_type == "qna":
         from myapp.AI.Agents.Qna_Agent.qna_user_agent import qna_agent
-        return qna_agent(query)
+        return qna_agent(query, context)
 
     # Data Analysis Agent
     elif agent_type == "data":
@@ -131,7 +131,13 @@ def call_ai_agent(agent_type, query, file_path=None, csv_file=None):
     # Root AI Agent
     elif agent_type == "root":
         from myapp.AI import main
-        return main.manager_agent_function(query, file_path)
+        return main.manager_agent_function(query, file_path, routed_agents=routed_agents, context=context)
 
     else:
         return {"error": "Invalid agent_type"}
+
+
+def dispatch_root_agents(agents, query, file_path=None, csv_file=None, context=""):
+    """Call root-level specialists directly, without the manager crew."""
+    from myapp.AI import main
+    return main.dispatch_direct(agents, query, file_path, csv_file, context)
@@ -1,42 +1,114 @@
 # myapp/services/api_key_helpers.py
-from typing import Optional
+import hashlib
+import hmac
+import secrets
+from typing import Optional, Tuple
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import F
 from ..models import APIKey
+from .agent_registry import capability_bit, mask_allows
 
 User = get_user_model()
 
-# Map agent name -> APIKey boolean field name
-AGENT_FLAG_MAP = {
-    "qna": "allow_qna",
-    "data": "allow_data",
-    "talent": "allow_talent",
-    "stock": "allow_stock",
-    "resume": "allow_resume",
-    "sentiment": "allow_sentiment",
-    "auto": "allow_auto",
-    "rag": "allow_rag",
-    # add more if needed
-}
+# ---- Key format & hashing ----
+# Keys look like "sk_<32 hex chars>". The first KEY_PREFIX_LENGTH characters are
+# stored in clear text and used as the lookup key; the rest is only kept hashed.
+KEY_SCHEME = "sk_"
+KEY_PREFIX_LENGTH = 12
+
+API_KEY_CACHE_TTL = getattr(settings, "API_KEY_CACHE_TTL", 60)
+API_KEY_NEGATIVE_CACHE_TTL = getattr(settings, "API_KEY_NEGATIVE_CACHE_TTL", 10)
+
+# Cached "no such active key" entries (None means not cached)
+_NOT_FOUND = False
+# What is cached of a key: never the user row, so no password hash reaches the cache
+_CACHED_FIELDS = ("id", "prefix", "key_hash", "capabilities", "is_active", "user_id")
+
+
+def hash_api_key(key: str) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def generate_api_key() -> Tuple[str, str, str]:
+    """
+    Create a new key. Returns (raw_key, prefix, key_hash); only the last two
+    are persisted.
+    """
+    while True:
+        raw_key = KEY_SCHEME + secrets.token_hex(16)
+        prefix = raw_key[:KEY_PREFIX_LENGTH]
+        if not APIKey.objects.filter(prefix=prefix).exists():
+            return raw_key, prefix, hash_api_key(raw_key)
+
+
+def looks_like_api_key(key: str) -> bool:
+    return bool(key) and key.startswith(KEY_SCHEME) and len(key) > KEY_PREFIX_LENGTH
+
+
+# ---- Cached lookup ----
+# Entries live in Django's default cache, which all workers share (see CACHES
+# in settings), so updating, deactivating or deleting a key takes effect on
+# every worker at once.
+
+def _cache_key(prefix: str) -> str:
+    return f"api_key:{prefix}"
+
+
+def _load_api_key(prefix: str):
+    """The cached fields of the active key with this prefix, or _NOT_FOUND."""
+    cached = cache.get(_cache_key(prefix))
+    if cached is _NOT_FOUND or isinstance(cached, dict):
+        return cached
+
+    fields = APIKey.objects.filter(prefix=prefix, is_active=True).values(*_CACHED_FIELDS).first()
+    if fields is None:
+        cache.set(_cache_key(prefix), _NOT_FOUND, API_KEY_NEGATIVE_CACHE_TTL)
+        return _NOT_FOUND
+
+    cache.set(_cache_key(prefix), fields, API_KEY_CACHE_TTL)
+    return fields
+
 
 def get_api_key_obj_by_key(key: str) -> Optional[APIKey]:
-    if not key:
+    """
+    Resolve a raw key to its active APIKey. Served from the shared cache; the
+    hash comparison is constant-time. `user` is not cached: it is loaded by
+    its primary key when first accessed.
+    """
+    if not looks_like_api_key(key):
         return None
-    return APIKey.objects.filter(key=key, is_active=True).first()
+
+    fields = _load_api_key(key[:KEY_PREFIX_LENGTH])
+    if fields is _NOT_FOUND:
+        return None
+    if not hmac.compare_digest(fields["key_hash"], hash_api_key(key)):
+        return None
+    return APIKey(**fields)
+
+
+def invalidate_api_key_cache(api_key: APIKey) -> None:
+    cache.delete(_cache_key(api_key.prefix))
+
 
 def api_key_allows_agent(api_key_obj: APIKey, agent_name: str) -> bool:
     if not api_key_obj:
         return False
-    flag = AGENT_FLAG_MAP.get(agent_name.lower())
-    if not flag:
-        return False
-    return bool(getattr(api_key_obj, flag, False))
+    return mask_allows(api_key_obj.capabilities, agent_name)
 
 def get_user_api_key_for_agent(user: User, agent_name: str) -> Optional[APIKey]:
     """
     Find an active APIKey belonging to `user` that allows `agent_name`.
     Returns the APIKey object or None.
     """
-    flag = AGENT_FLAG_MAP.get(agent_name.lower())
-    if not flag:
+    bit = capability_bit(agent_name)
+    if bit is None:
         return None
-    return APIKey.objects.filter(user=user, is_active=True, **{flag: True}).order_by('-created_at').first()
+    return (
+        APIKey.objects.filter(user=user, is_active=True)
+        .alias(granted=F("capabilities").bitand(bit))
+        .filter(granted=bit)
+        .order_by('-created_at')
+        .first()
+    )
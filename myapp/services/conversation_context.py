@@ -0,0 +1,192 @@
+# myapp/services/conversation_context.py
+"""
+Conversation history for agent prompts, bounded by a token budget.
+
+The context sent with a request is the conversation's rolling summary
+(`Conversation.summary`) followed by the newest ChatMessage turns that fit in
+CONVERSATION_CONTEXT_TOKEN_BUDGET. Building it never calls an LLM: after each
+reply, `schedule_summary_refresh` folds the turns that have dropped out of the
+recent window into the summary in the background, a batch at a time, so
+prompt size and latency stay flat as conversations grow.
+
+Token counts are word counts, the same estimate used for ChatMessage.tokens_used.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from ..models import ChatMessage, Conversation
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = getattr(settings, "CONVERSATION_CONTEXT_TOKEN_BUDGET", 1500)
+SUMMARY_TOKEN_BUDGET = getattr(settings, "CONVERSATION_SUMMARY_TOKEN_BUDGET", 300)
+MESSAGE_TOKEN_CAP = getattr(settings, "CONVERSATION_MESSAGE_TOKEN_CAP", 400)
+SUMMARY_MODEL = getattr(settings, "CONVERSATION_SUMMARY_MODEL", "gemini/gemini-2.0-flash")
+
+# Upper bounds on rows read per request and per summary refresh
+RECENT_MESSAGE_LIMIT = 40
+SUMMARY_BATCH_SIZE = 50
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-summary")
+_pending = set()
+_pending_lock = Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text.split())
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    words = text.split()
+    if len(words) <= max_tokens:
+        return text
+    return " ".join(words[:max_tokens]) + " …"
+
+
+def _keep_tail(text: str, max_tokens: int) -> str:
+    words = text.split()
+    if len(words) <= max_tokens:
+        return text
+    return "… " + " ".join(words[-max_tokens:])
+
+
+def _format_turn(sender: str, message: str) -> str:
+    role = "User" if sender == "user" else "Assistant"
+    return f"{role}: {_truncate(message or '', MESSAGE_TOKEN_CAP)}"
+
+
+def _unsummarized_messages(conversation: Conversation):
+    messages = ChatMessage.objects.filter(conversation_id=conversation.id)
+    if conversation.summary_until_message_id:
+        messages = messages.filter(id__gt=conversation.summary_until_message_id)
+    return messages
+
+
+def recent_turns(conversation: Conversation, budget: int):
+    """Newest turns not yet in the summary that fit in `budget`, oldest first, as (message id, text)."""
+    rows = (
+        _unsummarized_messages(conversation)
+        .order_by("-id")
+        .values_list("id", "sender", "message")[:RECENT_MESSAGE_LIMIT]
+    )
+    turns, used = [], 0
+    for message_id, sender, message in rows:
+        text = _format_turn(sender, message)
+        cost = estimate_tokens(text)
+        if used + cost > budget:
+            break
+        turns.append((message_id, text))
+        used += cost
+    turns.reverse()
+    return turns
+
+
+def build_conversation_context(conversation: Conversation, budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Summary plus recent turns of `conversation`, within `budget` tokens.
+    Call it before saving the new user message so the query isn't repeated.
+    """
+    if conversation is None:
+        return ""
+
+    summary = _keep_tail(conversation.summary or "", SUMMARY_TOKEN_BUDGET)
+    turns = recent_turns(conversation, budget - estimate_tokens(summary))
+
+    parts = []
+    if summary:
+        parts.append(f"Summary of the earlier conversation:\n{summary}")
+    if turns:
+        parts.append("Recent messages:\n" + "\n".join(text for _, text in turns))
+    return "\n\n".join(parts)
+
+
+# ---- Rolling summary ----
+
+def _extractive_summary(previous: str, turns) -> str:
+    # Used when the LLM is unavailable: the opening sentence of every turn.
+    lines = [previous] if previous else []
+    for turn in turns:
+        first_sentence = turn.split(". ")[0]
+        lines.append(_truncate(first_sentence, 30))
+    return _keep_tail("\n".join(lines), SUMMARY_TOKEN_BUDGET)
+
+
+def summarize_turns(previous: str, turns) -> str:
+    """Fold `turns` into the `previous` summary."""
+    prompt = (
+        f"Update the running summary of a conversation between a user and an AI assistant.\n"
+        f"Keep names, numbers, files, decisions and open questions; drop small talk.\n"
+        f"Answer with the updated summary only, in at most {SUMMARY_TOKEN_BUDGET} words.\n\n"
+        f"Current summary:\n{previous or '(empty)'}\n\n"
+        f"New messages:\n" + "\n".join(turns)
+    )
+    try:
+        from crewai import LLM
+
+        llm = LLM(model=SUMMARY_MODEL, api_key=os.getenv("GEMINI_API_KEY"))
+        summary = str(llm.call(prompt) or "").strip()
+    except Exception:
+        logger.exception("Summary LLM call failed, using an extractive summary")
+        summary = ""
+
+    if not summary:
+        return _extractive_summary(previous, turns)
+    return _keep_tail(summary, SUMMARY_TOKEN_BUDGET)
+
+
+def refresh_conversation_summary(conversation_id: int) -> bool:
+    """
+    Fold the turns that fell out of the recent window into the summary.
+    Returns True if the summary changed.
+    """
+    conversation = (
+        Conversation.objects.filter(id=conversation_id, is_deleted=False)
+        .only("id", "summary", "summary_until_message_id")
+        .first()
+    )
+    if conversation is None:
+        return False
+
+    # Leave room for the summary itself in the next prompt
+    kept = recent_turns(conversation, CONTEXT_TOKEN_BUDGET - SUMMARY_TOKEN_BUDGET)
+    pending = _unsummarized_messages(conversation).order_by("id")
+    if kept:
+        pending = pending.filter(id__lt=kept[0][0])
+    rows = list(pending.values_list("id", "sender", "message")[:SUMMARY_BATCH_SIZE])
+    if not rows:
+        return False
+
+    summary = summarize_turns(conversation.summary, [_format_turn(sender, message) for _, sender, message in rows])
+
+    # Only apply on top of the summary we started from; a concurrent refresh wins otherwise.
+    updated = Conversation.objects.filter(
+        id=conversation_id,
+        summary_until_message_id=conversation.summary_until_message_id,
+    ).update(summary=summary, summary_until_message_id=rows[-1][0])
+    return bool(updated)
+
+
+def schedule_summary_refresh(conversation_id: int) -> None:
+    """Queue a summary refresh once the current transaction has committed."""
+    with _pending_lock:
+        if conversation_id in _pending:
+            return
+        _pending.add(conversation_id)
+    transaction.on_commit(lambda: _executor.submit(_refresh_in_background, conversation_id))
+
+
+def _refresh_in_background(conversation_id: int) -> None:
+    with _pending_lock:
+        _pending.discard(conversation_id)
+    close_old_connections()
+    try:
+        refresh_conversation_summary(conversation_id)
+    except Exception:
+        logger.exception("Summary refresh of conversation %s failed", conversation_id)
+    finally:
+        close_old_connections()
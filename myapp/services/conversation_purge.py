@@ -0,0 +1,117 @@
+# myapp/services/conversation_purge.py
+"""
+Background purge of soft-deleted conversations.
+
+`DeleteConversationAPIView` only flips `Conversation.is_deleted`; the rows
+hanging off the conversation (ChatMessage, TokenLog, RootAgentMemory) are
+removed here in fixed-size chunks with plain DELETE statements, so Django's
+cascade collector never loads them into memory. Attachment files that are no
+longer referenced by any message are removed from storage afterwards.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+
+from ..models import ChatMessage, Conversation, RootAgentMemory, TokenLog
+
+logger = logging.getLogger(__name__)
+
+PURGE_CHUNK_SIZE = getattr(settings, "CONVERSATION_PURGE_CHUNK_SIZE", 500)
+
+# One worker is enough: purges are I/O bound and must not compete with requests.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-purge")
+
+
+def schedule_conversation_purge(conversation_id: int) -> None:
+    """Queue a purge once the soft-delete has been committed."""
+    transaction.on_commit(lambda: _executor.submit(_purge_in_background, conversation_id))
+
+
+def _purge_in_background(conversation_id: int) -> None:
+    close_old_connections()
+    try:
+        purge_conversation(conversation_id)
+    except Exception:
+        # The row stays marked as deleted; `purge_deleted_conversations` retries it.
+        logger.exception("Purge of conversation %s failed", conversation_id)
+    finally:
+        close_old_connections()
+
+
+def _delete_where_in(table: str, column: str, ids) -> int:
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", list(ids))
+        return cursor.rowcount
+
+
+def purge_conversation(conversation_id: int, chunk_size: int = PURGE_CHUNK_SIZE) -> dict:
+    """
+    Delete a soft-deleted conversation and everything attached to it.
+    Returns a small report with the number of rows and files removed.
+    """
+    if not Conversation.objects.filter(id=conversation_id, is_deleted=True).exists():
+        return {"conversation_id": conversation_id, "skipped": True}
+
+    qn = connection.ops.quote_name
+    message_table = qn(ChatMessage._meta.db_table)
+    token_log_table = qn(TokenLog._meta.db_table)
+    memory_table = qn(RootAgentMemory._meta.db_table)
+
+    report = {"conversation_id": conversation_id, "messages": 0, "token_logs": 0, "memories": 0, "files": 0}
+    attachment_names = set()
+
+    # Messages (and their token logs) in chunks
+    while True:
+        chunk = list(
+            ChatMessage.objects.filter(conversation_id=conversation_id)
+            .order_by()
+            .values_list("id", "file")[:chunk_size]
+        )
+        if not chunk:
+            break
+        message_ids = [message_id for message_id, _ in chunk]
+        attachment_names.update(name for _, name in chunk if name)
+        with transaction.atomic():
+            report["token_logs"] += _delete_where_in(token_log_table, qn("message_id"), message_ids)
+            report["messages"] += _delete_where_in(message_table, qn("id"), message_ids)
+
+    # Root agent routing memories in chunks
+    while True:
+        memory_ids = list(
+            RootAgentMemory.objects.filter(conversation_id=conversation_id)
+            .order_by()
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not memory_ids:
+            break
+        report["memories"] += _delete_where_in(memory_table, qn("id"), memory_ids)
+
+    # Nothing references the conversation any more, so this delete cascades to nothing.
+    _delete_where_in(qn(Conversation._meta.db_table), qn("id"), [conversation_id])
+
+    report["files"] = remove_orphaned_attachments(attachment_names)
+    return report
+
+
+def remove_orphaned_attachments(names) -> int:
+    """Remove attachment files that no remaining ChatMessage points at."""
+    names = set(names)
+    if not names:
+        return 0
+
+    still_referenced = set(
+        ChatMessage.objects.filter(file__in=names).values_list("file", flat=True)
+    )
+    removed = 0
+    for name in names - still_referenced:
+        try:
+            if default_storage.exists(name):
+                default_storage.delete(name)
+                removed += 1
+        except OSError:
+            logger.warning("Could not remove attachment %s", name)
+    return removed
@@ -0,0 +1,89 @@
+# myapp/services/rate_limit.py
+"""
+Token-bucket rate limiting per API key and per user, configured per agent
+through settings.AGENT_RATE_LIMITS.
+
+Bucket state lives in the RateLimitBucket table, so every gunicorn worker sees
+the same counts. Each check locks the affected rows (SELECT ... FOR UPDATE)
+inside one transaction; a request is admitted only if all of its buckets have
+a token left, and only then are the tokens taken.
+"""
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from ..models import RateLimitBucket
+
+DEFAULT_LIMIT = {"capacity": 20, "per_minute": 10}
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int          # seconds until the tightest bucket is full again
+    retry_after: int    # seconds until a request would be admitted (0 if allowed)
+
+    def headers(self) -> dict:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+def get_agent_limit(agent_name: str) -> dict:
+    limits = getattr(settings, "AGENT_RATE_LIMITS", {})
+    return limits.get(agent_name) or limits.get("default") or DEFAULT_LIMIT
+
+
+def _refill(bucket: RateLimitBucket, capacity: float, rate: float, now: float) -> None:
+    elapsed = max(0.0, now - bucket.updated_at)
+    bucket.tokens = min(capacity, bucket.tokens + elapsed * rate)
+    bucket.updated_at = now
+
+
+def consume(agent_name: str, user_id: int, api_key_id: Optional[int] = None) -> RateLimitResult:
+    """Take one token from the user's (and API key's) bucket for `agent_name`."""
+    config = get_agent_limit(agent_name)
+    capacity = float(config["capacity"])
+    rate = config["per_minute"] / 60.0  # tokens per second
+
+    keys = [f"user:{user_id}:{agent_name}"]
+    if api_key_id is not None:
+        keys.append(f"key:{api_key_id}:{agent_name}")
+
+    now = time.time()
+    with transaction.atomic():
+        buckets = []
+        for key in sorted(keys):  # fixed lock order avoids deadlocks between workers
+            bucket, _ = RateLimitBucket.objects.select_for_update().get_or_create(
+                key=key, defaults={"tokens": capacity, "updated_at": now}
+            )
+            _refill(bucket, capacity, rate, now)
+            buckets.append(bucket)
+
+        allowed = all(bucket.tokens >= 1 for bucket in buckets)
+        if allowed:
+            for bucket in buckets:
+                bucket.tokens -= 1
+        for bucket in buckets:
+            bucket.save(update_fields=["tokens", "updated_at"])
+
+    tightest = min(bucket.tokens for bucket in buckets)
+    retry_after = 0 if allowed else math.ceil((1 - tightest) / rate)
+    return RateLimitResult(
+        allowed=allowed,
+        limit=int(capacity),
+        remaining=int(tightest),
+        reset=math.ceil((capacity - tightest) / rate),
+        retry_after=retry_after,
+    )
@@ -0,0 +1,199 @@
+# myapp/services/routing_cache.py
+"""
+Semantic routing cache for the root agent.
+
+Past root queries and the specialists the manager routed them to are read
+from RootAgentMemory and embedded with a hashed TF-IDF vectorizer (no model
+download, CPU only). A new query whose nearest neighbour is similar enough
+reuses that route, skipping the manager and planning LLM calls.
+
+Each worker keeps its own index. `manage.py routing_cache rebuild` writes a
+snapshot to ROUTING_INDEX_PATH, and workers reload it when the file changes.
+"""
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from django.conf import settings
+
+from ..models import RootAgentMemory
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_THRESHOLD = getattr(settings, "ROUTING_CACHE_SIMILARITY_THRESHOLD", 0.8)
+MAX_ENTRIES = getattr(settings, "ROUTING_CACHE_MAX_ENTRIES", 5000)
+INDEX_PATH = str(getattr(settings, "ROUTING_INDEX_PATH", "data/routing_index.pkl"))
+RELOAD_CHECK_INTERVAL = 60  # seconds between snapshot mtime checks
+
+# Only routes chosen by the manager are trusted. Routes a client forced and
+# cache hits are never fed back into the index, which all users share.
+TRUSTED_SOURCES = ("manager",)
+
+_URL = re.compile(r"https?://\S+")
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def routing_text(query: str, attachment_type: str = "") -> str:
+    """Text that gets embedded: the normalized query plus the attachment kind."""
+    text = (query or "").lower()
+    text = _URL.sub(" urltoken ", text)
+    text = _EMAIL.sub(" emailtoken ", text)
+    text = _NUMBER.sub(" numtoken ", text)
+    if attachment_type:
+        text += f" attachment{attachment_type.lower()}"
+    return " ".join(text.split())
+
+
+@dataclass
+class RouteMatch:
+    agents: List[str]
+    similarity: float
+    matched_query: str
+
+
+class RoutingIndex:
+    def __init__(self):
+        from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+
+        self.vectorizer = HashingVectorizer(
+            n_features=2 ** 18, ngram_range=(1, 2), alternate_sign=False, norm=None
+        )
+        self.tfidf = TfidfTransformer(sublinear_tf=True)
+        self.matrix = None
+        self.routes: List[List[str]] = []
+        self.texts: List[str] = []
+
+    def __len__(self):
+        return len(self.routes)
+
+    def fit(self, texts: List[str], routes: List[List[str]]) -> "RoutingIndex":
+        self.texts, self.routes = list(texts), [list(r) for r in routes]
+        if not self.texts:
+            self.matrix = None
+            return self
+        counts = self.vectorizer.transform(self.texts)
+        self.matrix = self.tfidf.fit_transform(counts)
+        return self
+
+    def add(self, text: str, route: List[str]) -> None:
+        # New rows reuse the IDF weights of the last fit; a rebuild refreshes them
+        if self.matrix is None:
+            self.fit([text], [route])
+            return
+        from scipy.sparse import vstack
+
+        self.matrix = vstack([self.matrix, self.tfidf.transform(self.vectorizer.transform([text]))]).tocsr()
+        self.texts.append(text)
+        self.routes.append(list(route))
+        if len(self.routes) > MAX_ENTRIES:
+            self.matrix = self.matrix[-MAX_ENTRIES:]
+            self.texts = self.texts[-MAX_ENTRIES:]
+            self.routes = self.routes[-MAX_ENTRIES:]
+
+    def nearest(self, text: str) -> Optional[RouteMatch]:
+        if self.matrix is None or not text:
+            return None
+        vector = self.tfidf.transform(self.vectorizer.transform([text]))
+        scores = (self.matrix @ vector.T).toarray().ravel()
+        best = int(scores.argmax())
+        return RouteMatch(agents=self.routes[best], similarity=float(scores[best]), matched_query=self.texts[best])
+
+
+def build_index_from_memory(limit: int = MAX_ENTRIES) -> RoutingIndex:
+    rows = (
+        RootAgentMemory.objects.filter(route_source__in=TRUSTED_SOURCES)
+        .exclude(user_input="")
+        .order_by("-created_at")
+        .values_list("user_input", "attachment_type", "used_agents")[:limit]
+    )
+    texts, routes = [], []
+    for user_input, attachment_type, used_agents in reversed(list(rows)):
+        if used_agents:
+            texts.append(routing_text(user_input, attachment_type))
+            routes.append(used_agents)
+    return RoutingIndex().fit(texts, routes)
+
+
+def save_index(index: RoutingIndex, path: str = INDEX_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        pickle.dump(index, fh)
+    os.replace(tmp_path, path)
+
+
+# ---- Per-worker state ----
+
+_lock = threading.Lock()
+_index: Optional[RoutingIndex] = None
+_index_mtime = None
+_last_reload_check = 0.0
+_stats = {"lookups": 0, "hits": 0, "misses": 0}
+
+
+def _snapshot_mtime():
+    try:
+        return os.path.getmtime(INDEX_PATH)
+    except OSError:
+        return None
+
+
+def get_index() -> RoutingIndex:
+    global _index, _index_mtime, _last_reload_check
+    with _lock:
+        now = time.monotonic()
+        if _index is not None and now - _last_reload_check < RELOAD_CHECK_INTERVAL:
+            return _index
+        _last_reload_check = now
+
+        mtime = _snapshot_mtime()
+        if mtime is not None and mtime != _index_mtime:
+            with open(INDEX_PATH, "rb") as fh:
+                _index = pickle.load(fh)
+            _index_mtime = mtime
+        elif _index is None:
+            _index = build_index_from_memory()
+        return _index
+
+
+def lookup_route(query: str, attachment_type: str = "") -> Optional[RouteMatch]:
+    """Return a reusable route for `query`, or None if no past query is close enough."""
+    if not getattr(settings, "ROUTING_CACHE_ENABLED", True) or not query:
+        return None
+    try:
+        match = get_index().nearest(routing_text(query, attachment_type))
+    except Exception:
+        logger.exception("Routing cache lookup failed")
+        match = None
+
+    hit = match is not None and match.similarity >= SIMILARITY_THRESHOLD
+    with _lock:
+        _stats["lookups"] += 1
+        _stats["hits" if hit else "misses"] += 1
+    return match if hit else None
+
+
+def remember_route(query: str, attachment_type: str, agents: List[str]) -> None:
+    """Add a freshly routed query to this worker's index."""
+    if not query or not agents:
+        return
+    index = get_index()
+    with _lock:
+        index.add(routing_text(query, attachment_type), agents)
+
+
+def stats() -> dict:
+    with _lock:
+        lookups = _stats["lookups"]
+        return {
+            **_stats,
+            "hit_rate": round(_stats["hits"] / lookups, 3) if lookups else None,
+            "index_size": len(_index) if _index is not None else 0,
+            "threshold": SIMILARITY_THRESHOLD,
+        }
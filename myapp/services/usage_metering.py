@@ -0,0 +1,192 @@
+# myapp/services/usage_metering.py
+"""
+Per-API-key usage metering.
+
+Requests are only counted in a per-worker in-memory buffer; a daemon thread
+flushes the buffer every USAGE_FLUSH_INTERVAL seconds into hourly
+APIKeyUsage rows. The request path itself never writes to the database.
+"""
+import atexit
+import bisect
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, InterfaceError, OperationalError, close_old_connections, transaction
+
+from ..models import APIKeyUsage
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_INTERVAL = getattr(settings, "USAGE_FLUSH_INTERVAL", 15)
+
+# Upper bounds (ms) of the latency histogram buckets; slower requests go to "+Inf"
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+_BUCKET_LABELS = [str(bound) for bound in LATENCY_BUCKETS_MS] + ["+Inf"]
+
+
+def _empty_counters():
+    return {
+        "request_count": 0,
+        "error_count": 0,
+        "total_latency_ms": 0.0,
+        "latency_histogram": defaultdict(int),
+        "bytes_in": 0,
+        "bytes_out": 0,
+        "tokens_used": 0,
+    }
+
+
+_buffer = defaultdict(_empty_counters)
+_buffer_lock = threading.Lock()
+_flusher = None
+_flusher_pid = None
+
+
+def _period_start(now: datetime) -> datetime:
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+def latency_bucket(latency_ms: float) -> str:
+    return _BUCKET_LABELS[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)]
+
+
+def record(api_key_id: int, agent: str, *, latency_ms: float, bytes_in: int = 0,
+           bytes_out: int = 0, tokens_used: int = 0, is_error: bool = False) -> None:
+    """Count one request. Only touches memory."""
+    _ensure_flusher()
+    key = (api_key_id, agent, _period_start(datetime.now(dt_timezone.utc)))
+    with _buffer_lock:
+        counters = _buffer[key]
+        counters["request_count"] += 1
+        counters["error_count"] += int(is_error)
+        counters["total_latency_ms"] += latency_ms
+        counters["latency_histogram"][latency_bucket(latency_ms)] += 1
+        counters["bytes_in"] += bytes_in
+        counters["bytes_out"] += bytes_out
+        counters["tokens_used"] += tokens_used
+
+
+def _ensure_flusher() -> None:
+    # Started lazily so every forked gunicorn worker gets its own thread
+    global _flusher, _flusher_pid
+    if _flusher is not None and _flusher_pid == os.getpid():
+        return
+    with _buffer_lock:
+        if _flusher is not None and _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        _flusher = threading.Thread(target=_flush_forever, name="usage-metering", daemon=True)
+        _flusher.start()
+
+
+def _flush_forever() -> None:
+    stop = threading.Event()
+    while not stop.wait(USAGE_FLUSH_INTERVAL):
+        close_old_connections()
+        try:
+            flush()
+        except Exception:
+            logger.exception("Usage metering flush failed")
+
+
+def flush() -> int:
+    """
+    Write buffered counters to APIKeyUsage. Returns the number of rows touched.
+    Counters that couldn't be written because the database was unreachable go
+    back into the buffer for the next flush; a row the database rejects is
+    logged and dropped, without losing the rows after it.
+    """
+    global _buffer
+    with _buffer_lock:
+        pending, _buffer = _buffer, defaultdict(_empty_counters)
+
+    written = 0
+    for key, counters in pending.items():
+        api_key_id, agent, period_start = key
+        try:
+            _merge_into_row(api_key_id, agent, period_start, counters)
+            written += 1
+        except IntegrityError:
+            # API key deleted since the request was counted
+            logger.info("Dropping usage for missing API key %s", api_key_id)
+        except (OperationalError, InterfaceError) as e:
+            logger.warning("Usage for API key %s kept for the next flush: %s", api_key_id, e)
+            _requeue(key, counters)
+        except DatabaseError:
+            logger.exception("Dropping usage for API key %s, agent %r", api_key_id, agent)
+    return written
+
+
+def _requeue(key, counters) -> None:
+    with _buffer_lock:
+        buffered = _buffer[key]
+        for field, value in counters.items():
+            if field == "latency_histogram":
+                for label, count in value.items():
+                    buffered[field][label] += count
+            else:
+                buffered[field] += value
+
+
+def _merge_into_row(api_key_id, agent, period_start, counters) -> None:
+    with transaction.atomic():
+        row, _ = APIKeyUsage.objects.select_for_update().get_or_create(
+            api_key_id=api_key_id, agent=agent, period_start=period_start
+        )
+        row.request_count += counters["request_count"]
+        row.error_count += counters["error_count"]
+        row.total_latency_ms += counters["total_latency_ms"]
+        row.bytes_in += counters["bytes_in"]
+        row.bytes_out += counters["bytes_out"]
+        row.tokens_used += counters["tokens_used"]
+        histogram = dict(row.latency_histogram)
+        for label, count in counters["latency_histogram"].items():
+            histogram[label] = histogram.get(label, 0) + count
+        row.latency_histogram = histogram
+        row.save()
+
+
+atexit.register(lambda: flush())
+
+
+# ---- Reporting ----
+
+def _histogram_percentile(histogram: dict, fraction: float):
+    total = sum(histogram.values())
+    if not total:
+        return None
+    threshold = total * fraction
+    running = 0
+    for label in _BUCKET_LABELS:
+        running += histogram.get(label, 0)
+        if running >= threshold:
+            return label
+    return "+Inf"
+
+
+def summarize_usage(api_key, days: int = 7) -> dict:
+    """Per-agent totals for `api_key` over the last `days` days."""
+    since = _period_start(datetime.now(dt_timezone.utc)) - timedelta(days=days)
+    per_agent = {}
+    for row in APIKeyUsage.objects.filter(api_key=api_key, period_start__gte=since):
+        agent = per_agent.setdefault(row.agent, {
+            "request_count": 0, "error_count": 0, "total_latency_ms": 0.0,
+            "bytes_in": 0, "bytes_out": 0, "tokens_used": 0, "latency_histogram": {},
+        })
+        for field in ("request_count", "error_count", "total_latency_ms", "bytes_in", "bytes_out", "tokens_used"):
+            agent[field] += getattr(row, field)
+        for label, count in row.latency_histogram.items():
+            agent["latency_histogram"][label] = agent["latency_histogram"].get(label, 0) + count
+
+    for agent in per_agent.values():
+        histogram = agent["latency_histogram"]
+        agent["latency_histogram"] = {label: histogram[label] for label in _BUCKET_LABELS if label in histogram}
+        agent["avg_latency_ms"] = round(agent.pop("total_latency_ms") / agent["request_count"], 1) if agent["request_count"] else None
+        agent["p50_latency_ms_le"] = _histogram_percentile(histogram, 0.50)
+        agent["p95_latency_ms_le"] = _histogram_percentile(histogram, 0.95)
+
+    return {"since": since, "days": days, "agents": per_agent}
@@ -1,3 +1,406 @@
-from django.test import TestCase
+import functools
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import diskcache
+import numpy as np
+import pandas as pd
+from django.db import DataError, IntegrityError, OperationalError
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from myapp.AI.Agents.data_analysis.data_analysis.tools import artifacts, classifier, code_cache, custom_tool, dataset_store, preprocess_tool, workspace
+from myapp.AI.Agents.data_analysis.data_analysis.tools.dataset_store import read_dataset, read_metadata
+from myapp.AI.Agents.data_analysis.data_analysis.tools.downsample import (
+    VIZ_MAX_LINE_POINTS,
+    bin_indices,
+    downsample_figure,
+    lttb_indices,
+    minmax_indices,
+)
+from myapp.AI.Agents.data_analysis.data_analysis.tools.sandbox import _run_analysis, _run_visualization
+from myapp.authentication import APIKeyAuthentication
+from myapp.models import APIKey
+from myapp.AI.plan_cache import _fill_plan, _templatize_plan, input_shape, plan_cache_key, query_template
+from myapp.services import usage_metering
+from myapp.services.agent_registry import url_agent_name
+from myapp.services.api_key_helpers import _cache_key, generate_api_key, get_api_key_obj_by_key
+
+
+class AgentNameTests(SimpleTestCase):
+    def test_unregistered_url_names_share_the_default_name(self):
+        self.assertEqual(url_agent_name("Data"), "data")
+        self.assertEqual(url_agent_name("x" * 200), "default")
+        self.assertEqual(url_agent_name(""), "default")
+
+
+class PlanCacheTests(SimpleTestCase):
+    def key(self, inputs):
+        return plan_cache_key("automation", ["task"], "model", query_template(inputs["query"]), input_shape(inputs))
+
+    def test_queries_differing_only_in_literals_share_a_key(self):
+        first = {"query": "Email the report to alice@x.com for 2023"}
+        second = {"query": "email the report to bob@y.com for 2024"}
+        self.assertEqual(self.key(first), self.key(second))
+
+    def test_cached_plan_is_filled_with_the_current_literals(self):
+        first = {"query": "Email the report to alice@x.com for 2023", "date": "2024-01-01"}
+        second = {"query": "email the report to bob@y.com for 2024", "date": "2024-02-02"}
+        plan = "Step 1: keep rows for 2023. Step 2: send them to Alice@x.com on 2024-01-01."
+
+        stored = _templatize_plan(plan, first)
+        self.assertNotIn("alice", stored.lower())
+        self.assertNotIn("2023", stored)
+
+        replayed = _fill_plan(stored, second)
+        self.assertEqual(replayed, "Step 1: keep rows for 2024. Step 2: send them to bob@y.com on 2024-02-02.")
+
+    def test_literals_are_replaced_whole(self):
+        stored = _templatize_plan("Use region 'North' for the last 5 years, 2025 excluded.",
+                                  {"query": "sales for 'North' over 5 years"})
+        replayed = _fill_plan(stored, {"query": "sales for 'South East' over 10 years"})
+        self.assertEqual(replayed, "Use region 'South East' for the last 10 years, 2025 excluded.")
+
+    def test_attachment_kind_and_context_change_the_key(self):
+        query = "summarize this file"
+        csv = self.key({"query": query, "file": "/tmp/a.csv", "context": "(none)"})
+        self.assertEqual(csv, self.key({"query": query, "file": "/tmp/b.CSV", "context": ""}))
+        self.assertNotEqual(csv, self.key({"query": query, "file": "/tmp/a.pdf", "context": "(none)"}))
+        self.assertNotEqual(csv, self.key({"query": query, "file": "/tmp/a.csv", "context": "earlier turns"}))
+
+
+class ArtifactTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        patcher = mock.patch.object(artifacts, "ARTIFACT_ROOT", root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.result = pd.DataFrame({"team": [f"team{i}" for i in range(45)], "runs": range(45)})
+
+    def save(self, owner):
+        with artifacts.artifacts_owned_by(owner):
+            return artifacts.save_artifact(self.result, "runs per team")["id"]
+
+    def test_owner_pages_through_the_full_result(self):
+        artifact_id = self.save(owner=1)
+        page = artifacts.read_artifact_page(artifact_id, 1, page=3, page_size=20)
+        self.assertEqual((page["total_rows"], page["total_pages"]), (45, 3))
+        self.assertEqual(page["rows"], [[f"team{i}", i] for i in range(40, 45)])
+
+    def test_other_users_and_ownerless_artifacts_are_not_found(self):
+        artifact_id = self.save(owner=1)
+        for owner in (2, None):
+            with self.assertRaises(artifacts.ArtifactNotFound):
+                artifacts.read_artifact_page(artifact_id, owner)
+        ownerless = artifacts.save_artifact(self.result)["id"]
+        with self.assertRaises(artifacts.ArtifactNotFound):
+            artifacts.read_artifact_page(ownerless, 1)
+
+    def test_expired_artifacts_are_not_found_before_the_purge(self):
+        artifact_id = self.save(owner=1)
+        with mock.patch.object(artifacts, "ARTIFACT_TTL", -1):
+            with self.assertRaises(artifacts.ArtifactNotFound):
+                artifacts.read_artifact_page(artifact_id, 1)
+            self.assertEqual(artifacts.purge_artifacts(max_age=-1), 1)
+
+    def test_malformed_ids_are_not_found(self):
+        with self.assertRaises(artifacts.ArtifactNotFound):
+            artifacts.read_artifact_page("../../settings", 1)
+
+
+class ArtifactAPITests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        patcher = mock.patch.object(artifacts, "ARTIFACT_ROOT", root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        User = get_user_model()
+        self.owner = User.objects.create_user(email="owner@example.com", username="owner", password="secret")
+        self.other = User.objects.create_user(email="other@example.com", username="other", password="secret")
+        with artifacts.artifacts_owned_by(self.owner.pk):
+            self.artifact_id = artifacts.save_artifact(pd.DataFrame({"runs": range(30)}))["id"]
+        self.url = reverse("analysis_artifact", args=[self.artifact_id])
+
+    def get(self, user, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(self.url, params)
+
+    def test_owner_gets_a_page(self):
+        response = self.get(self.owner, page=2, page_size=25)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["meta"]["rows"], [[i] for i in range(25, 30)])
+
+    def test_other_users_get_404(self):
+        self.assertEqual(self.get(self.other).status_code, 404)
+
+
+class ClassifierTests(SimpleTestCase):
+    def setUp(self):
+        classifier._classify_with_llm.cache_clear()
+        self.addCleanup(classifier._classify_with_llm.cache_clear)
+
+    def test_keyword_rules(self):
+        self.assertEqual(classifier.classify_by_rules("How many missing values per column?"), "raw")
+        self.assertEqual(classifier.classify_by_rules("Show the original categories of venue"), "raw")
+        self.assertEqual(classifier.classify_by_rules("Average runs per season"), "decoded")
+        self.assertEqual(classifier.classify_by_rules("Correlation between toss and match wins"), "decoded")
+        # Raw wins: imputation in the decoded copy would hide the nulls
+        self.assertEqual(classifier.classify_by_rules("Mean of each column ignoring NaN values"), "raw")
+        self.assertIsNone(classifier.classify_by_rules("Which team won the 2016 final?"))
+        # Whole words only
+        self.assertIsNone(classifier.classify_by_rules("Summary of umpires"))
+
+    def test_llm_is_asked_once_per_query_and_failures_are_not_memoized(self):
+        llm = mock.Mock()
+        llm.call.side_effect = [RuntimeError("quota"), '{"data_type": "raw"}']
+        with mock.patch.object(classifier, "llm", llm):
+            self.assertEqual(classifier.classify_query("Which team won the 2016 final?"), "decoded")
+            self.assertEqual(classifier.classify_query("Which team won the 2016 final?"), "raw")
+            self.assertEqual(classifier.classify_query("Which team won  the 2016 final? "), "raw")
+            self.assertEqual(classifier.classify_query("Total runs by team"), "decoded")
+        self.assertEqual(llm.call.call_count, 2)
+
+
+class CodeCacheTests(SimpleTestCase):
+    schema = {"columns": ["team", "runs"], "dtypes": {"team": "object", "runs": "int32"}}
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        cache = diskcache.Cache(directory, tag_index=True)
+        self.addCleanup(cache.close)
+        patcher = mock.patch.object(code_cache, "_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_cached(self, query, code, succeeds=True, data_path="/data/workspaces/abc/decoded.arrow"):
+        generate = mock.Mock(return_value={"code": code})
+        execute = mock.Mock(return_value={"status": "success" if succeeds else "error"})
+        code_cache.run_with_code_cache("analysis", query, self.schema, data_path, "model", generate, execute)
+        return generate, execute
+
+    def test_key_ignores_case_spacing_and_trailing_punctuation_only(self):
+        key = code_cache.code_cache_key("analysis", "Top 5 teams by runs?", self.schema)
+        self.assertEqual(key, code_cache.code_cache_key("analysis", "  top 5   TEAMS by runs", self.schema))
+        self.assertNotEqual(key, code_cache.code_cache_key("analysis", "top 10 teams by runs", self.schema))
+        self.assertNotEqual(key, code_cache.code_cache_key("visualization", "top 5 teams by runs", self.schema))
+        other_schema = {"columns": ["team", "runs"], "dtypes": {"team": "object", "runs": "float64"}}
+        self.assertNotEqual(key, code_cache.code_cache_key("analysis", "top 5 teams by runs", other_schema))
+
+    def test_successful_code_is_reused_without_generating(self):
+        self.run_cached("Top 5 teams?", "result = df.head(5)")
+        generate, execute = self.run_cached("top 5 teams", "result = None")
+        generate.assert_not_called()
+        self.assertEqual(execute.call_args.args[0]["code"], "result = df.head(5)")
+
+    def test_failed_or_workspace_specific_code_is_not_reused(self):
+        self.run_cached("top 5 teams", "result = df.head(5)", succeeds=False)
+        self.run_cached("top 6 teams", "result = pd.read_csv('/data/workspaces/abc/x.csv')")
+        self.assertEqual(self.run_cached("top 5 teams", "result = 1")[0].call_count, 1)
+        self.assertEqual(self.run_cached("top 6 teams", "result = 1")[0].call_count, 1)
+
+    def test_cached_code_that_fails_is_evicted_and_regenerated(self):
+        self.run_cached("top 5 teams", "result = df.head(5)")
+        generate, _ = self.run_cached("top 5 teams", "result = df.head(5)", succeeds=False)
+        generate.assert_called_once()
+        key = code_cache.code_cache_key("analysis", "top 5 teams", self.schema, "model")
+        self.assertIsNone(code_cache.get_code_cache().get(key))
+
+
+class SandboxFrameTests(SimpleTestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "team1": pd.Categorical(["CSK", "MI", "CSK"]),
+            "team2": pd.Categorical(["MI", "RR", "RR"]),
+            "umpire3": pd.Categorical(["A", None, "A"]),
+        })
+
+    def test_generated_code_gets_text_columns_as_object(self):
+        filled = _run_analysis("result = df['umpire3'].fillna('Unknown')", self.df)
+        self.assertEqual(filled.tolist(), ["A", "Unknown", "A"])
+        matches = _run_analysis("result = df['team1'] + ' vs ' + df['team2']", self.df)
+        self.assertEqual(matches.tolist(), ["CSK vs MI", "MI vs RR", "CSK vs RR"])
+
+    def test_unmodified_frame_is_not_returned_as_the_result(self):
+        self.assertEqual(_run_analysis("x = len(df)\ny = 1", self.df), "Code executed successfully - no output variable found")
+        self.assertIsInstance(self.df["team1"].dtype, pd.CategoricalDtype)
+
+    def test_chart_without_filtered_data_sends_no_table_back(self):
+        _, filtered_data = _run_visualization("fig = None", self.df)
+        self.assertIsNone(filtered_data)
+        _, filtered_data = _run_visualization("filtered_data = df['team1'].value_counts()\nfig = None", self.df)
+        self.assertEqual(filtered_data.to_dict(), {"CSK": 2, "MI": 1})
+
+
+class ChunkedPreprocessingTests(SimpleTestCase):
+    """Uploads above the chunked threshold must end up exactly like the ones loaded at once."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        rows = 500
+        rng = np.random.default_rng(0)
+        frame = pd.DataFrame({
+            "id": np.arange(rows),
+            "runs": [None if i % 97 == 0 else i for i in range(rows)],
+            "rate": np.round(rng.normal(size=rows), 3),
+            "half": np.arange(rows) / 2,
+            # Some teams only appear in later chunks
+            "team": [f"team{i % 7}" if i < 250 else f"team{i % 11}" for i in range(rows)],
+            "player": [f"player{i}" for i in range(rows)],
+            "umpire": [None if i % 5 else "Dar" for i in range(rows)],
+            "date": [f"2021-{1 + i % 12:02d}-{1 + i % 28:02d}" for i in range(rows)],
+            "won": [i % 2 == 0 for i in range(rows)],
+        })
+        self.csv = os.path.join(self.root, "upload.csv")
+        frame.to_csv(self.csv, index=False)
+
+    def load(self, name, threshold):
+        path = os.path.join(self.root, "workspaces", name * 24)
+        os.makedirs(path)
+        dataset_store.dataframe_cache.clear()
+        with mock.patch.object(workspace, "WORKSPACE_ROOT", os.path.join(self.root, "workspaces")), \
+                mock.patch.object(custom_tool, "CHUNKED_THRESHOLD_BYTES", threshold), \
+                mock.patch.object(preprocess_tool, "CHUNKED_THRESHOLD_BYTES", threshold), \
+                mock.patch.object(custom_tool, "csv_to_dataset", functools.partial(dataset_store.csv_to_dataset, chunk_rows=64)), \
+                mock.patch.object(preprocess_tool, "iter_chunks", functools.partial(dataset_store.iter_chunks, chunk_rows=64)):
+            custom_tool.load_user_data.func(self.csv, path)
+            preprocess_tool.preprocess_and_save_data.func(path)
+        return path
+
+    def test_chunked_path_writes_the_same_data_and_dtypes(self):
+        in_memory = self.load("a", threshold=1 << 60)
+        chunked = self.load("b", threshold=0)
+        for name in (workspace.RAW_DATA, workspace.PREPROCESSED_DATA, workspace.DECODED_DATA):
+            expected = read_dataset(os.path.join(in_memory, name))
+            actual = read_dataset(os.path.join(chunked, name))
+            pd.testing.assert_frame_equal(actual, expected, obj=name)
+
+        expected = read_metadata(os.path.join(in_memory, workspace.RAW_DATA))
+        actual = read_metadata(os.path.join(chunked, workspace.RAW_DATA))
+        self.assertEqual(actual["original_dtypes"], expected["original_dtypes"])
+        self.assertEqual(actual["dtype_optimization"]["columns"], expected["dtype_optimization"]["columns"])
+        self.assertEqual(expected["dtype_optimization"]["columns"]["team"]["to"], "category")
+        self.assertNotIn("player", expected["dtype_optimization"]["columns"])
+
+
+class UsageFlushTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(usage_metering, "_ensure_flusher")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        usage_metering._buffer.clear()
+        self.addCleanup(lambda: usage_metering._buffer.clear())
+
+    def buffered(self):
+        return {key[:2]: dict(counters) for key, counters in usage_metering._buffer.items()}
+
+    def test_failing_rows_dont_lose_the_others(self):
+        for api_key_id in (1, 2, 3, 4):
+            usage_metering.record(api_key_id, "data", latency_ms=120, bytes_in=10)
+        errors = {1: DataError("value too long"), 2: OperationalError("connection lost"), 3: IntegrityError("no key")}
+        written = []
+
+        def merge(api_key_id, agent, period_start, counters):
+            if api_key_id in errors:
+                raise errors[api_key_id]
+            written.append(api_key_id)
+
+        with mock.patch.object(usage_metering, "_merge_into_row", side_effect=merge), \
+                self.assertLogs(usage_metering.logger, level="INFO"):
+            self.assertEqual(usage_metering.flush(), 1)
+        self.assertEqual(written, [4])
+        # Only the counters the database couldn't be reached for wait for the next flush
+        self.assertEqual(list(self.buffered()), [(2, "data")])
+
+        usage_metering.record(2, "data", latency_ms=300)
+        counters = self.buffered()[(2, "data")]
+        self.assertEqual(counters["request_count"], 2)
+        self.assertEqual(counters["bytes_in"], 10)
+        self.assertEqual(dict(counters["latency_histogram"]), {"250": 1, "500": 1})
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class APIKeyCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(email="a@example.com", username="a", password="secret")
+        self.raw_key, prefix, key_hash = generate_api_key()
+        self.api_key = APIKey.objects.create(user=self.user, prefix=prefix, key_hash=key_hash, capabilities=2)
+
+    def test_cache_holds_only_the_key_fields(self):
+        self.assertEqual(get_api_key_obj_by_key(self.raw_key).pk, self.api_key.pk)
+        cached = cache.get(_cache_key(self.api_key.prefix))
+        self.assertEqual(set(cached), {"id", "prefix", "key_hash", "capabilities", "is_active", "user_id"})
+        self.assertNotIn(self.user.password, str(cached))
+
+    def test_cached_key_authenticates_its_user(self):
+        get_api_key_obj_by_key(self.raw_key)
+        request = mock.Mock(headers={"Authorization": f"Bearer {self.raw_key}"})
+        with self.assertNumQueries(1):
+            user, _ = APIKeyAuthentication().authenticate(request)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(request.api_key.capabilities, 2)
+        self.assertIsNone(get_api_key_obj_by_key(self.raw_key[:-1] + "0"))
+
+
+class DownsampleTests(SimpleTestCase):
+    def setUp(self):
+        self.x = np.arange(10_000, dtype=float)
+        self.y = np.sin(self.x / 500)
+        # One spike that a plain stride would skip
+        self.y[4321] = 50.0
+
+    def test_lttb_keeps_the_ends_and_peaks_in_order(self):
+        idx = lttb_indices(self.x, self.y, 200)
+        self.assertEqual(len(idx), 200)
+        self.assertEqual((idx[0], idx[-1]), (0, 9999))
+        self.assertTrue(np.all(np.diff(idx) > 0))
+        self.assertIn(4321, idx)
+
+    def test_minmax_keeps_each_buckets_extremes(self):
+        idx = minmax_indices(self.y, 200)
+        self.assertLessEqual(len(idx), 200)
+        self.assertEqual((idx[0], idx[-1]), (0, 9999))
+        self.assertTrue(np.all(np.diff(idx) > 0))
+        self.assertIn(4321, idx)
+        self.assertIn(int(np.argmin(self.y)), idx)
+
+    def test_binning_keeps_one_point_per_occupied_cell(self):
+        rng = np.random.default_rng(0)
+        x, y = rng.normal(size=50_000), rng.normal(size=50_000)
+        x[123], y[123] = 40.0, 40.0
+        x[456] = np.nan
+        idx = bin_indices(x, y, 400)
+        self.assertLessEqual(len(idx), 400)
+        self.assertTrue(np.all(np.diff(idx) > 0))
+        self.assertIn(123, idx)
+        self.assertNotIn(456, idx)
+
+    def test_budgets_at_or_above_the_size_keep_everything(self):
+        for idx in (lttb_indices(self.x[:50], self.y[:50], 50), minmax_indices(self.y[:50], 80),
+                    bin_indices(self.x[:50], self.y[:50], 0)):
+            self.assertEqual(idx.tolist(), list(range(50)))
+
+    def test_datetimes_with_gaps(self):
+        x = pd.date_range("2024-01-01", periods=5000, freq="min").to_numpy()
+        x[10] = np.datetime64("NaT")
+        idx = lttb_indices(x, np.cos(np.arange(5000) / 100), 100)
+        self.assertEqual(len(idx), 100)
+
+    def test_plotly_line_keeps_per_point_attributes_aligned(self):
+        import plotly.graph_objects as go
+
+        fig = go.Figure(go.Scatter(x=self.x, y=self.y, mode="lines", customdata=self.x * 2))
+        trace = downsample_figure(fig).data[0]
+        self.assertEqual(trace.type, "scattergl")
+        self.assertEqual(len(trace.y), VIZ_MAX_LINE_POINTS)
+        np.testing.assert_array_equal(np.asarray(trace.customdata), np.asarray(trace.x) * 2)
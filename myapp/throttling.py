@@ -0,0 +1,41 @@
+from rest_framework.throttling import BaseThrottle
+from .services.agent_registry import url_agent_name
+from .services.rate_limit import consume
+
+
+class AgentRateThrottle(BaseThrottle):
+    """
+    Per-agent token bucket for the user and, when present, the API key.
+    Runs in APIView.initial(), i.e. before any upload is written or crew started.
+    """
+
+    def allow_request(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return True
+
+        agent_name = view.kwargs.get("agent_name")
+        if agent_name is not None:
+            agent_name = url_agent_name(agent_name)
+        else:
+            agent_name = getattr(view, "rate_limit_agent", "default")
+        api_key = getattr(request, "api_key", None)
+        self.result = consume(agent_name, request.user.id, api_key.id if api_key else None)
+        request.rate_limit = self.result
+        return self.result.allowed
+
+    def wait(self):
+        return self.result.retry_after
+
+
+class RateLimitHeadersMixin:
+    """Adds RateLimit-* headers computed by AgentRateThrottle to every response."""
+
+    throttle_classes = [AgentRateThrottle]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        result = getattr(request, "rate_limit", None)
+        if result is not None:
+            for header, value in result.headers().items():
+                response[header] = value
+        return response
@@ -32,6 +32,9 @@ urlpatterns = [
 
     path('api/conversation/<int:conversation_id>/delete/', DeleteConversationAPIView.as_view(), name='delete_conversation'),
 
+    # Page through the full table of a large analysis result
+    path('api/analysis-artifacts/<str:artifact_id>/', AnalysisArtifactAPIView.as_view(), name='analysis_artifact'),
+
 
 
     # Start a new chat with an agent
@@ -0,0 +1,49 @@
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Small thread-safe in-process cache with a per-entry time-to-live.
+    Each gunicorn worker holds its own copy, so TTLs should stay short.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                self._evict()
+            self._data[key] = (expires_at, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self):
+        # Drop expired entries first, then the oldest insertions
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._data.items() if expires_at < now]:
+            del self._data[key]
+        while len(self._data) >= self.maxsize:
+            del self._data[next(iter(self._data))]
@@ -1,5 +1,6 @@
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.decorators import action
 from rest_framework.generics import ListAPIView
 from rest_framework.generics import RetrieveAPIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -8,16 +9,33 @@ from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework import generics, status
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.http import Http404
+from django.utils import timezone
 # from rest_framework.authentication import BasicAuthentication
 from rest_framework.exceptions import PermissionDenied
 from .models import *
 from .serializers import *
-from .services.ai_gateway import call_ai_agent
+from .services.ai_gateway import call_ai_agent, dispatch_root_agents
 from .services.code_snippet_generator import generate_code_snippet
-from .authentication import APIKeyAuthentication
+from .authentication import APIKeyAuthentication, CachedJWTAuthentication, mark_session_revoked
+from .throttling import RateLimitHeadersMixin
+from .metering import UsageMeteringMixin
+from .services.conversation_purge import schedule_conversation_purge
+from .services.api_key_helpers import api_key_allows_agent, invalidate_api_key_cache
+from .services.usage_metering import summarize_usage
+from .services.routing_cache import lookup_route, remember_route
+from .services.agent_registry import ROOT_AGENT_NAMES
+from .services.conversation_context import build_conversation_context, schedule_summary_refresh
+from .AI.Agents.data_analysis.data_analysis.tools.artifacts import (
+    ARTIFACT_PAGE_SIZE,
+    ArtifactNotFound,
+    artifacts_owned_by,
+    read_artifact_page,
+)
 
 
 import os
@@ -25,9 +43,36 @@ import os
 User = get_user_model()
 
 # ==================== Root Agent View ====================
-class RootAgentAPIView(APIView):
+def requested_root_agents(data):
+    """
+    Specialists named in the optional `agent` field of a root request.
+    Accepts a single name, a comma-separated string or a list (JSON or repeated
+    form fields). Raises ValueError for names the root agent cannot route to.
+    """
+    if hasattr(data, "getlist"):
+        values = data.getlist("agent")
+    else:
+        values = data.get("agent") or []
+        if isinstance(values, str):
+            values = [values]
+
+    agents = []
+    for value in values:
+        for name in str(value).split(","):
+            name = name.strip().lower()
+            if not name:
+                continue
+            if name not in ROOT_AGENT_NAMES:
+                raise ValueError(f"Unknown agent: {name}. Choose from {', '.join(ROOT_AGENT_NAMES)}.")
+            if name not in agents:
+                agents.append(name)
+    return agents
+
+
+class RootAgentAPIView(RateLimitHeadersMixin, APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
+    rate_limit_agent = "root"
 
     def post(self, request):
         query = request.data.get("query") or request.data.get("message")  # support both keys
@@ -38,6 +83,12 @@ class RootAgentAPIView(APIView):
         if not query and not file:
             return Response({"error": "query or file is required"}, status=400)
 
+        # Optional explicit route: skips the manager crew entirely
+        try:
+            direct_agents = requested_root_agents(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
         # Handle temp file saving
         file_path = None
         if file:
@@ -47,71 +98,116 @@ class RootAgentAPIView(APIView):
                 for chunk in file.chunks():
                     dest.write(chunk)
 
-        # Get root agent
-        root_agent, _ = Agent.objects.get_or_create(
-            name="root",
-            defaults={"description": "Root Orchestrator Agent"}
-        )
-
-        # Normalize conversation_id: convert to int if possible, otherwise None
         try:
-            conversation_id = int(conversation_id)
-        except (TypeError, ValueError):
-            conversation_id = None
+            # Get root agent
+            root_agent, _ = Agent.objects.get_or_create(
+                name="root",
+                defaults={"description": "Root Orchestrator Agent"}
+            )
 
-        # Get or create conversation
-        if conversation_id:
-            conversation = get_object_or_404(Conversation, id=conversation_id, user=user)
-            if conversation.agent != root_agent:
-                return Response({"error": "Conversation agent mismatch"}, status=403)
-        else:
-            conversation = Conversation.objects.create(
-                user=user,
+            # Normalize conversation_id: convert to int if possible, otherwise None
+            try:
+                conversation_id = int(conversation_id)
+            except (TypeError, ValueError):
+                conversation_id = None
+
+            # Get or create conversation
+            if conversation_id:
+                conversation = get_object_or_404(Conversation, id=conversation_id, user=user, is_deleted=False)
+                if conversation.agent != root_agent:
+                    return Response({"error": "Conversation agent mismatch"}, status=403)
+            else:
+                conversation = Conversation.objects.create(
+                    user=user,
+                    agent=root_agent,
+                    title=f"Chat with {root_agent.name}"
+                )
+
+            # History for the agents, built before this message is stored
+            context = build_conversation_context(conversation)
+
+            # Save user message
+            user_message_text = query if query else "[File uploaded]"
+            user_tokens = len(user_message_text.split()) if query else 0
+
+            ChatMessage.objects.create(
+                conversation=conversation,
                 agent=root_agent,
-                title=f"Chat with {root_agent.name}"
+                sender="user",
+                message=user_message_text,
+                tokens_used=user_tokens,
+                file=file if file else None
             )
 
-        # Save user message
-        user_message_text = query if query else "[File uploaded]"
-        user_tokens = len(user_message_text.split()) if query else 0
-
-        ChatMessage.objects.create(
-            conversation=conversation,
-            agent=root_agent,
-            sender="user",
-            message=user_message_text,
-            tokens_used=user_tokens,
-            file=file if file else None
-        )
-
-        # Call AI agent
-        result = call_ai_agent("root", query, file_path)
-
-        # Normalize AI reply text
-        if isinstance(result, dict):
-            ai_reply_text = result.get('text') or result.get('answer') or str(result)
-        else:
-            ai_reply_text = str(result)
-
-        # Save AI reply
-        agent_tokens = len(ai_reply_text.split())
-        ChatMessage.objects.create(
-            conversation=conversation,
-            agent=root_agent,
-            sender="agent",
-            message=ai_reply_text,
-            tokens_used=agent_tokens
-        )
+            # Route: the agents the client asked for, else the route of a similar past
+            # query, else ask the manager crew
+            attachment_type = os.path.splitext(file.name)[1].lstrip(".").lower() if file else ""
+            route_source = "manager"
+            used_agents = []
+            result = None
+
+            # Result artifacts the agents save belong to this user
+            with artifacts_owned_by(user.pk):
+                # Client-picked routes are never remembered: the index is shared by all users
+                if direct_agents:
+                    try:
+                        result = dispatch_root_agents(direct_agents, query, file_path, context=context)
+                        route_source = "direct"
+                        used_agents = direct_agents
+                    except Exception as e:
+                        print(f"Requested agents {direct_agents} failed, falling back to manager: {e}")
+                    cached_route = None
+                else:
+                    cached_route = lookup_route(query, attachment_type)
+
+                if cached_route:
+                    try:
+                        result = dispatch_root_agents(cached_route.agents, query, file_path, context=context)
+                        route_source = "cache"
+                        used_agents = cached_route.agents
+                    except Exception as e:
+                        print(f"Cached route {cached_route.agents} failed, falling back to manager: {e}")
+
+                if result is None:
+                    result = call_ai_agent("root", query, file_path, routed_agents=used_agents, context=context)
+                    remember_route(query, attachment_type, used_agents)
+
+            # Normalize AI reply text
+            if isinstance(result, dict):
+                ai_reply_text = result.get('text') or result.get('answer') or str(result)
+            else:
+                ai_reply_text = str(result)
+
+            # Save AI reply
+            agent_tokens = len(ai_reply_text.split())
+            ChatMessage.objects.create(
+                conversation=conversation,
+                agent=root_agent,
+                sender="agent",
+                message=ai_reply_text,
+                tokens_used=agent_tokens
+            )
 
-        # Clean up temp file
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
+            RootAgentMemory.objects.create(
+                user=user,
+                conversation=conversation,
+                user_input=query or "",
+                routed_response=ai_reply_text,
+                used_agents=used_agents,
+                route_source=route_source,
+                attachment_type=attachment_type,
+            )
+            schedule_summary_refresh(conversation.id)
 
-        return Response({
-            "conversation_id": conversation.id,
-            "user_message": user_message_text,
-            "ai_reply": ai_reply_text
-        }, status=200)
+            return Response({
+                "conversation_id": conversation.id,
+                "user_message": user_message_text,
+                "ai_reply": ai_reply_text
+            }, status=200)
+        finally:
+            # Clean up temp file
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
 
 
 
@@ -127,11 +223,16 @@ def save_uploaded_file(uploaded_file, folder="temp"):
     return None
 
 
-class AgentAPIView(APIView):
+class AgentAPIView(RateLimitHeadersMixin, UsageMeteringMixin, APIView):
+    # Integrations call this endpoint with an API key; the frontend uses its JWT
+    authentication_classes = [APIKeyAuthentication, CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
 
     def post(self, request, agent_name):
+        if getattr(request, "api_key", None):
+            check_agent_permission(request.api_key, agent_name)
+
         query = request.data.get("query")
         file = request.FILES.get("file")
         csv = request.FILES.get("csv")
@@ -148,6 +249,13 @@ class AgentAPIView(APIView):
         file_path = save_uploaded_file(file)
         csv_file_path = save_uploaded_file(csv)
 
+        # QnA can follow up on one of the user's conversations
+        context = ""
+        conversation_id = request.data.get("conversation_id")
+        if agent_name == "qna" and str(conversation_id or "").isdigit():
+            conversation = get_object_or_404(Conversation, id=conversation_id, user=user, is_deleted=False)
+            context = build_conversation_context(conversation)
+
 
         # # If using API Key
         # auth_header = request.headers.get("Authorization", "")
@@ -163,7 +271,10 @@ class AgentAPIView(APIView):
         #         return Response({"error": "This API key does not allow access to this agent."}, status=403)
 
 
-        result = call_ai_agent(agent_name, query, file_path, csv_file=csv_file_path)
+        # Result artifacts the agents save belong to this user
+        with artifacts_owned_by(user.pk):
+            result = call_ai_agent(agent_name, query, file_path, csv_file=csv_file_path, context=context)
+        request.tokens_used = len(str(result).split())
 
         # Clean up files after processing
         if file_path and os.path.exists(file_path):
@@ -201,7 +312,7 @@ class ConversationViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Conversation.objects.filter(user=self.request.user)
+        return Conversation.objects.filter(user=self.request.user, is_deleted=False)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -213,7 +324,7 @@ class ChatMessageViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return ChatMessage.objects.filter(conversation__user=self.request.user)
+        return ChatMessage.objects.filter(conversation__user=self.request.user, conversation__is_deleted=False)
 
     def perform_create(self, serializer):
         serializer.save()
@@ -267,12 +378,24 @@ class APIKeyViewSet(ModelViewSet):
         serializer.save(user=self.request.user)
 
     def perform_update(self, serializer):
-        serializer.save(user=self.request.user)
+        instance = serializer.save(user=self.request.user)
+        invalidate_api_key_cache(instance)
 
     def perform_destroy(self, instance):
         if instance.user == self.request.user:
+            invalidate_api_key_cache(instance)
             instance.delete()
 
+    @action(detail=True, methods=["get"])
+    def usage(self, request, pk=None):
+        """Per-agent usage of this key, aggregated over the last `days` days (default 7)."""
+        api_key = self.get_object()
+        try:
+            days = max(1, min(int(request.query_params.get("days", 7)), 90))
+        except ValueError:
+            return Response({"error": "days must be an integer"}, status=400)
+        return Response(summarize_usage(api_key, days=days), status=200)
+
 
 
 
@@ -344,6 +467,9 @@ class LogoutView(APIView):
             refresh_token = request.data["refresh"]
             token = RefreshToken(refresh_token)
             token.blacklist()
+
+            # Access tokens minted from this refresh token stop working too; the user's other sessions are untouched
+            mark_session_revoked(str(token[jwt_settings.JTI_CLAIM]))
             return Response({"message": "Logout successful."}, status=205)
         except Exception as e:
             return Response({"error": str(e)}, status=400)
@@ -402,7 +528,7 @@ class SaveChatAPIView(APIView):
 
         # Get or create conversation with root agent
         if conversation_id:
-            conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
+            conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user, is_deleted=False)
             if conversation.agent != root_agent:
                 return Response({"error": "Conversation agent mismatch"}, status=403)
         else:
@@ -436,7 +562,7 @@ class ConversationHistoryAPIView(APIView):
 
     def get(self, request):
         root_agent = get_object_or_404(Agent, name="root")
-        conversations = Conversation.objects.filter(user=request.user, agent=root_agent).order_by("-created_at")
+        conversations = Conversation.objects.filter(user=request.user, agent=root_agent, is_deleted=False).order_by("-created_at")
         data = []
 
         for convo in conversations:
@@ -456,7 +582,7 @@ class ConversationMessagesAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, conversation_id):
-        conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
+        conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user, is_deleted=False)
         if conversation.agent.name != "root":
             return Response({"error": "This conversation is not with the root agent."}, status=403)
 
@@ -472,6 +598,28 @@ class ConversationMessagesAPIView(APIView):
 
 
 
+class AnalysisArtifactAPIView(APIView):
+    """
+    Page through the full table of a large analysis result.
+    GET /api/analysis-artifacts/<artifact_id>/?page=1&page_size=100
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, artifact_id):
+        try:
+            page = int(request.query_params.get("page", 1))
+            page_size = int(request.query_params.get("page_size", ARTIFACT_PAGE_SIZE))
+        except (TypeError, ValueError):
+            return Response({"error": "page and page_size must be integers"}, status=400)
+
+        try:
+            data = read_artifact_page(artifact_id, request.user.pk, page=page, page_size=page_size)
+        except ArtifactNotFound:
+            raise Http404("No analysis artifact matches the given id.")
+        return Response(data, status=200)
+
+
+
 # ----------------------------------------------------------------
 
 
@@ -504,25 +652,19 @@ class DeleteConversationAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, conversation_id):
-        # Fetch the conversation that belongs to the user
-        conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-        conversation.delete()
+        # Mark the user's conversation as deleted; rows and attachments are purged in the background
+        updated = Conversation.objects.filter(
+            id=conversation_id, user=request.user, is_deleted=False
+        ).update(is_deleted=True, deleted_at=timezone.now())
+        if not updated:
+            raise Http404("No Conversation matches the given query.")
+
+        schedule_conversation_purge(conversation_id)
         return Response({"message": "Conversation deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
 
 
 
 
 def check_agent_permission(api_key, agent_name):
-    mapping = {
-        "qna": api_key.allow_qna,
-        "data": api_key.allow_data,
-        "talent": api_key.allow_talent,
-        "stock": api_key.allow_stock,
-        "resume": api_key.allow_resume,
-        "sentiment": api_key.allow_sentiment,
-        "auto": api_key.allow_auto,
-        "rag": api_key.allow_rag,
-    }
-
-    if agent_name not in mapping or not mapping[agent_name]:
+    if not api_key_allows_agent(api_key, agent_name):
         raise PermissionDenied(f"Your API key is not authorized to access the {agent_name} agent.")
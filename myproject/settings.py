@@ -55,7 +55,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'myapp.authentication.CachedJWTAuthentication',
     ),
 
     'DEFAULT_RENDERER_CLASSES': (
@@ -65,6 +65,54 @@ REST_FRAMEWORK = {
 }
 
 
+# Token-bucket rate limits per agent, applied separately per API key and per user.
+# `capacity` is the burst size, `per_minute` the refill rate. Unlisted agents use "default".
+AGENT_RATE_LIMITS = {
+    "default": {"capacity": 20, "per_minute": 10},
+    "root": {"capacity": 10, "per_minute": 5},
+    "stock": {"capacity": 5, "per_minute": 2},   # Gemini + yfinance + Alpha Vantage quotas
+    "data": {"capacity": 5, "per_minute": 2},
+    "auto": {"capacity": 5, "per_minute": 2},
+}
+
+
+# Cache shared by all workers; API key lookups live here (services/api_key_helpers.py),
+# so a revoked key stops working everywhere at once. The file-based default covers one
+# host; set REDIS_URL when the web workers run on several.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / "data" / "django_cache",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+
+# Semantic routing cache for the root agent (services/routing_cache.py).
+# Queries at least this similar (cosine, hashed TF-IDF) to a past routed query reuse its route.
+ROUTING_CACHE_ENABLED = True
+ROUTING_CACHE_SIMILARITY_THRESHOLD = 0.8
+ROUTING_CACHE_MAX_ENTRIES = 5000
+ROUTING_INDEX_PATH = BASE_DIR / 'data' / 'routing_index.pkl'
+
+# Conversation history sent to the agents (services/conversation_context.py).
+# Budgets are in words, the same estimate ChatMessage.tokens_used uses. Turns
+# that no longer fit are folded into Conversation.summary in the background.
+CONVERSATION_CONTEXT_TOKEN_BUDGET = 1500
+CONVERSATION_SUMMARY_TOKEN_BUDGET = 300
+CONVERSATION_MESSAGE_TOKEN_CAP = 400
+CONVERSATION_SUMMARY_MODEL = "gemini/gemini-2.0-flash"
+
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),